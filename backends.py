@@ -0,0 +1,523 @@
+#!/usr/bin/python
+"""
+Fetch backends for Wallabot.
+
+A fetch backend turns a search into Offer records (the same fields the
+email template consumes) and enriches them with seller information. The
+Selenium backend (in wallabot.py) drives a real browser; the HTTP backend in
+this module reads the JSON endpoints the Wallapop web app itself uses, over a
+small pool of keep-alive connections, and needs no browser at all.
+
+The HTTP backend talks to HTTP_API_BASE_URL, so it can be pointed at a local
+stand-in server serving recorded JSON fixtures (see test_http_backend.py).
+"""
+import datetime
+import http.client
+import json
+import logging
+import queue
+import threading
+from urllib.parse import urlsplit, parse_qsl, urlencode, quote
+
+import fetch_engine
+from offer import Offer, SELLER_INFO_DEFAULTS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36',
+    'Accept': 'application/json, text/plain, */*',
+    'Accept-Language': 'es-ES,es;q=0.9',
+    'X-DeviceOS': '0',
+}
+
+# Search URL parameters that only matter to the web app
+IGNORED_SEARCH_PARAMS = {'filters_source'}
+
+
+def empty_item():
+    """Return an Offer with default values for every field.
+
+    Seller info, location and shipping are filled in after the detail lookup.
+    """
+    return Offer()
+
+
+def empty_seller_info():
+    """Return a seller info dictionary with default values for every field."""
+    # found: fields actually present on the page or in the API response
+    return dict(SELLER_INFO_DEFAULTS, found=set())
+
+
+class FetchBackend:
+    """Interface of a fetch backend."""
+
+    name = 'base'
+
+    def search(self, search, limit):
+        """Fetch the cards of a search.
+
+        Args:
+            search: Search dictionary with at least 'name' and 'url'
+            limit: Maximum number of items to return (None for the whole first page)
+
+        Returns:
+            Tuple of (number of cards found, list of Offers)
+        """
+        raise NotImplementedError
+
+    def more_results(self, search):
+        """Fetch the next page of the search last loaded by search().
+
+        Returns:
+            List of Offers of the next page (empty when there is none)
+        """
+        return []
+
+    def get_details(self, item):
+        """Fetch the seller info of one item.
+
+        The detail filters are applied by the caller, once the seller info
+        was merged into the Offer and its numbers parsed.
+
+        Args:
+            item: Offer returned by search()
+
+        Returns:
+            Seller info dictionary (see empty_seller_info), or None if the
+            item could not be checked
+        """
+        raise NotImplementedError
+
+    def enrich(self, items):
+        """Fetch the seller info of several items.
+
+        Returns:
+            List of seller info dictionaries in the same order as items
+        """
+        return [self.get_details(item) for item in items]
+
+    def iter_details(self, items):
+        """Fetch the seller info of several items, yielding each as it is ready.
+
+        Yields:
+            Tuples of (index of the item in items, seller info dictionary or None),
+            not necessarily in order
+        """
+        yield from enumerate(self.enrich(items))
+
+    def is_healthy(self):
+        """Whether the backend can keep being used."""
+        return True
+
+    def close(self):
+        """Release the resources held by the backend."""
+
+
+class ConnectionPool:
+    """Thread-safe pool of keep-alive HTTP(S) connections to one host.
+
+    Args:
+        base_url: Scheme, host and optional path prefix (e.g. https://api.wallapop.com)
+        timeout: Socket timeout in seconds
+    """
+
+    def __init__(self, base_url, timeout=10):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+
+    def _take(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self.connections += 1
+            cls = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+            return cls(self.host, self.port, timeout=self.timeout)
+
+    def get_json(self, path, params=None):
+        """GET a path and decode its JSON body.
+
+        A connection closed by the server while idle is retried once on a fresh one.
+
+        Args:
+            path: Path relative to the base URL
+            params: Optional dictionary of query parameters
+
+        Returns:
+            Decoded JSON document
+
+        Raises:
+            IOError: On network errors or non-200 responses
+        """
+        url = self.prefix + path + (f"?{urlencode(params)}" if params else "")
+        for attempt in range(2):
+            conn = self._take()
+            try:
+                conn.request('GET', url, headers=DEFAULT_HEADERS)
+                response = conn.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                if attempt:
+                    raise IOError(f"GET {url} failed: {e}")
+                continue
+            with self._lock:
+                self.requests += 1
+            if response.will_close:
+                conn.close()
+            else:
+                self._idle.put(conn)
+            if response.status != 200:
+                raise IOError(f"GET {url} returned HTTP {response.status}")
+            return json.loads(body)
+
+    def close(self):
+        """Close every idle connection."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def format_price(amount, currency='EUR'):
+    """Format a price the way Wallapop cards display it ("550 €", "549,99 €")."""
+    symbol = {'EUR': '€', 'GBP': '£', 'USD': '$'}.get(currency, currency or '')
+    if amount is None:
+        return "Unknown Price"
+    if float(amount).is_integer():
+        text = f"{int(amount)}"
+    else:
+        text = f"{amount:.2f}".replace(".", ",")
+    return f"{text} {symbol}".strip()
+
+
+def format_timestamp(value):
+    """Format an epoch timestamp (seconds or milliseconds) as dd/mm/yyyy HH:MM."""
+    if not value:
+        return "Desconocido"
+    try:
+        value = float(value)
+        if value > 1e11:
+            value /= 1000
+        return datetime.datetime.fromtimestamp(value).strftime('%d/%m/%Y %H:%M')
+    except (TypeError, ValueError, OverflowError, OSError):
+        return str(value)
+
+
+def _first_image(images):
+    """Return the best available URL of the first image of an item."""
+    if not images:
+        return ""
+    image = images[0]
+    urls = image.get('urls') or image
+    for size in ('medium', 'big', 'small', 'original'):
+        if urls.get(size):
+            return urls[size]
+    return ""
+
+
+def parse_search_item(raw, web_base='https://es.wallapop.com'):
+    """Convert an item of the search API into an Offer.
+
+    Besides the fields scraped from the DOM, the API exposes the item and
+    seller IDs, timestamps and coordinates, which are kept as extra keys.
+
+    Args:
+        raw: Item object from the search JSON
+        web_base: Base URL of the Wallapop web site, used for the item link
+
+    Returns:
+        Offer
+    """
+    item = empty_item()
+    item['titulo'] = raw.get('title') or item['titulo']
+
+    price = raw.get('price')
+    if isinstance(price, dict):
+        item['precio'] = format_price(price.get('amount'), price.get('currency', 'EUR'))
+    elif price is not None or raw.get('sale_price') is not None:
+        item['precio'] = format_price(price if price is not None else raw.get('sale_price'), raw.get('currency', 'EUR'))
+
+    slug = raw.get('web_slug')
+    if slug:
+        item['enlace'] = f"{web_base}/item/{quote(slug)}"
+
+    reserved = raw.get('reserved')
+    if isinstance(reserved, dict):
+        item['reservada'] = bool(reserved.get('flag'))
+    else:
+        item['reservada'] = bool(reserved or (raw.get('flags') or {}).get('reserved'))
+
+    item['image_url'] = _first_image(raw.get('images'))
+
+    location = raw.get('location') or {}
+    if location.get('city'):
+        item['location'] = location['city']
+
+    item['item_id'] = raw.get('id')
+    item['seller_id'] = raw.get('user_id') or (raw.get('user') or {}).get('id')
+    item['created_at'] = raw.get('created_at') or raw.get('creation_date')
+    item['modified_at'] = raw.get('modified_at') or raw.get('modification_date')
+    item['latitude'] = location.get('latitude')
+    item['longitude'] = location.get('longitude')
+    return item
+
+
+def parse_search_results(data, web_base='https://es.wallapop.com'):
+    """Extract the Offers from a search API response.
+
+    Both the current (data.section.payload.items) and the older
+    (search_objects) response layouts are understood.
+
+    Args:
+        data: Decoded search JSON
+        web_base: Base URL of the Wallapop web site
+
+    Returns:
+        List of Offers
+    """
+    raw_items = (((data.get('data') or {}).get('section') or {}).get('payload') or {}).get('items')
+    if raw_items is None:
+        raw_items = data.get('search_objects', [])
+    return [parse_search_item(raw, web_base) for raw in raw_items]
+
+
+def parse_item_details(item_data, user_data, stats_data):
+    """Build a seller info dictionary from the item, user and stats API responses.
+
+    Args:
+        item_data: Decoded item JSON
+        user_data: Decoded user JSON (may be empty)
+        stats_data: Decoded user stats JSON (may be empty)
+
+    Returns:
+        Tuple of (seller info dictionary, set of fields that were found)
+    """
+    result = empty_seller_info()
+    found = set()
+
+    counters = item_data.get('counters') or {}
+    views = counters.get('views', item_data.get('views'))
+    favorites = counters.get('favorites', item_data.get('favorites'))
+    if views is not None:
+        result['views'] = str(views)
+    if favorites is not None:
+        result['favorites'] = str(favorites)
+    modified = item_data.get('modified_date') or item_data.get('modified_at')
+    if modified:
+        result['last_update'] = format_timestamp(modified)
+    result['image_url'] = _first_image(item_data.get('images'))
+
+    shipping = item_data.get('shipping') or {}
+    if shipping.get('user_allows_shipping') or shipping.get('item_is_shippable') or item_data.get('supports_shipping'):
+        result['shipping'] = "Sí"
+
+    location = item_data.get('location') or user_data.get('location') or {}
+    if location.get('city'):
+        result['location'] = location['city']
+
+    if user_data.get('micro_name'):
+        result['name'] = user_data['micro_name']
+    if user_data.get('type') == 'professional' or user_data.get('featured_professional'):
+        result['profesional'] = "Sí"
+
+    for counter in stats_data.get('counters', []):
+        if counter.get('type') == 'sells':
+            result['sales'] = str(counter.get('value', 0))
+            found.add('sales')
+        elif counter.get('type') == 'reviews':
+            result['number_of_rates'] = str(counter.get('value', 0))
+            found.add('number_of_rates')
+    for rating in stats_data.get('ratings', []):
+        if rating.get('type') == 'reviews' and rating.get('value') is not None:
+            # The API rates on a 0-100 scale, the web shows 0-5 stars
+            result['rate'] = f"{rating['value'] / 20:.1f}"
+            found.add('rate')
+    return result, found
+
+
+class HttpBackend(FetchBackend):
+    """Fetch backend reading Wallapop's JSON API without a browser.
+
+    Args:
+        api_base: Base URL of the API
+        web_base: Base URL of the web site (for item links)
+        timeout: Socket timeout in seconds
+        concurrency: Maximum number of detail lookups in flight
+    """
+
+    name = 'http'
+
+    def __init__(self, api_base='https://api.wallapop.com', web_base='https://es.wallapop.com', timeout=10,
+                 concurrency=8):
+        self.concurrency = concurrency
+        self.web_base = web_base.rstrip('/')
+        self.pool = ConnectionPool(api_base, timeout=timeout)
+        # Sellers often list several matching items; look each one up once per search
+        # (cleared when a search starts, so a long-running daemon sees fresh stats)
+        self._sellers = {}
+        self._sellers_lock = threading.Lock()
+        # Next page token of every search, from the last response
+        self._next_pages = {}
+
+    @staticmethod
+    def search_params(url):
+        """Translate a Wallapop web search URL into search API parameters."""
+        params = {k: v for k, v in parse_qsl(urlsplit(url).query) if k not in IGNORED_SEARCH_PARAMS}
+        params.setdefault('source', 'search_box')
+        return params
+
+    def search(self, search, limit):
+        with self._sellers_lock:
+            self._sellers = {}
+        data = self.pool.get_json('/api/v3/search', self.search_params(search['url']))
+        self._next_pages[search['name']] = (data.get('meta') or {}).get('next_page')
+        items = parse_search_results(data, self.web_base)
+        logger.info(f"HTTP search returned {len(items)} items")
+        return len(items), items[:limit]
+
+    def more_results(self, search):
+        token = self._next_pages.pop(search['name'], None)
+        if not token:
+            return []
+        data = self.pool.get_json('/api/v3/search', {'next_page': token})
+        self._next_pages[search['name']] = (data.get('meta') or {}).get('next_page')
+        items = parse_search_results(data, self.web_base)
+        logger.info(f"HTTP search returned {len(items)} more items")
+        return items
+
+    def _seller(self, seller_id):
+        """Return (user JSON, stats JSON) of a seller, cached per search.
+
+        Failed lookups are not cached, so the next item of the seller tries again.
+        """
+        with self._sellers_lock:
+            if seller_id in self._sellers:
+                return self._sellers[seller_id]
+        user_data, stats_data = {}, {}
+        if seller_id:
+            try:
+                user_data = self.pool.get_json(f"/api/v3/users/{quote(str(seller_id))}")
+                stats_data = self.pool.get_json(f"/api/v3/users/{quote(str(seller_id))}/stats")
+            except IOError as e:
+                logger.warning(f"Could not load seller {seller_id}: {e}")
+                return {}, {}
+        with self._sellers_lock:
+            self._sellers[seller_id] = (user_data, stats_data)
+        return user_data, stats_data
+
+    def get_details(self, item):
+        try:
+            item_data = self.pool.get_json(f"/api/v3/items/{quote(str(item['item_id']))}")
+            seller_id = item.get('seller_id') or (item_data.get('user') or {}).get('id') or item_data.get('user_id')
+            user_data, stats_data = self._seller(seller_id)
+        except (IOError, KeyError, ValueError) as e:
+            logger.error(f"Error getting details for {item.get('enlace')}: {e}")
+            return None
+        result, found = parse_item_details(item_data, user_data, stats_data)
+        result['found'] = found
+        return result
+
+    def iter_details(self, items):
+        return fetch_engine.iter_details(self, items, self.concurrency)
+
+    def enrich(self, items):
+        results = [None] * len(items)
+        for index, result in self.iter_details(items):
+            results[index] = result
+        return results
+
+    def close(self):
+        logger.info(f"HTTP backend: {self.pool.requests} requests over {self.pool.connections} connections")
+        self.pool.close()
+        self._sellers = {}
+
+
+class FallbackBackend(FetchBackend):
+    """Use a primary backend and fall back to another one when it fails.
+
+    The fallback backend is only created the first time it is needed. Every
+    item is tagged with the backend that found it ('source'), and its details
+    are looked up by that same backend: the pipeline may already be searching
+    with the other one by the time an item is enriched.
+
+    Args:
+        primary: Preferred FetchBackend
+        fallback_factory: Callable returning the fallback FetchBackend
+    """
+
+    def __init__(self, primary, fallback_factory):
+        self.primary = primary
+        self.fallback_factory = fallback_factory
+        self.fallback = None
+        # Backend of the last search, which more_results() continues
+        self.current = primary
+        self.name = primary.name
+
+    def _get_fallback(self):
+        if self.fallback is None:
+            logger.info("Starting fallback backend...")
+            self.fallback = self.fallback_factory()
+        return self.fallback
+
+    @staticmethod
+    def _tag(items, backend):
+        for item in items:
+            item['source'] = backend.name
+        return items
+
+    def _backend_for(self, item):
+        """Backend that found an item (the primary one for untagged items)."""
+        if item.get('source', self.primary.name) == self.primary.name:
+            return self.primary
+        return self._get_fallback()
+
+    def search(self, search, limit):
+        try:
+            self.current = self.primary
+            total_cards, items = self.primary.search(search, limit)
+        except Exception as e:
+            logger.warning(f"{self.primary.name} backend failed for '{search['name']}', falling back: {e}")
+            self.current = self._get_fallback()
+            total_cards, items = self.current.search(search, limit)
+        return total_cards, self._tag(items, self.current)
+
+    def more_results(self, search):
+        return self._tag(self.current.more_results(search), self.current)
+
+    def get_details(self, item):
+        return self._backend_for(item).get_details(item)
+
+    def enrich(self, items):
+        results = [None] * len(items)
+        for index, result in self.iter_details(items):
+            results[index] = result
+        return results
+
+    def iter_details(self, items):
+        # Items of one search all come from one backend, but carried-over items may not
+        groups = {}
+        for index, item in enumerate(items):
+            groups.setdefault(self._backend_for(item), []).append(index)
+        for backend, indexes in groups.items():
+            for position, result in backend.iter_details([items[index] for index in indexes]):
+                yield indexes[position], result
+
+    def is_healthy(self):
+        return self.primary.is_healthy() and (self.fallback is None or self.fallback.is_healthy())
+
+    def close(self):
+        self.primary.close()
+        if self.fallback is not None:
+            self.fallback.close()
+            self.fallback = None
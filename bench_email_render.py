@@ -0,0 +1,83 @@
+#!/usr/bin/python
+"""
+Micro-benchmark of the email rendering of the Wallabot application.
+
+This script renders the text and HTML bodies of 10,000 generated offers
+without and with the fragment cache, and prints the time per offer and the
+body sizes, to track rendering regressions. It needs no browser, no network
+access and no email account.
+
+Usage: python3 bench_email_render.py [number of offers]
+"""
+import sys
+from time import perf_counter
+
+import email_template
+
+
+def make_offers(count):
+    """Generate offers shaped like the ones found by a search."""
+    return [{
+        'titulo': f'PlayStation 5 Pro 2TB + mando DualSense #{i}',
+        'precio': f'{500 + i % 100} €',
+        'enlace': f'https://es.wallapop.com/item/playstation-5-pro-{1000000000 + i}',
+        'reservada': i % 7 == 0,
+        'seller_name': f'Vendedor {i % 500}',
+        'seller_number_of_rates': str(i % 90),
+        'seller_rate': f'{3 + i % 20 / 10:.1f}',
+        'seller_sales': str(i % 40),
+        'location': 'Madrid',
+        'shipping': 'Sí' if i % 3 else 'No',
+        'seller_profesional': 'No',
+        'image_url': f'https://cdn.wallapop.com/images/10420/{i}/W640.jpg' if i % 10 else None,
+        'last_update': 'Hace 1 hora',
+        'views': str(i % 300),
+        'favorites': str(i % 25),
+        'search': f'search {i % 3}',
+    } for i in range(count)]
+
+
+def measure(label, render, offers, setup=None, repeat=5):
+    """Print the best time of repeat renders (setup runs untimed before each one)."""
+    best = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = perf_counter()
+        body = render(offers)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    size = len(body.encode('utf-8'))
+    print(f"- {label}: {best * 1000:.1f} ms, {best / len(offers) * 1e6:.1f} µs per offer, "
+          f"{size} bytes ({size / len(offers):.0f} per offer)")
+    return best
+
+
+def bench_email_render(count=10000):
+    """
+    Render the bodies of count offers cold (every card rendered) and warm (every card cached).
+    """
+    print(f"Rendering {count} offers...")
+    offers = make_offers(count)
+    uncached = lambda offers: "".join(email_template.render_html_item(email_template.item_fields(offer))
+                                      for offer in offers)
+    measure("HTML cards, no cache", uncached, offers)
+
+    # Size the caches so the warm passes find every card
+    html_cache, text_cache = email_template.html_fragments, email_template.text_fragments
+    html_cache.maxsize = text_cache.maxsize = max(html_cache.maxsize, count)
+    cold = measure("HTML body, cold cache", email_template.generate_html_body, offers, html_cache.clear)
+    warm = measure("HTML body, warm cache", email_template.generate_html_body, offers)
+    measure("Text body, cold cache", email_template.generate_text_body, offers, text_cache.clear)
+    measure("Text body, warm cache", email_template.generate_text_body, offers)
+    print(f"- HTML cache: {len(html_cache)} cards kept")
+
+    start = perf_counter()
+    groups = email_template.split_offers(offers, 100000)
+    bodies = [email_template.generate_html_body(group) for group in groups]
+    print(f"- Split into {len(bodies)} emails under 100000 bytes in {(perf_counter() - start) * 1000:.1f} ms")
+    print(f"Warm renders are {cold / warm:.1f}x faster than cold ones")
+
+
+if __name__ == "__main__":
+    bench_email_render(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,50 @@
+#!/usr/bin/python
+"""
+Micro-benchmark of the subscription matching of the Wallabot application.
+
+This script matches 500 random offers against 5,000 random subscriptions
+with the SubscriptionIndex and with a full scan of every subscription, and
+prints how many candidates the indexes leave to check per offer and the
+matching time of both, to track matching regressions. It needs no browser
+and no network access.
+
+Usage: python3 bench_subscriptions.py [number of subscriptions] [number of offers]
+"""
+import random
+import sys
+from time import perf_counter
+
+from subscriptions import SubscriptionIndex, load_subscriptions
+from test_subscriptions import random_offer, random_subscription
+
+
+def bench_subscriptions(count=5000, offers=500):
+    """
+    Match offers against count subscriptions with the indexes and with a full scan.
+    """
+    print(f"Matching {offers} offers against {count} subscriptions...")
+    rng = random.Random(42)
+    start = perf_counter()
+    subscriptions = load_subscriptions([random_subscription(rng, i) for i in range(count)])
+    index = SubscriptionIndex(subscriptions)
+    print(f"- Index built in {(perf_counter() - start) * 1000:.1f} ms")
+    test_offers = [random_offer(rng, i) for i in range(offers)]
+
+    start = perf_counter()
+    indexed = [index.match(offer) for offer in test_offers]
+    indexed_time = perf_counter() - start
+    start = perf_counter()
+    scanned = [[s for s in subscriptions if s.matches(offer)] for offer in test_offers]
+    scan_time = perf_counter() - start
+
+    assert indexed == scanned, "the index and the full scan disagree"
+    print(f"- {sum(len(matched) for matched in indexed)} matches, "
+          f"{index.candidates / offers:.0f} candidates checked per offer instead of {count}")
+    print(f"- Indexed matching: {indexed_time * 1000 / offers:.2f} ms per offer")
+    print(f"- Full scan: {scan_time * 1000 / offers:.2f} ms per offer")
+    print(f"Indexed matching is {scan_time / indexed_time:.1f}x faster than a full scan")
+
+
+if __name__ == "__main__":
+    bench_subscriptions(int(sys.argv[1]) if len(sys.argv) > 1 else 5000,
+                        int(sys.argv[2]) if len(sys.argv) > 2 else 500)
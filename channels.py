@@ -0,0 +1,496 @@
+#!/usr/bin/python
+"""
+Notification channels for Wallabot.
+
+The offers found by a run are scraped once and delivered to every configured
+channel:
+
+- 'email': queue an email to one or more addresses in the outbox (see outbox.py)
+- 'webhook': POST the offers as JSON to an HTTP endpoint (a chat webhook or
+  any service of your own)
+- 'jsonl': append one JSON line per offer to a local file
+
+The NotificationDispatcher delivers to every channel at the same time, on an
+asyncio event loop whose blocking deliveries run in worker threads (as the
+detail lookups of fetch_engine.py do). Every channel has its own timeout, so a
+slow or unreachable webhook never delays the others; a failure is logged and
+only affects its own channel. The loop and its threads live as long as the
+dispatcher, so a delivery that timed out can still finish in the background;
+its actual outcome is checked on the next dispatch.
+
+The offers are already recorded as seen when they are delivered, so the
+offers a channel failed to deliver are kept in a RetryQueue file and sent to
+that channel again with its next delivery (or by retry_failed()), until it
+delivers them. Email channels only fail when the outbox cannot be written.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import os
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from time import perf_counter
+from urllib.parse import urlsplit
+
+import email_template
+from offer import Offer
+
+logger = logging.getLogger(__name__)
+
+
+def offer_record(offer):
+    """Plain dictionary of an Offer or offer dictionary, for JSON payloads."""
+    return offer.to_dict() if hasattr(offer, 'to_dict') else dict(offer)
+
+
+class Channel:
+    """A destination of notifications.
+
+    Args:
+        name: Name used in logs
+        timeout: Seconds a delivery may take before the dispatcher stops waiting for it
+
+    Attributes:
+        key: Stable identity of the destination (type and target), keying the retry queue
+    """
+
+    def __init__(self, name, timeout=15):
+        self.name = name
+        self.timeout = timeout
+        self.key = name
+
+    def deliver(self, offers):
+        """Deliver offers, raising an exception if they could not be delivered."""
+        raise NotImplementedError
+
+    def close(self):
+        """Release the resources of the channel."""
+
+
+class EmailChannel(Channel):
+    """Queue emails with the offers in an outbox.
+
+    Args:
+        outbox: Outbox the emails are queued in
+        sender: From address
+        receiver: Address or list of addresses the emails go to
+        max_bytes: Split emails whose HTML would exceed this many bytes (0 = never)
+        on_queued: Optional callable run after queueing (e.g. OutboxSender.wake)
+        name: Name used in logs (defaults to the receiver)
+        timeout: Seconds queueing may take
+    """
+
+    def __init__(self, outbox, sender, receiver, max_bytes=100000, on_queued=None, name=None, timeout=15):
+        receivers = [receiver] if isinstance(receiver, str) else list(receiver)
+        super().__init__(name or f"email:{', '.join(receivers)}", timeout)
+        self.key = f"email:{','.join(receivers)}"
+        self.outbox = outbox
+        self.sender = sender
+        self.receivers = receivers
+        self.max_bytes = max_bytes
+        self.on_queued = on_queued
+
+    def deliver(self, offers):
+        groups = email_template.split_offers(offers, self.max_bytes)
+        html_bytes = 0
+        for part, group in enumerate(groups, 1):
+            message = MIMEMultipart("alternative")
+            subject = "Wallabot - New items found in Wallapop"
+            message["Subject"] = f"{subject} ({part}/{len(groups)})" if len(groups) > 1 else subject
+            message["From"] = self.sender
+            message["To"] = ", ".join(self.receivers)
+
+            # Generate email content using the template module
+            text = email_template.generate_text_body(group)
+            html = email_template.generate_html_body(group)
+            html_bytes += len(html.encode('utf-8'))
+            message.attach(MIMEText(text, "plain"))
+            message.attach(MIMEText(html, "html"))
+
+            self.outbox.put(self.sender, self.receivers, message.as_string())
+        if self.on_queued:
+            self.on_queued()
+        logger.info(f"{self.name}: queued {len(groups)} email(s) with {len(offers)} offers, "
+                    f"{html_bytes} bytes of HTML, {html_bytes / len(offers):.0f} bytes per offer")
+
+
+class WebhookChannel(Channel):
+    """POST the offers as JSON to an HTTP endpoint.
+
+    The payload is {"count": N, "offers": [...]} with every offer field. Chat
+    webhooks expect a message instead: with text_field set, the payload is
+    {text_field: plain text of the offers} (e.g. 'text' for Slack, 'content'
+    for Discord).
+
+    Args:
+        url: Endpoint receiving the POST requests
+        headers: Optional extra request headers (e.g. an Authorization token)
+        text_field: Send the plain text of the offers in this field instead of the offer list
+        name: Name used in logs (defaults to the host of the URL)
+        timeout: Socket timeout of the request, and delivery timeout
+    """
+
+    def __init__(self, url, headers=None, text_field=None, name=None, timeout=15):
+        super().__init__(name or f"webhook:{urlsplit(url).netloc}", timeout)
+        self.key = f"webhook:{url}"
+        self.url = url
+        self.headers = dict(headers or {})
+        self.text_field = text_field
+
+    def payload(self, offers):
+        if self.text_field:
+            return {self.text_field: email_template.generate_text_body(offers)}
+        return {'count': len(offers), 'offers': [offer_record(offer) for offer in offers]}
+
+    def deliver(self, offers):
+        body = json.dumps(self.payload(offers), ensure_ascii=False).encode('utf-8')
+        request = urllib.request.Request(self.url, data=body, method='POST',
+                                         headers={'Content-Type': 'application/json', **self.headers})
+        # urlopen raises HTTPError for error statuses
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+        logger.info(f"{self.name}: posted {len(offers)} offers ({len(body)} bytes)")
+
+
+class JsonlChannel(Channel):
+    """Append one JSON line per offer to a local file.
+
+    Args:
+        path: File the lines are appended to (created if missing)
+        name: Name used in logs (defaults to the path)
+        timeout: Seconds writing may take
+    """
+
+    def __init__(self, path, name=None, timeout=15):
+        super().__init__(name or f"jsonl:{path}", timeout)
+        self.key = f"jsonl:{path}"
+        self.path = path
+        self._lock = threading.Lock()
+
+    def deliver(self, offers):
+        notified_at = datetime.datetime.now().isoformat(timespec='seconds')
+        lines = "".join(json.dumps({'notified_at': notified_at, **offer_record(offer)}, ensure_ascii=False) + "\n"
+                        for offer in offers)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+        logger.info(f"{self.name}: wrote {len(offers)} offers")
+
+
+def create_channel(spec, outbox, sender, on_queued=None, max_bytes=100000, timeout=15):
+    """Build a channel from its NOTIFY_CHANNELS entry in config.py.
+
+    Args:
+        spec: Dictionary with a 'type' ('email', 'webhook' or 'jsonl') and its options
+        outbox: Outbox of the email channels
+        sender: From address of the email channels
+        on_queued: Callable run after an email channel queued emails
+        max_bytes: Default EMAIL_MAX_BYTES of the email channels
+        timeout: Default delivery timeout in seconds
+
+    Returns:
+        Channel instance
+
+    Raises:
+        ValueError: If the type is unknown or a required option is missing
+    """
+    kind = spec.get('type')
+    name = spec.get('name')
+    timeout = spec.get('timeout', timeout)
+    try:
+        if kind == 'email':
+            return EmailChannel(outbox, sender, spec['to'], spec.get('max_bytes', max_bytes), on_queued,
+                                name, timeout)
+        if kind == 'webhook':
+            return WebhookChannel(spec['url'], spec.get('headers'), spec.get('text_field'), name, timeout)
+        if kind == 'jsonl':
+            return JsonlChannel(spec['path'], name, timeout)
+    except KeyError as e:
+        raise ValueError(f"Notification channel {spec} needs a {e} option")
+    raise ValueError(f"Unknown notification channel type: {kind!r}")
+
+
+def create_channels(specs, outbox, sender, on_queued=None, max_bytes=100000, timeout=15, owner=None):
+    """Build the channels of a list of specs (see create_channel()).
+
+    Args:
+        owner: Optional subscriber name prefixed to the channel names and keys
+
+    Returns:
+        List of Channel instances
+    """
+    channels = [create_channel(spec, outbox, sender, on_queued, max_bytes, timeout) for spec in specs]
+    if owner:
+        for channel in channels:
+            channel.name = f"{owner}/{channel.name}"
+            channel.key = f"{owner}/{channel.key}"
+    return channels
+
+
+class RetryQueue:
+    """Offers each channel failed to deliver, kept in a JSON file until it delivers them.
+
+    Args:
+        path: JSON file mapping each channel key to its undelivered offers
+    """
+
+    def __init__(self, path='notify_retry.json'):
+        self.path = path
+        self.pending = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return {name: entries for name, entries in data.items() if entries} if isinstance(data, dict) else {}
+        except Exception as e:
+            logger.error(f"Error loading notification retry queue: {e}")
+            return {}
+
+    def save(self):
+        """Write the queue (to a temporary file first, so a crash never loses it)."""
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.pending, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def merged(self, key, offers):
+        """Undelivered offers of a channel followed by the new ones (each listing once per search)."""
+        merged = [Offer.from_dict(entry) for entry in self.pending.get(key, [])]
+        keys = {(offer.get('search'), offer['enlace']) for offer in merged}
+        for offer in offers:
+            key = (offer.get('search'), offer['enlace'])
+            if key not in keys:
+                keys.add(key)
+                merged.append(offer)
+        return merged
+
+    def update(self, key, offers, delivered):
+        """Forget the offers of a channel once delivered, or keep them for the next attempt."""
+        if delivered:
+            self.pending.pop(key, None)
+        else:
+            self.pending[key] = [offer_record(offer) for offer in offers]
+
+    def forget(self, key, offers):
+        """Forget some offers of a channel, delivered by a late delivery."""
+        delivered = {(offer.get('search'), offer['enlace']) for offer in offers}
+        entries = [entry for entry in self.pending.get(key, [])
+                   if (entry.get('search'), entry.get('enlace')) not in delivered]
+        if entries:
+            self.pending[key] = entries
+        else:
+            self.pending.pop(key, None)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.pending.values())
+
+
+class NotificationDispatcher:
+    """Deliver the same offers to several channels concurrently.
+
+    Args:
+        channels: List of Channel instances
+        retry_queue: Optional RetryQueue keeping the offers a channel failed to deliver
+    """
+
+    def __init__(self, channels, retry_queue=None):
+        self.channels = channels
+        self.retry_queue = retry_queue
+        # Event loop and worker threads of the deliveries, created on the first dispatch
+        self._loop = None
+        self._executor = None
+        # Deliveries still running after their timeout: channel key -> (channel, future, offers)
+        self._late = {}
+        # Channels without a name of their own can share a default one (e.g. two webhooks on one host),
+        # and the same destination can be configured twice
+        names, keys = {}, {}
+        for channel in channels:
+            names[channel.name] = names.get(channel.name, 0) + 1
+            if names[channel.name] > 1:
+                channel.name = f"{channel.name} #{names[channel.name]}"
+            keys[channel.key] = keys.get(channel.key, 0) + 1
+            if keys[channel.key] > 1:
+                channel.key = f"{channel.key} #{keys[channel.key]}"
+        # Deliveries and failures per channel name, for the run log
+        self.delivered = {channel.name: 0 for channel in channels}
+        self.failures = {channel.name: 0 for channel in channels}
+        # Number of dispatches made, so callers can tell whether the queued retries went out
+        self.dispatches = 0
+        if retry_queue is not None:
+            by_name = {channel.name: channel.key for channel in channels}
+            for key in [key for key in retry_queue.pending if key not in keys]:
+                if key in by_name and by_name[key] not in retry_queue.pending:
+                    # Queues written before the channels had keys are keyed by channel name
+                    retry_queue.pending[by_name[key]] = retry_queue.pending.pop(key)
+                    continue
+                logger.warning(f"Dropping {len(retry_queue.pending.pop(key))} undelivered offers "
+                               f"of the removed channel {key}")
+
+    async def _deliver(self, loop, executor, channel, offers):
+        """Deliver offers to one channel.
+
+        Returns:
+            True if delivered, False if failed, None if still running after the timeout
+        """
+        start = perf_counter()
+        future = executor.submit(channel.deliver, offers)
+        # Unlike wait_for(), wait() leaves the delivery running when the timeout expires
+        done, _ = await asyncio.wait({asyncio.wrap_future(future, loop=loop)}, timeout=channel.timeout)
+        if not done:
+            logger.error(f"{channel.name}: no delivery after {channel.timeout} seconds, "
+                         f"its outcome is checked on the next dispatch")
+            self._late[channel.key] = (channel, future, offers)
+            return None
+        error = future.exception()
+        if error is not None:
+            logger.error(f"{channel.name}: delivery failed: {error}")
+            return False
+        logger.debug(f"{channel.name}: delivered in {perf_counter() - start:.2f} seconds")
+        return True
+
+    async def _deliver_all(self, loop, executor, deliveries):
+        return await asyncio.gather(*(self._deliver(loop, executor, channel, offers)
+                                      for channel, offers in deliveries))
+
+    def _settle_late(self):
+        """Account for the deliveries that were still running after their timeout and ended since.
+
+        A late delivery that succeeded removes its offers from the retry queue,
+        so they are not sent twice; one that failed leaves them in it.
+        """
+        settled = False
+        for key, (channel, future, offers) in list(self._late.items()):
+            if not future.done():
+                continue
+            del self._late[key]
+            settled = True
+            error = future.exception()
+            if error is None:
+                logger.info(f"{channel.name}: late delivery of {len(offers)} offers succeeded")
+                self.delivered[channel.name] += 1
+                if self.retry_queue is not None:
+                    self.retry_queue.forget(key, offers)
+            else:
+                logger.error(f"{channel.name}: late delivery failed: {error}")
+                self.failures[channel.name] += 1
+        if settled and self.retry_queue is not None:
+            self.retry_queue.save()
+
+    def dispatch(self, offers):
+        """Deliver offers to every channel at the same time.
+
+        Args:
+            offers: List of offers to deliver
+
+        Returns:
+            Dictionary mapping each channel name to whether it delivered
+        """
+        if not offers:
+            return {}
+        return self.dispatch_many([(channel, offers) for channel in self.channels])
+
+    def dispatch_many(self, deliveries):
+        """Deliver different offers to different channels at the same time.
+
+        Returns once every channel delivered, failed or timed out. A delivery
+        that timed out keeps running in a worker thread until its own socket
+        timeout, and its outcome is checked on the next dispatch (close()
+        waits for it). With a retry queue, the offers a channel failed to
+        deliver earlier go with its new ones (or alone), and the offers of the
+        failed and timed-out deliveries are saved in the queue. A channel whose
+        late delivery is still running gets nothing new meanwhile: its offers
+        wait in the queue, so a late success never sends them twice.
+
+        Args:
+            deliveries: List of (channel, offers) pairs, with channels of this dispatcher
+
+        Returns:
+            Dictionary mapping each channel name to whether it delivered
+            (False while a late delivery is still running)
+
+        Raises:
+            OSError: If the retry queue could not be saved
+        """
+        self._settle_late()
+        if self.retry_queue is not None:
+            offers_of = {channel.key: offers for channel, offers in deliveries}
+            merged = [(channel, self.retry_queue.merged(channel.key, offers_of.get(channel.key, [])))
+                      for channel in self.channels
+                      if channel.key in offers_of or channel.key in self.retry_queue.pending]
+            deliveries = [(channel, offers) for channel, offers in merged if channel.key not in self._late]
+            held = [(channel, offers) for channel, offers in merged if channel.key in self._late and offers]
+            for channel, offers in held:
+                self.retry_queue.update(channel.key, offers, False)
+            if held:
+                self.retry_queue.save()
+        deliveries = [(channel, offers) for channel, offers in deliveries if offers]
+        if not deliveries:
+            return {}
+        self.dispatches += 1
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._executor = ThreadPoolExecutor(max_workers=max(1, min(len(self.channels), 32)),
+                                                thread_name_prefix='notify')
+        start = perf_counter()
+        results = self._loop.run_until_complete(self._deliver_all(self._loop, self._executor, deliveries))
+        outcome = {channel.name: bool(ok) for (channel, _), ok in zip(deliveries, results)}
+        if self.retry_queue is not None:
+            for (channel, offers), ok in zip(deliveries, results):
+                self.retry_queue.update(channel.key, offers, bool(ok))
+            self.retry_queue.save()
+            if len(self.retry_queue):
+                logger.warning(f"{len(self.retry_queue)} offers kept in {self.retry_queue.path} "
+                               f"until their channel delivers them")
+        for (channel, _), ok in zip(deliveries, results):
+            # Late deliveries are counted once they end
+            if ok:
+                self.delivered[channel.name] += 1
+            elif ok is not None:
+                self.failures[channel.name] += 1
+        offers = sum(len(offers) for _, offers in deliveries)
+        logger.info(f"Delivered {offers} offers to {sum(outcome.values())} of {len(results)} channel(s) "
+                    f"in {perf_counter() - start:.2f} seconds")
+        return outcome
+
+    def retry_failed(self):
+        """Deliver again the offers kept in the retry queue.
+
+        Returns:
+            Dictionary mapping each channel name to whether it delivered
+        """
+        self._settle_late()
+        if self.retry_queue is None or not self.retry_queue.pending:
+            return {}
+        logger.info(f"Retrying {len(self.retry_queue)} undelivered offers")
+        return self.dispatch_many([])
+
+    def log_summary(self):
+        """Log the deliveries and failures of every channel."""
+        if not any(self.delivered.values()) and not any(self.failures.values()):
+            return
+        logger.info("Notification channels:")
+        for channel in self.channels:
+            if self.delivered[channel.name] or self.failures[channel.name]:
+                logger.info(f"  {channel.name}: {self.delivered[channel.name]} deliveries, "
+                            f"{self.failures[channel.name]} failed")
+
+    def close(self):
+        """Wait for the deliveries still running, then close the event loop and every channel."""
+        if self._loop is not None:
+            self._executor.shutdown(wait=True)
+            self._settle_late()
+            self._loop.close()
+            self._loop = self._executor = None
+        for channel in self.channels:
+            channel.close()
@@ -30,6 +30,122 @@ receiver = ''
 # - longitude/latitude: Location coordinates for local search
 OFFERS_URL ='https://es.wallapop.com/app/search?min_sale_price=500&max_sale_price=600&keywords=Playstation%205%20pro&filters_source=default_filters&longitude=-3.69196&latitude=40.41956'
 
+# Several searches processed in one run by the same browser, with one email for all of them.
+# Each search needs a unique 'name' (also used to keep its history apart) and a 'url'.
+# Any filter setting below (MAX_ITEMS_TO_CHECK, SKIP_RESERVED_ITEMS, SHIPPING_REQUIRED,
+# SKIP_WITH_LESS_THAN_*, SKIP_PROFESIONAL_SELLER) can be overridden per search. Example:
+# SEARCHES = [
+#     {'name': 'PS5 Pro', 'url': OFFERS_URL},
+#     {'name': 'Switch OLED', 'url': 'https://es.wallapop.com/app/search?keywords=switch%20oled',
+#      'SHIPPING_REQUIRED': False, 'MAX_ITEMS_TO_CHECK': 10},
+# ]
+# When empty, OFFERS_URL is used as the only search.
+SEARCHES = []
+
+######################
+# Email Delivery     #
+######################
+
+# SMTP server (empty = smtp.gmail.com for Gmail addresses, smtp.sapo.pt otherwise)
+SMTP_HOST = ''
+
+# SMTP server port (0 = the default of the server chosen above)
+SMTP_PORT = 0
+
+# Upgrade the SMTP connection with STARTTLS before logging in
+SMTP_STARTTLS = True
+
+# Seconds an open SMTP session may stay unused before it is checked with NOOP
+SMTP_IDLE_TIMEOUT = 60
+
+# Directory holding the emails waiting to be sent. Each one is written there before sending,
+# so an email that fails is retried later (also by the next run) instead of being lost.
+OUTBOX_DIR = 'outbox'
+
+# Seconds before the first retry of a failed email, doubled on every further failure
+EMAIL_RETRY_BACKOFF = 30
+
+# Upper bound of the delay between two attempts
+EMAIL_RETRY_MAX_BACKOFF = 3600
+
+# Set an email aside (as a .failed file in OUTBOX_DIR) after this many failed attempts (0 = never)
+EMAIL_MAX_ATTEMPTS = 10
+
+# Seconds to wait for the queued emails to be sent when the bot exits
+OUTBOX_DRAIN_SECONDS = 60
+
+#########################
+# Notification Channels #
+#########################
+
+# Where new offers are sent. Every channel gets the same offers, delivered to all of them at once.
+# When empty, they are emailed to receiver (see Email Notifications). Channel types:
+# - 'email': queue an email in the outbox; 'to' is an address or a list of addresses
+# - 'webhook': POST the offers as JSON ({"count": N, "offers": [...]}) to 'url'. Optional 'headers';
+#   'text_field' sends the plain text of the offers in that field instead (e.g. 'text' for Slack,
+#   'content' for Discord)
+# - 'jsonl': append one JSON line per offer to the file 'path'
+# Every channel accepts a 'name' for the logs and a 'timeout' in seconds. Example:
+# NOTIFY_CHANNELS = [
+#     {'type': 'email', 'to': receiver},
+#     {'type': 'email', 'to': ['friend@example.com', 'other@example.com']},
+#     {'type': 'webhook', 'url': 'https://hooks.slack.com/services/XXX', 'text_field': 'text'},
+#     {'type': 'jsonl', 'path': 'offers.jsonl'},
+# ]
+NOTIFY_CHANNELS = []
+
+# Seconds a channel may take to deliver before it is given up on (the others are not delayed)
+NOTIFY_TIMEOUT_SECONDS = 15
+
+# Offers are recorded as seen before they are delivered, so the offers a channel failed to deliver
+# are kept in this file and sent to that channel again on the next cycle or run, until it delivers
+# them ('' disables the retries: failed deliveries are then lost)
+NOTIFY_RETRY_FILE = 'notify_retry.json'
+
+######################
+# Subscriptions      #
+######################
+
+# Subscribers sharing the same scrape. Each one is only notified, on their own channels, of the new
+# offers matching their filters. Offers must first pass the filters above (Filtering Options), so
+# keep those as loose as the loosest subscription. Options of a subscription (all optional but
+# 'name' and 'channels'):
+# - 'channels': list of channels, as in NOTIFY_CHANNELS
+# - 'searches': names of the searches whose offers are matched (empty = all)
+# - 'keywords': the title must contain one of these (whole words, case and accent insensitive)
+# - 'exclude_keywords': the title must contain none of these
+# - 'min_price', 'max_price': price range in euros
+# - 'min_seller_rate', 'min_rating_count', 'min_sales': seller thresholds (unknown values pass)
+# - 'shipping_required', 'skip_professional', 'skip_reserved': True/False
+# Example:
+# SUBSCRIPTIONS = [
+#     {'name': 'Ana', 'channels': [{'type': 'email', 'to': 'ana@example.com'}],
+#      'keywords': ['ps5 pro'], 'exclude_keywords': ['caja vacía'], 'max_price': 550, 'min_sales': 3},
+#     {'name': 'Team chat', 'channels': [{'type': 'webhook', 'url': 'https://hooks.slack.com/services/XXX',
+#      'text_field': 'text'}], 'min_price': 400, 'shipping_required': True},
+# ]
+# With subscriptions and no NOTIFY_CHANNELS, receiver no longer gets every offer.
+SUBSCRIPTIONS = []
+
+# JSON file with a list of further subscriptions, in the same format (empty = none)
+SUBSCRIPTIONS_FILE = ''
+
+######################
+# Email Digest       #
+######################
+
+# Collect new offers and email them together once this many seconds have passed since the
+# first one was found, instead of one email per run (0 = email the offers of every run).
+# The offers are kept in DIGEST_FILE in between, so the window can span several runs.
+DIGEST_WINDOW_SECONDS = 0
+
+# File keeping the offers collected for the next digest email
+DIGEST_FILE = 'digest.json'
+
+# Split emails whose HTML would exceed this many bytes into several messages (0 = never).
+# Gmail clips messages with more than about 100 KB of HTML, hiding the last offers.
+EMAIL_MAX_BYTES = 100000
+
 ######################
 # Logging Behavior   #
 ######################
@@ -44,17 +160,33 @@ ENABLE_FILE_LOGGING = True
 # Filtering Options  #
 ######################
 
-# Maximum number of items to check per search (limits processing time)
+# Maximum number of items to check per search. RUN_TIME_BUDGET_SECONDS (see Run Pipeline)
+# bounds the duration of a run instead, so this can stay generous when a budget is set.
 MAX_ITEMS_TO_CHECK = 30
 
+# Filters run cheapest first: the card-level ones below (reserved, price, title keywords) reject
+# items straight from the search results, before their detail page is ever loaded. The others need
+# the seller info of the detail page. Every filter can be overridden per search (see SEARCHES).
+
 # Skip processing reserved items completely 
 SKIP_RESERVED_ITEMS = True
 
+# Price range in euros, read from the price shown on each search result (None = no limit).
+# Useful to narrow a search further without editing OFFERS_URL.
+MIN_PRICE = None
+MAX_PRICE = None
+
+# Only keep items whose title contains at least one of these keywords (case and accent insensitive)
+TITLE_INCLUDE_KEYWORDS = []
+
+# Skip items whose title contains any of these keywords, e.g. ['roto', 'averiado', 'caja vacía']
+TITLE_EXCLUDE_KEYWORDS = []
+
 # Only process items with shipping available
 SHIPPING_REQUIRED = True
 
-# Minimum seller rate required (skip items with fewer ratings)
-SKIP_WITH_LESS_THAN_SELLER_RATE = 3
+# Minimum seller rate required, in stars from 0 to 5 (0 disables; sellers without a rate are kept)
+SKIP_WITH_LESS_THAN_SELLER_RATE = 0
 
 # Minimum seller rating count required (skip items with fewer ratings)
 SKIP_WITH_LESS_THAN_RATING_COUNTER = 5
@@ -64,3 +196,190 @@ SKIP_WITH_LESS_THAN_SALES_NUMBER = 3
 
 # Skip items from professional sellers
 SKIP_PROFESIONAL_SELLER = False
+
+######################
+# Run Pipeline       #
+######################
+
+# Maximum number of items handed from one pipeline stage to the next at once
+# (also the number of detail lookups the 'http' backend can run concurrently per batch)
+PIPELINE_BUFFER_SIZE = 10
+
+# Send an email as soon as this many new offers are found (1 = one email per offer, right away).
+# 0 sends a single email with every new offer once all searches are done.
+# With DIGEST_WINDOW_SECONDS (see Email Digest) the batches are added to the digest instead.
+NOTIFY_BATCH_SIZE = 0
+
+# Wall-clock budget of a run in seconds (0 = no limit). When set, the detail pages of each search
+# are visited leftovers of the previous run first, then newest listing, then cheapest, and no new
+# visit starts once the remaining time no longer covers a typical one. Keep it below the interval between runs so they never overlap.
+RUN_TIME_BUDGET_SECONDS = 0
+
+# File keeping the candidates left unvisited when the budget runs out, for the next run
+RUN_QUEUE_FILE = 'run_queue.json'
+
+# Forget queued candidates discovered longer ago than this
+RUN_QUEUE_MAX_AGE_HOURS = 24
+
+######################
+# Incremental Scan   #
+######################
+
+# Only read the listings added since the previous run. Needs a search sorted by newest
+# (order_by=newest in its URL): the scan stops at the first listing seen at the top of the last one.
+# A scan still processes at most MAX_ITEMS_TO_CHECK cards (the first one reads that many), and
+# keeps the old mark when it could not reach it within them. Can be overridden per search.
+INCREMENTAL_SCAN = False
+
+# Pages loaded (infinite scroll or API pages) while no listing of the last scan shows up
+INCREMENTAL_MAX_PAGES = 5
+
+# File keeping the top listings of the last scan of every search
+SCAN_MARKS_FILE = 'scan_marks.json'
+
+######################
+# Page Waits         #
+######################
+
+# Maximum seconds to wait for each page type to become ready
+# - search: item cards present on the search results page
+# - search_more: further cards loaded after "load more" or scrolling (incremental scans)
+# - detail: seller header rendered on a product page
+# - detail_stats: views/favorites/last update spans present on a product page
+WAIT_TIMEOUTS = {'search': 15, 'search_more': 10, 'detail': 10, 'detail_stats': 3}
+
+# Once typical ready times are learned, wait at most this multiple of them (0 disables)
+ADAPTIVE_WAIT_FACTOR = 4
+
+# Never shrink an adaptive timeout below this many seconds
+MIN_WAIT_TIMEOUT = 2
+
+# File where learned ready times are kept between runs
+WAIT_TIMINGS_FILE = 'wait_timings.json'
+
+######################
+# Browser Startup    #
+######################
+
+# Persistent Chrome profile directory (e.g. 'chrome_profile'). Keeps the cookie consent and the
+# HTTP cache between runs. Leave empty to start every run from a blank profile.
+CHROME_USER_DATA_DIR = ''
+
+# Path of a ChromeDriver binary to use as-is (skips driver resolution entirely)
+CHROMEDRIVER_PATH = ''
+
+# Pin the ChromeDriver version resolved by webdriver-manager (e.g. '124.0.6367.91').
+# Empty reuses whichever driver was resolved last until it stops matching Chrome.
+CHROMEDRIVER_VERSION = ''
+
+# File remembering the last resolved ChromeDriver path
+CHROMEDRIVER_CACHE_FILE = 'chromedriver_cache.json'
+
+######################
+# Browser Resources  #
+######################
+
+# Block images, web fonts, ads and trackers in the scraping browser.
+# Image URLs are still read from the page, only the downloads are skipped.
+BLOCK_RESOURCES = False
+
+# With BLOCK_RESOURCES, also stop images from loading (through Chrome content settings)
+BLOCK_IMAGES = True
+
+# URL patterns ('*' wildcards) blocked with BLOCK_RESOURCES. Uncomment to replace the built-in list
+# (fonts, analytics, ad networks; see DEFAULT_BLOCKED_URL_PATTERNS in resource_blocking.py):
+# BLOCKED_URL_PATTERNS = ['*.woff2', '*google-analytics.com*', '*doubleclick.net*']
+
+# When driver.get() returns:
+# - 'normal': after the load event (every image, font and script)
+# - 'eager': once the HTML is parsed; the bot then waits for the elements it needs
+# - 'none': immediately
+PAGE_LOAD_STRATEGY = 'normal'
+
+# Log the average bytes transferred and ready time per detail page, to compare settings
+MEASURE_PAGE_WEIGHT = False
+
+#######################
+# Selector Strategies #
+#######################
+
+# File where the selector strategy that matched each detail page field is kept between runs
+SELECTOR_STATS_FILE = 'selector_stats.json'
+
+# Stop looking for a detail field after it was missing from this many pages in a row (0 = never)
+# The seller rate, sales and ratings read by the SKIP_WITH_LESS_THAN_* filters are never skipped
+SELECTOR_SKIP_AFTER_MISSES = 10
+
+# While a field is skipped, look for it again on every this many pages
+SELECTOR_RECHECK_EVERY = 5
+
+#######################
+# Detail Page Workers #
+#######################
+
+# Number of browsers visiting detail pages in parallel (1 = visit them one by one)
+DETAIL_WORKERS = 1
+
+# Times a detail page is retried on a fresh browser when a worker's Chrome crashes
+DETAIL_WORKER_RETRIES = 1
+
+# How product pages are visited from the search results:
+# - 'tab': open them in a reusable secondary tab, the results tab is never reloaded
+# - 'back': navigate the results tab away and go back afterwards (slower)
+DETAIL_NAVIGATION = 'tab'
+
+######################
+# History            #
+######################
+
+# SQLite database with notified offers and skipped items.
+# Existing offers_history.json / skipped_items_history.json files are imported on first use.
+HISTORY_DB = 'wallabot_history.db'
+
+# History backend:
+# - 'sqlite': HISTORY_DB, keeps skip reasons and first/last seen timestamps
+# - 'index': compact memory-mapped files of hashed item IDs (seen_index.bin, skipped_index.bin),
+#   for very large histories; URL variants of the same listing count as one item
+HISTORY_BACKEND = 'sqlite'
+
+# Directory holding the index files of the 'index' backend
+HISTORY_INDEX_DIR = '.'
+
+######################
+# Daemon Mode        #
+######################
+
+# Seconds between the start of two polling cycles when running with --daemon
+DAEMON_INTERVAL_SECONDS = 600
+
+# Restart the browser after this many page loads to keep memory in check (0 = never)
+DAEMON_RECYCLE_AFTER_PAGES = 500
+
+######################
+# Fetch Backend      #
+######################
+
+# How search results and seller info are fetched:
+# - 'selenium': render the pages in Chrome (default)
+# - 'http': read Wallapop's JSON API directly, without a browser
+BACKEND = 'selenium'
+
+# Base URL of the JSON API used by the 'http' backend (point it at a local server to test with fixtures)
+HTTP_API_BASE_URL = 'https://api.wallapop.com'
+
+# Base URL of the web site, used to build the offer links of the 'http' backend
+HTTP_WEB_BASE_URL = 'https://es.wallapop.com'
+
+# Socket timeout in seconds for API requests
+HTTP_TIMEOUT = 10
+
+# Maximum number of item detail lookups in flight at once with the 'http' backend
+HTTP_CONCURRENCY = 8
+
+# Fall back to the Selenium backend (started only when needed) if an API search fails
+HTTP_FALLBACK_TO_SELENIUM = True
+
+# With the 'selenium' backend, build items from the JSON the search and product pages download
+# (captured through Chrome DevTools network logging) instead of reading the rendered page.
+# Falls back to reading the page whenever no response was captured.
+CAPTURE_NETWORK_JSON = False
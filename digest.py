@@ -0,0 +1,91 @@
+#!/usr/bin/python
+"""
+Email digest for Wallabot.
+
+Without a digest every run that finds new offers sends its own email, so a
+bot scheduled every few minutes floods the inbox. In digest mode the new
+offers are collected in a JSON file instead, and emailed together once the
+digest window (counted from the first offer collected) is over. The file
+survives between runs, so the window can span many cron runs or daemon
+cycles.
+"""
+import json
+import logging
+import os
+from time import time
+
+from offer import Offer
+
+logger = logging.getLogger(__name__)
+
+
+class Digest:
+    """New offers waiting for the end of the digest window.
+
+    Args:
+        path: JSON file keeping the collected offers between runs
+        window_seconds: Seconds between the first collected offer and the email (0 disables the digest)
+    """
+
+    def __init__(self, path='digest.json', window_seconds=0):
+        self.path = path
+        self.window = window_seconds
+        data = self._load()
+        self.entries = data.get('offers', [])
+        self.opened_at = data.get('opened_at')
+
+    def _load(self):
+        if not self.window or not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except Exception as e:
+            logger.error(f"Error loading digest: {e}")
+            return {}
+
+    def _save(self):
+        # Write to a temporary file first so a crash never loses the collected offers
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'opened_at': self.opened_at, 'offers': self.entries}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def add(self, offers):
+        """Collect new offers for the next digest email.
+
+        Args:
+            offers: Offers to email (a listing already in the digest for the same search is only kept once)
+        """
+        keys = {(entry.get('search'), entry.get('enlace')) for entry in self.entries}
+        added = 0
+        for offer in offers:
+            key = (offer.get('search'), offer['enlace'])
+            if key in keys:
+                continue
+            keys.add(key)
+            self.entries.append(offer.to_dict() if isinstance(offer, Offer) else dict(offer))
+            added += 1
+        if self.opened_at is None and self.entries:
+            self.opened_at = time()
+        self._save()
+        logger.info(f"Added {added} offers to the digest ({len(self.entries)} waiting, "
+                    f"sent in {max(0, self.opened_at + self.window - time()) / 60:.0f} minutes)")
+
+    def due(self):
+        """Whether the window of the collected offers is over."""
+        return bool(self.entries) and time() - self.opened_at >= self.window
+
+    def offers(self):
+        """Collected offers, in the order they were found."""
+        return [Offer.from_dict(entry) for entry in self.entries]
+
+    def clear(self):
+        """Start a new digest once the collected offers were emailed."""
+        self.entries = []
+        self.opened_at = None
+        self._save()
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,77 @@
+#!/usr/bin/python
+"""
+Cached ChromeDriver resolution for Wallabot.
+
+webdriver-manager asks the network which ChromeDriver matches the installed
+Chrome every time install() is called, which makes up a large part of a cold
+start. The resolved driver path is remembered in a small JSON file and reused
+as long as the binary exists and matches the pinned version, so later runs
+skip the lookup entirely.
+"""
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def _load_cache(cache_file):
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache_file, path, version):
+    try:
+        with open(cache_file, 'w', encoding='utf-8') as f:
+            json.dump({'path': path, 'version': version}, f)
+    except OSError as e:
+        logger.warning(f"Could not save ChromeDriver cache {cache_file}: {e}")
+
+
+def resolve_chromedriver(path=None, version=None, cache_file='chromedriver_cache.json'):
+    """Return the path of the ChromeDriver binary to use.
+
+    Args:
+        path: Explicit driver path; used as-is when it exists
+        version: Pinned driver version (e.g. '124.0.6367.91'); None accepts any cached driver
+        cache_file: JSON file remembering the last resolved driver
+
+    Returns:
+        Driver path, or None to let Selenium resolve the driver itself
+        (when webdriver-manager is not installed)
+    """
+    if path:
+        if os.path.exists(path):
+            return path
+        logger.warning(f"CHROMEDRIVER_PATH {path} does not exist, resolving the driver instead")
+
+    cached = _load_cache(cache_file)
+    if cached.get('path') and os.path.exists(cached['path']) and (not version or cached.get('version') == version):
+        logger.debug(f"Using cached ChromeDriver {cached['path']}")
+        return cached['path']
+
+    try:
+        from webdriver_manager.chrome import ChromeDriverManager
+    except ImportError:
+        return None
+    logger.info(f"Resolving ChromeDriver {version or '(matching installed Chrome)'} with webdriver-manager...")
+    try:
+        manager = ChromeDriverManager(driver_version=version) if version else ChromeDriverManager()
+    except TypeError:
+        # webdriver-manager < 4 names the argument 'version'
+        manager = ChromeDriverManager(version=version)
+    driver_path = manager.install()
+    _save_cache(cache_file, driver_path, version)
+    return driver_path
+
+
+def forget_chromedriver(cache_file='chromedriver_cache.json'):
+    """Drop the cached driver, e.g. after Chrome was updated and rejected it."""
+    try:
+        os.remove(cache_file)
+    except OSError:
+        pass
@@ -0,0 +1,135 @@
+#!/usr/bin/python
+"""
+Pool of WebDriver workers for Wallabot.
+
+Detail pages are independent of each other, so they can be visited by several
+browser instances at once. Each worker thread owns one driver, created lazily
+through the factory it is given, and a worker whose browser dies is recycled
+without aborting the rest of the batch. The worker threads (and their
+browsers) are kept between batches until the pool is closed.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def is_driver_alive(driver):
+    """Check whether a WebDriver session still answers commands.
+
+    Args:
+        driver: Selenium WebDriver instance
+
+    Returns:
+        True if the browser responds, False otherwise
+    """
+    try:
+        driver.current_url
+        return True
+    except Exception:
+        return False
+
+
+class DriverPool:
+    """Run a function over many items using one browser per worker thread.
+
+    Args:
+        size: Number of browser instances (worker threads)
+        driver_factory: Callable returning a new WebDriver instance
+        retries: Times an item is retried on a fresh browser after a crash
+    """
+
+    def __init__(self, size, driver_factory, retries=1):
+        self.size = max(1, size)
+        self.driver_factory = driver_factory
+        self.retries = retries
+        self._local = threading.local()
+        self._drivers = []
+        self._lock = threading.Lock()
+        self._executor = None
+        self.restarts = 0
+
+    def _get_driver(self):
+        """Return the driver of the current worker thread, creating it if needed."""
+        driver = getattr(self._local, 'driver', None)
+        if driver is None:
+            driver = self.driver_factory()
+            self._local.driver = driver
+            with self._lock:
+                self._drivers.append(driver)
+            logger.debug(f"Started browser for worker {threading.current_thread().name}")
+        return driver
+
+    def _recycle_driver(self):
+        """Quit the current worker's driver so the next call creates a new one."""
+        driver = getattr(self._local, 'driver', None)
+        self._local.driver = None
+        if driver is None:
+            return
+        with self._lock:
+            if driver in self._drivers:
+                self._drivers.remove(driver)
+            self.restarts += 1
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        logger.warning(f"Recycled crashed browser for worker {threading.current_thread().name}")
+
+    def _run(self, func, item, default):
+        """Run func on one item, recovering from a dead browser.
+
+        func returns None when it could not process the item; the item is then
+        retried, and default returned if every attempt failed.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                driver = self._get_driver()
+                result = func(driver, item)
+                # func may swallow WebDriver errors, so confirm the browser survived
+                if not is_driver_alive(driver):
+                    logger.warning(f"Browser died while processing item (attempt {attempt + 1})")
+                    self._recycle_driver()
+                    continue
+                if result is not None:
+                    return result
+                logger.warning(f"Item could not be processed (attempt {attempt + 1})")
+            except Exception as e:
+                logger.error(f"Worker error (attempt {attempt + 1}): {e}")
+                self._recycle_driver()
+        return default
+
+    def map(self, func, items, default=None):
+        """Apply func(driver, item) to every item concurrently.
+
+        Args:
+            func: Callable taking a WebDriver and an item
+            items: List of items to process
+            default: Result used for items that failed on every attempt
+
+        Returns:
+            List of results in the same order as items
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='wallabot-worker')
+            executor = self._executor
+        futures = [executor.submit(self._run, func, item, default) for item in items]
+        return [future.result() for future in futures]
+
+    def close(self):
+        """Stop the worker threads and quit every browser started by the pool."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        with self._lock:
+            drivers, self._drivers = self._drivers, []
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                logger.error("Error closing pooled driver")
+        if drivers:
+            logger.info(f"Closed {len(drivers)} pooled browsers ({self.restarts} restarts)")
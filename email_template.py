@@ -5,94 +5,225 @@ Email template generator for Wallabot alerts.
 This module provides functions to generate HTML and plain text email templates 
 for Wallapop product alerts. It handles the formatting of product information
 in a clean, responsive layout optimized for email clients.
+
+The templates are format strings built once at import time. The rendered card
+of each offer (HTML and text) is kept in a bounded LRU cache keyed by the
+values it shows, so an offer emailed again (in a digest, a split
+message or a retry) is not rendered twice. Bodies are produced as a stream of
+fragments (iter_html_body, iter_text_body) that is joined once.
 """
+import threading
+from collections import OrderedDict
+
+# Maximum number of rendered cards kept per format
+FRAGMENT_CACHE_SIZE = 4096
+
+# Card fields that may be missing, with the text shown instead
+ITEM_DEFAULTS = {
+    'seller_name': 'Sin nombre',
+    'seller_rate': '0',
+    'seller_number_of_rates': '0',
+    'seller_sales': '0',
+    'location': 'Ubicación desconocida',
+    'shipping': 'No',
+    'seller_profesional': 'No',
+    'last_update': 'Desconocido',
+    'views': '0',
+    'favorites': '0',
+}
+
+class FragmentCache:
+    """Thread-safe LRU cache of rendered fragments, keyed by content hash.
+
+    Args:
+        maxsize: Maximum number of fragments kept (the least recently used go first)
+    """
+
+    def __init__(self, maxsize=FRAGMENT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, render):
+        """Return the fragment cached under key, rendering it on a miss.
+
+        Args:
+            key: Hashable content of the fragment (see fragment_key())
+            render: Callable producing the fragment
+
+        Returns:
+            The rendered fragment
+        """
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is not None:
+                self._fragments.move_to_end(key)
+                self.hits += 1
+                return fragment
+            self.misses += 1
+        fragment = render()
+        with self._lock:
+            self._fragments[key] = fragment
+            if len(self._fragments) > self.maxsize:
+                self._fragments.popitem(last=False)
+        return fragment
+
+    def clear(self):
+        """Drop every cached fragment and reset the counters."""
+        with self._lock:
+            self._fragments.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._fragments)
+
+# Rendered cards of the current process
+html_fragments = FragmentCache()
+text_fragments = FragmentCache()
+
+def item_fields(item):
+    """Collect the values shown on the card of an offer.
+    
+    Args:
+        item: Offer or offer dictionary
+    
+    Returns:
+        Dictionary of card values, with the defaults of missing fields applied
+    """
+    fields = {'titulo': item['titulo'], 'precio': item['precio'], 'enlace': item['enlace'],
+              'reservada': item['reservada'], 'image_url': item.get('image_url')}
+    for name, default in ITEM_DEFAULTS.items():
+        fields[name] = item.get(name, default)
+    return fields
+
+def fragment_key(fields):
+    """Key of the cached card of an offer: its values, hashed by the cache dictionary.
+    
+    Equal offers share one cached card, and an offer whose price or seller
+    info changed gets a new one.
+    """
+    return tuple(fields.values())
+
+def group_offers_by_search(offers):
+    """Group offers by the search that found them, keeping their order.
+    
+    Args:
+        offers: List of offer dictionaries, optionally tagged with a 'search' name
+    
+    Returns:
+        List of (search name, offers) tuples. The name is None when all offers
+        come from a single search, so no section headings are needed.
+    """
+    groups = {}
+    for offer in offers:
+        groups.setdefault(offer.get('search'), []).append(offer)
+    if len(groups) <= 1:
+        return [(None, offers)]
+    return list(groups.items())
+
+TEXT_ITEM_TEMPLATE = (
+    '{titulo}\nprecio: {precio}\nlink: {enlace}\nEstado: {estado}\nVendedor: {seller_name}\n'
+    'Valoraciones: {seller_rate}\nNúm. Valoraciones: {seller_number_of_rates}\nVentas: {seller_sales}\n'
+    'Ubicación: {location}\nEnvío: {shipping}\nProfesional: {seller_profesional}\n'
+    'Estadísticas: Actualizado {last_update}, {views} visitas, {favorites} favoritos\n\n'
+)
+
+def iter_text_body(offers):
+    """Stream the plain text email body for offers.
+    
+    Offers from several searches are listed under one heading per search.
+    
+    Args:
+        offers: List of offer dictionaries containing product information
+    
+    Yields:
+        Consecutive parts of the plain text body
+    """
+    for search, group in group_offers_by_search(offers):
+        if search:
+            yield f"=== {search} ({len(group)}) ===\n\n"
+        for offer in group:
+            yield generate_text_item(offer)
 
 def generate_text_body(offers):
     """Generate plain text email body for offers.
     
     Args:
         offers: List of offer dictionaries containing product information
-        
+    
     Returns:
         String containing plain text email content
     """
-    offers_text_array = [
-        '{}\nprecio: {}\nlink: {}\nEstado: {}\nVendedor: {}\nValoraciones: {}\nNúm. Valoraciones: {}\nVentas: {}\nUbicación: {}\nEnvío: {}\nProfesional: {}\nEstadísticas: Actualizado {}, {} visitas, {} favoritos\n\n'.format(
-            n['titulo'], 
-            n['precio'], 
-            n['enlace'], 
-            "Reservada" if n['reservada'] else "Disponible",
-            n.get('seller_name', 'Sin nombre'),
-            n.get('seller_rate', '0'),
-            n.get('seller_number_of_rates', '0'),
-            n.get('seller_sales', '0'),
-            n.get('location', 'Ubicación desconocida'),
-            n.get('shipping', 'No'),
-            n.get('seller_profesional', 'No'),
-            n.get('last_update', 'Desconocido'),
-            n.get('views', '0'),
-            n.get('favorites', '0')
-        ) for n in offers
-    ]
-    
-    return "".join([str(item) for item in offers_text_array])
+    return "".join(iter_text_body(offers))
 
-def generate_html_item(item):
-    """Generate HTML for a single offer item.
+def generate_text_item(item):
+    """Generate the plain text block of a single offer (cached by content).
     
     Args:
         item: Dictionary containing product information
-        
+    
     Returns:
-        String containing HTML for a single product card
+        String containing the plain text block
     """
-    return f'''<div style="border: 1px solid #e0e0e0; padding: 10px; margin: 8px 0; background-color: #fff;">
-        <div style="display: flex; align-items: center;">
-            <div class="product-image" style="flex: 0 0 120px; margin-right: 12px; width: 120px; height: 120px; display: flex; align-items: center; justify-content: center; overflow: hidden;">
-                {f'<img src="{item.get("image_url")}" alt="{item["titulo"]}" style="width: 120px; height: 120px; object-fit: cover; border: 1px solid #f0f0f0;">' if item.get("image_url") else '<div style="width: 120px; height: 120px; background-color: #f7f7f7; display: flex; align-items: center; justify-content: center; text-align: center; color: #777; font-size: 12px;">No imagen</div>'}
-            </div>
-            <div class="product-info" style="flex: 1;">
-                <h2 style="margin-top: 0; margin-bottom: 4px; color: #000; font-size: 15px;"><a href="{item['enlace']}">{item['titulo']}</a></h2>
-                <div style="display: flex; align-items: center; margin-bottom: 6px;">
-                    <p style="font-size: 16px; font-weight: bold; color: #e4545e; margin: 0 12px 0 0;">{item['precio']}</p>
-                    <span style="font-size: 12px; color: {'#555' if item['reservada'] else '#2e7d32'};">{"Reservada" if item['reservada'] else "Disponible"}</span>
-                </div>
-                <div style="margin-top: 4px;">
-                    <p style="margin: 2px 0; font-size: 12px;"><strong>👤 {item.get('seller_name', 'Sin nombre')}</strong> | 📍 {item.get('location', 'Ubicación desconocida')}</p>
-                    <p style="margin: 2px 0; font-size: 12px;"><strong>⭐ {item.get('seller_rate', '0')}</strong> {item.get('seller_number_of_rates', '0')} valoraciones | 📊 {item.get('seller_sales', '0')}</p>
-                    <p style="margin: 2px 0; font-size: 12px;"><strong>🚚 Envío:</strong> {item.get('shipping', 'No')} | <strong>👔 Profesional:</strong> {item.get('seller_profesional', 'No')}</p>
-                    <p style="margin: 2px 0; font-size: 12px;">📈 {item.get('last_update', 'Desconocido')} | 👁️ {item.get('views', '0')} | ❤️ {item.get('favorites', '0')}</p>
-                </div>
-            </div>
-        </div>
-    </div>'''
+    fields = item_fields(item)
+    return text_fragments.get(fragment_key(fields), lambda: TEXT_ITEM_TEMPLATE.format(
+        estado="Reservada" if fields['reservada'] else "Disponible", **fields))
 
-def generate_html_body(offers, 
-                       title="Wallabot - do not reply", 
-                       intro="Hi! I'm Wallabot, your personal Wallapop assistant. I've found some new items that might interest you:", 
-                       footer="This tool is for personal use only. The author takes no responsibility for any illegal use of this software.\nMade by @eduardo-calzado with ❤️ for the Python community"):
-    """Generate HTML email body for offers with custom title and intro.
+def generate_text_items(offers):
+    """Generate plain text for a list of offers.
     
     Args:
         offers: List of offer dictionaries containing product information
-        title: Custom title for the email
-        intro: Introduction text for the email
-        footer: Optional footer text
-        
+    
     Returns:
-        String containing complete HTML email body
+        String containing one plain text block per offer
     """
-    # Generate HTML for each offer
-    offers_html = "".join([generate_html_item(offer) for offer in offers])
-    
-    # Combine with header and footer
-    html = f"""
+    return "".join(generate_text_item(offer) for offer in offers)
+
+# Styles shared by every product card, declared once in the <head> of the email
+# instead of being repeated inline on each card
+CARD_STYLES = """
+            .offer-card { border: 1px solid #e0e0e0; padding: 10px; margin: 8px 0; background-color: #fff; }
+            .offer-row { display: flex; align-items: center; }
+            .product-image { flex: 0 0 120px; margin-right: 12px; width: 120px; height: 120px; display: flex; align-items: center; justify-content: center; overflow: hidden; }
+            .product-image img { width: 120px; height: 120px; object-fit: cover; border: 1px solid #f0f0f0; }
+            .no-image { width: 120px; height: 120px; background-color: #f7f7f7; display: flex; align-items: center; justify-content: center; text-align: center; color: #777; font-size: 12px; }
+            .product-info { flex: 1; }
+            .product-info h2 { margin-top: 0; margin-bottom: 4px; color: #000; font-size: 15px; }
+            .price-line { display: flex; align-items: center; margin-bottom: 6px; }
+            .price { font-size: 16px; font-weight: bold; color: #e4545e; margin: 0 12px 0 0; }
+            .status { font-size: 12px; color: #2e7d32; }
+            .status.reserved { color: #555; }
+            .offer-meta { margin-top: 4px; }
+            .offer-meta p { margin: 2px 0; font-size: 12px; }"""
+
+HTML_ITEM_TEMPLATE = '''<div class="offer-card"><div class="offer-row">
+<div class="product-image">{image}</div>
+<div class="product-info">
+<h2><a href="{enlace}">{titulo}</a></h2>
+<div class="price-line"><p class="price">{precio}</p>{status}</div>
+<div class="offer-meta">
+<p><strong>👤 {seller_name}</strong> | 📍 {location}</p>
+<p><strong>⭐ {seller_rate}</strong> {seller_number_of_rates} valoraciones | 📊 {seller_sales}</p>
+<p><strong>🚚 Envío:</strong> {shipping} | <strong>👔 Profesional:</strong> {seller_profesional}</p>
+<p>📈 {last_update} | 👁️ {views} | ❤️ {favorites}</p>
+</div></div></div></div>'''
+
+HTML_IMAGE_TEMPLATE = '<img src="{image_url}" alt="{titulo}" width="120" height="120">'
+HTML_NO_IMAGE = '<div class="no-image">No imagen</div>'
+HTML_STATUS = {True: '<span class="status reserved">Reservada</span>', False: '<span class="status">Disponible</span>'}
+
+HTML_HEADING_TEMPLATE = '<h2 style="color: #000; font-size: 16px; margin: 14px 0 4px 0;">{search} ({count})</h2>'
+
+HTML_PAGE_HEAD_TEMPLATE = '''
     <html>
     <head>
         <meta name="color-scheme" content="light">
         <meta name="supported-color-schemes" content="light">
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <style type="text/css">
+        <style type="text/css">{styles}
             @media screen and (max-width: 480px) {{
                 .product-image {{
                     display: none !important;
@@ -108,12 +239,126 @@ def generate_html_body(offers,
             <h1 style="color: #000; border-bottom: 1px solid #e0e0e0; padding-bottom: 6px; font-size: 18px; margin-bottom: 8px; background-color: #fff !important;">{title}</h1>
             <p style="font-size: 13px; margin-bottom: 10px; background-color: #fff !important;">{intro}</p>
             <div style="background-color: #fff !important;">
-                {offers_html}
+                '''
+
+HTML_PAGE_TAIL_TEMPLATE = '''
             </div>
-            {f'<p style="margin-top: 12px; padding-top: 8px; border-top: 1px solid #e0e0e0; font-size: 11px; color: #777; background-color: #fff !important;">{footer}</p>' if footer else ''}
+            {footer}
         </div>
     </body>
     </html>
+    '''
+
+HTML_FOOTER_TEMPLATE = '<p style="margin-top: 12px; padding-top: 8px; border-top: 1px solid #e0e0e0; font-size: 11px; color: #777; background-color: #fff !important;">{footer}</p>'
+
+def render_html_item(fields):
+    """Fill the card template with the values of item_fields()."""
+    image = HTML_IMAGE_TEMPLATE.format(**fields) if fields['image_url'] else HTML_NO_IMAGE
+    return HTML_ITEM_TEMPLATE.format(image=image, status=HTML_STATUS[bool(fields['reservada'])], **fields)
+
+def generate_html_item(item):
+    """Generate HTML for a single offer item (cached by content).
+    
+    The card only carries class names; its styles are CARD_STYLES, included
+    once by generate_html_body().
+    
+    Args:
+        item: Dictionary containing product information
+    
+    Returns:
+        String containing HTML for a single product card
     """
+    fields = item_fields(item)
+    return html_fragments.get(fragment_key(fields), lambda: render_html_item(fields))
+
+def generate_html_heading(search, count):
+    """Generate the HTML heading of the offers of one search.
     
-    return html 
\ No newline at end of file
+    Args:
+        search: Search name
+        count: Number of offers listed under the heading
+    
+    Returns:
+        String containing the heading HTML
+    """
+    return HTML_HEADING_TEMPLATE.format(search=search, count=count)
+
+DEFAULT_TITLE = "Wallabot - do not reply"
+DEFAULT_INTRO = "Hi! I'm Wallabot, your personal Wallapop assistant. I've found some new items that might interest you:"
+DEFAULT_FOOTER = "This tool is for personal use only. The author takes no responsibility for any illegal use of this software.\nMade by @eduardo-calzado with ❤️ for the Python community"
+
+def iter_html_body(offers, title=DEFAULT_TITLE, intro=DEFAULT_INTRO, footer=DEFAULT_FOOTER):
+    """Stream the HTML email body for offers.
+    
+    Args:
+        offers: List of offer dictionaries containing product information
+        title: Custom title for the email
+        intro: Introduction text for the email
+        footer: Optional footer text
+    
+    Yields:
+        Consecutive parts of the HTML body
+    """
+    yield HTML_PAGE_HEAD_TEMPLATE.format(styles=CARD_STYLES, title=title, intro=intro)
+    # One card per offer, with a heading per search when there are several
+    for search, group in group_offers_by_search(offers):
+        if search:
+            yield generate_html_heading(search, len(group))
+        for offer in group:
+            yield generate_html_item(offer)
+    yield HTML_PAGE_TAIL_TEMPLATE.format(footer=HTML_FOOTER_TEMPLATE.format(footer=footer) if footer else '')
+
+def generate_html_body(offers,
+                       title=DEFAULT_TITLE,
+                       intro=DEFAULT_INTRO,
+                       footer=DEFAULT_FOOTER):
+    """Generate HTML email body for offers with custom title and intro.
+    
+    Args:
+        offers: List of offer dictionaries containing product information
+        title: Custom title for the email
+        intro: Introduction text for the email
+        footer: Optional footer text
+    
+    Returns:
+        String containing complete HTML email body
+    """
+    return "".join(iter_html_body(offers, title, intro, footer))
+
+def split_offers(offers, max_bytes, **body_args):
+    """Split offers into groups whose HTML email body stays under a byte budget.
+    
+    Mail clients clip long emails (Gmail past about 100 KB of HTML), hiding
+    the offers at the end. Offers keep their order; one whose card alone
+    exceeds the budget gets an email of its own. The cards rendered to
+    measure them are cached, so building the emails does not render them again.
+    
+    Args:
+        offers: List of offer dictionaries containing product information
+        max_bytes: Maximum size of the HTML body in bytes (0 = no limit)
+        body_args: Title, intro and footer passed to generate_html_body()
+    
+    Returns:
+        List of offer lists, one per email
+    """
+    if not max_bytes or not offers:
+        return [offers] if offers else []
+    base = len(generate_html_body([], **body_args).encode('utf-8'))
+    heading = len(generate_html_heading('', len(offers)).encode('utf-8'))
+    groups = []
+    group, searches, size = [], set(), base
+    for offer in offers:
+        card = len(generate_html_item(offer).encode('utf-8'))
+        search = offer.get('search')
+        # Headings are only shown for several searches; count them anyway to stay under budget
+        label = heading + len(str(search).encode('utf-8'))
+        if group and size + card + (0 if search in searches else label) > max_bytes:
+            groups.append(group)
+            group, searches, size = [], set(), base
+        if search not in searches:
+            searches.add(search)
+            size += label
+        group.append(offer)
+        size += card
+    groups.append(group)
+    return groups
@@ -0,0 +1,234 @@
+#!/usr/bin/python
+"""
+Batched DOM extraction for Wallabot.
+
+Reading a field with find_element() costs one HTTP round trip to chromedriver,
+and a missing element costs an exception on top. This module describes every
+field as an ordered list of selector strategies (the spec) and evaluates the
+whole spec inside the page with a single execute_script() call: one call for
+all the cards of the search results, one call per detail page.
+
+A strategy is a dictionary with:
+    css: CSS selector, relative to the card or the document (None = the card itself)
+    child: Optional selector applied inside the matched element
+    sibling: 'previous' to read the span right before the matched element
+    read: 'text' (default), 'exists' or the name of an attribute/property
+    fallback: True for a broader selector that may match other content; it is
+        only tried after the strategies listed before it, never promoted ahead
+
+The first strategy producing a non-empty value wins. The same spec can be
+evaluated with find_elements() when scripts cannot run.
+"""
+import logging
+
+from selenium.webdriver.common.by import By
+
+logger = logging.getLogger(__name__)
+
+# Selector of every item card on the search results page
+CARD_SELECTOR = '.ItemCardList__item'
+
+# Card fields, evaluated relative to each card element
+CARD_FIELDS = {
+    'price': [{'css': '.ItemCard__price'}],
+    'title': [{'css': '.ItemCard__title'}],
+    'href': [{'css': None, 'read': 'href'}],
+    'image_url': [{'css': 'img', 'read': 'src'}],
+    'reserved': [{'css': '.ItemCard__badge', 'read': 'exists'}],
+}
+
+# Detail page fields, evaluated relative to the document
+DETAIL_FIELDS = {
+    'last_update': [{'css': 'span[class*="ItemDetailStats__description"]'}],
+    'views': [{'css': 'span[aria-label="Views"]'}],
+    'favorites': [{'css': 'span[aria-label="Favorites"]'}],
+    'image_url': [
+        {'css': 'img.ImageSlider__image', 'read': 'src'},
+        {'css': 'div.detail-gallery img', 'read': 'src'},
+        {'css': 'img.detail-image', 'read': 'src'},
+    ],
+    'shipping': [{'css': 'section[class*="item-detail_ItemDetail"] wallapop-badge[badge-type="shippingAvailable"]',
+                  'read': 'exists'}],
+    'profesional': [{'css': 'wallapop-badge[aria-label="Seller is professional"]', 'read': 'exists'}],
+    'sales': [{'css': 'span[data-testid="sellsCounter"]'}],
+    'number_of_rates': [
+        {'css': '[data-testid="reviewsCounter"]'},
+        {'css': 'a[href="#item-detail-reviews"]', 'fallback': True},
+    ],
+    'rate': [{'css': '[data-testid="reviewsCounter"]', 'sibling': 'previous'}],
+    'name': [{'css': 'h3[class*="item-detail-header"]'}],
+    'location': [
+        {'css': 'div[class*="item-detail-location"]', 'child': 'a'},
+        {'css': 'walla-icon[icon="location"] span'},
+        {'css': '.ItemDetail__location'},
+    ],
+}
+
+# Evaluates a spec inside the page. Each field resolves to {value, index}, where
+# index is the position of the winning strategy (-1 when nothing matched).
+_SPEC_JS = """
+function readStrategy(root, s) {
+    let el = s.css ? root.querySelector(s.css) : root;
+    if (!el) return null;
+    if (s.child) {
+        el = el.querySelector(s.child);
+        if (!el) return null;
+    }
+    if (s.sibling === 'previous') {
+        const spans = el.parentElement ? Array.from(el.parentElement.querySelectorAll('span')) : [];
+        const pos = spans.indexOf(el);
+        if (pos < 1) return null;
+        el = spans[pos - 1];
+    }
+    const read = s.read || 'text';
+    if (read === 'exists') return true;
+    let value;
+    if (read === 'text') {
+        value = el.innerText || '';
+    } else {
+        value = typeof el[read] === 'string' ? el[read] : (el.getAttribute(read) || '');
+    }
+    value = value.trim();
+    return value ? value : null;
+}
+function readFields(root, spec) {
+    const out = {};
+    for (const [field, strategies] of Object.entries(spec)) {
+        out[field] = {value: null, index: -1};
+        for (let i = 0; i < strategies.length; i++) {
+            const value = readStrategy(root, strategies[i]);
+            if (value !== null) {
+                out[field] = {value: value, index: i};
+                break;
+            }
+        }
+    }
+    return out;
+}
+"""
+
+_CARDS_JS = _SPEC_JS + """
+const cards = document.querySelectorAll(arguments[0]);
+const offset = arguments[3] || 0;
+const end = arguments[2] == null ? undefined : offset + arguments[2];
+return {
+    total: cards.length,
+    cards: Array.from(cards).slice(offset, end).map(card => readFields(card, arguments[1]))
+};
+"""
+
+# Clicks the "load more" button under the first page of results, or scrolls to
+# the bottom once it is gone (further pages load on infinite scroll)
+_LOAD_MORE_JS = """
+const button = Array.from(document.querySelectorAll('button, walla-button'))
+    .find(el => /cargar más|load more/i.test(el.innerText || el.getAttribute('text') || ''));
+if (button) {
+    button.click();
+    return 'button';
+}
+window.scrollTo(0, document.body.scrollHeight);
+return 'scroll';
+"""
+
+_DETAIL_JS = _SPEC_JS + """
+return readFields(document, arguments[0]);
+"""
+
+
+def _read_with_finders(root, strategy):
+    """Evaluate one strategy with find_elements() (no exceptions for missing elements)."""
+    el = root
+    if strategy.get('css'):
+        found = root.find_elements(By.CSS_SELECTOR, strategy['css'])
+        if not found:
+            return None
+        el = found[0]
+    if strategy.get('child'):
+        found = el.find_elements(By.CSS_SELECTOR, strategy['child'])
+        if not found:
+            return None
+        el = found[0]
+    if strategy.get('sibling') == 'previous':
+        spans = el.find_element(By.XPATH, '..').find_elements(By.TAG_NAME, 'span')
+        pos = next((i for i, span in enumerate(spans) if span == el), -1)
+        if pos < 1:
+            return None
+        el = spans[pos - 1]
+    read = strategy.get('read', 'text')
+    if read == 'exists':
+        return True
+    value = el.text if read == 'text' else el.get_attribute(read)
+    value = (value or '').strip()
+    return value or None
+
+
+def _read_fields_with_finders(root, spec):
+    """Evaluate a whole spec with find_elements(), mirroring readFields() in _SPEC_JS."""
+    out = {}
+    for field, strategies in spec.items():
+        out[field] = {'value': None, 'index': -1}
+        for index, strategy in enumerate(strategies):
+            try:
+                value = _read_with_finders(root, strategy)
+            except Exception:
+                value = None
+            if value is not None:
+                out[field] = {'value': value, 'index': index}
+                break
+    return out
+
+
+def extract_cards(driver, limit, spec=None, offset=0):
+    """Extract the fields of the search result cards.
+
+    Args:
+        driver: Selenium WebDriver instance showing the search results
+        limit: Maximum number of cards to extract (None for all of them)
+        spec: Card field spec (defaults to CARD_FIELDS)
+        offset: Number of cards to skip (e.g. those read before loading more)
+
+    Returns:
+        Tuple of (total number of cards on the page, list of field dictionaries
+        mapping each field to {'value': ..., 'index': ...})
+    """
+    spec = spec or CARD_FIELDS
+    try:
+        data = driver.execute_script(_CARDS_JS, CARD_SELECTOR, spec, limit, offset)
+        return data['total'], data['cards']
+    except Exception as e:
+        logger.warning(f"Batched card extraction failed, falling back to element lookups: {e}")
+    cards = driver.find_elements(By.CSS_SELECTOR, CARD_SELECTOR)
+    end = None if limit is None else offset + limit
+    return len(cards), [_read_fields_with_finders(card, spec) for card in cards[offset:end]]
+
+
+def count_cards(driver):
+    """Number of search result cards on the page."""
+    return len(driver.find_elements(By.CSS_SELECTOR, CARD_SELECTOR))
+
+
+def load_more_cards(driver):
+    """Ask the search results page for its next page of cards.
+
+    Returns:
+        'button' if the "load more" button was clicked, 'scroll' if the page was scrolled down
+    """
+    return driver.execute_script(_LOAD_MORE_JS)
+
+
+def extract_detail(driver, spec=None):
+    """Extract the fields of a product detail page.
+
+    Args:
+        driver: Selenium WebDriver instance showing a product page
+        spec: Detail field spec (defaults to DETAIL_FIELDS)
+
+    Returns:
+        Dictionary mapping each field to {'value': ..., 'index': ...}
+    """
+    spec = spec or DETAIL_FIELDS
+    try:
+        return driver.execute_script(_DETAIL_JS, spec)
+    except Exception as e:
+        logger.warning(f"Batched detail extraction failed, falling back to element lookups: {e}")
+    return _read_fields_with_finders(driver, spec)
@@ -0,0 +1,121 @@
+#!/usr/bin/python
+"""
+Concurrent detail lookups for Wallabot.
+
+Looking items up one at a time leaves the connection idle while each response
+is parsed and the next request is built. This engine runs a backend's
+get_details() for many items on an asyncio event loop, at most `concurrency`
+at a time (guarded by a semaphore), and yields every result as soon as it
+arrives so callers can filter and keep valid items without waiting for the
+slowest lookup. The latency of every lookup is recorded and summarized as
+percentiles.
+
+The blocking get_details() calls run in worker threads via asyncio.to_thread,
+so the backend must be safe to call from several threads at once.
+"""
+import asyncio
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyStats:
+    """Collect lookup latencies and report percentiles."""
+
+    def __init__(self):
+        self.samples = []
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, pct):
+        """Return the nearest-rank percentile of the samples (0 if there are none)."""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        rank = max(1, math.ceil(pct / 100 * len(ordered)))
+        return ordered[rank - 1]
+
+    def summary(self):
+        """One-line summary with count, p50, p90, p99 and max latency."""
+        if not self.samples:
+            return "no lookups"
+        return (f"{len(self.samples)} lookups, p50 {self.percentile(50):.3f}s, "
+                f"p90 {self.percentile(90):.3f}s, p99 {self.percentile(99):.3f}s, "
+                f"max {max(self.samples):.3f}s")
+
+
+async def _lookup(backend, index, item, semaphore, stats):
+    async with semaphore:
+        start = perf_counter()
+        try:
+            result = await asyncio.to_thread(backend.get_details, item)
+        except Exception as e:
+            logger.error(f"Detail lookup failed for {item.get('enlace')}: {e}")
+            result = None
+        stats.record(perf_counter() - start)
+        return index, result
+
+
+async def fetch_details(backend, items, concurrency, stats):
+    """Look up the details of items concurrently, yielding them as they complete.
+
+    Args:
+        backend: FetchBackend whose get_details() is thread-safe
+        items: List of item dictionaries
+        concurrency: Maximum number of lookups in flight
+        stats: LatencyStats receiving the latency of every lookup
+
+    Yields:
+        Tuples of (index of the item in items, seller info dictionary or None)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [asyncio.ensure_future(_lookup(backend, index, item, semaphore, stats))
+             for index, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # The consumer stopped early: drop the lookups that did not start yet
+        for task in tasks:
+            task.cancel()
+
+
+def iter_details(backend, items, concurrency=8):
+    """Synchronous front end of fetch_details() for the scraping loop.
+
+    Runs a private event loop with a thread pool sized to the concurrency and
+    logs the latency percentiles once every item was looked up.
+
+    Args:
+        backend: FetchBackend whose get_details() is thread-safe
+        items: List of item dictionaries
+        concurrency: Maximum number of lookups in flight
+
+    Yields:
+        Tuples of (index of the item in items, seller info dictionary or None)
+        in completion order
+    """
+    if not items:
+        return
+    concurrency = max(1, min(concurrency, len(items)))
+    stats = LatencyStats()
+    loop = asyncio.new_event_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='detail'))
+    results = fetch_details(backend, items, concurrency, stats)
+    start = perf_counter()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(results.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(results.aclose())
+        loop.run_until_complete(loop.shutdown_default_executor())
+        loop.close()
+        logger.info(f"Detail lookups with concurrency {concurrency}: {stats.summary()}, "
+                    f"wall time {perf_counter() - start:.2f}s")
@@ -0,0 +1,305 @@
+#!/usr/bin/python
+"""
+Offer filters for Wallabot.
+
+Every filter is a predicate declared in PREDICATES together with the level of
+data it needs and its relative cost:
+
+- 'card' predicates only read what the search results show (price, title,
+  reserved badge), so items they reject never have their detail page loaded.
+- 'detail' predicates need the seller info of the product page or API,
+  merged into the Offer.
+
+Predicates read the numbers an Offer parsed once from its display strings
+(price, rate, sales, rating count) instead of parsing text themselves.
+
+Predicates of each level run cheapest first and stop at the first rejection.
+Their thresholds are the settings in config.py (overridable per search), so
+a predicate whose setting is unset never rejects anything. Rejections are
+counted per predicate, together with the detail visits the card-level ones
+saved, and summarized at the end of the run.
+
+The same predicates are used by every fetch backend, so items are judged the
+same way whether their seller info came from a rendered product page or from
+the JSON API.
+"""
+import logging
+import re
+import threading
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+
+def parse_price(text):
+    """Parse a displayed price ("1.234,56 €", "550€", "549.99") into a float.
+
+    Returns:
+        Price as a float, or None if no number was found
+    """
+    if text is None:
+        return None
+    if isinstance(text, (int, float)):
+        return float(text)
+    match = re.search(r'\d[\d.,]*', str(text))
+    if not match:
+        return None
+    number = match.group(0).rstrip('.,')
+    if ',' in number:
+        # Spanish format: dots group thousands, the comma is the decimal separator
+        number = number.replace('.', '').replace(',', '.')
+    elif number.count('.') > 1 or re.search(r'\.\d{3}$', number):
+        number = number.replace('.', '')
+    try:
+        return float(number)
+    except ValueError:
+        return None
+
+
+def parse_count(text):
+    """Parse a displayed counter ("(290)", "1.234", "12 ventas") into an int.
+
+    Raises:
+        ValueError, TypeError, IndexError: If the text holds no count
+    """
+    # Get first part before any space, remove parentheses and thousands separators
+    cleaned = text.split()[0].replace("(", "").replace(")", "")
+    return int(cleaned.replace(".", "").replace(",", ""))
+
+
+def normalize_text(text):
+    """Lowercase text and strip accents, for keyword matching."""
+    text = unicodedata.normalize('NFKD', str(text or '').casefold())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+class FilterStats:
+    """Thread-safe counters of rejections per predicate."""
+
+    def __init__(self):
+        self.rejected = {}
+        self.visits_saved = {}
+        self._lock = threading.Lock()
+
+    def record(self, predicate, visit_saved=False):
+        with self._lock:
+            self.rejected[predicate] = self.rejected.get(predicate, 0) + 1
+            if visit_saved:
+                self.visits_saved[predicate] = self.visits_saved.get(predicate, 0) + 1
+
+    def log_summary(self):
+        """Log how many items each predicate rejected and the visits it saved."""
+        with self._lock:
+            rejected = dict(self.rejected)
+            saved = dict(self.visits_saved)
+        if not rejected:
+            return
+        logger.info(f"Filters: {sum(rejected.values())} items rejected, "
+                    f"{sum(saved.values())} detail visits saved by card-level filters")
+        for predicate in PREDICATES:
+            if predicate.name in rejected:
+                extra = f", {saved.get(predicate.name, 0)} visits saved" if predicate.level == 'card' else ""
+                logger.info(f"  {predicate.name} ({predicate.level}): {rejected[predicate.name]} rejected{extra}")
+
+
+# Rejections of the current process
+stats = FilterStats()
+
+
+class Predicate:
+    """One declarative filter.
+
+    Args:
+        name: Name used in logs and statistics
+        level: 'card' (search result data) or 'detail' (seller info)
+        cost: Relative evaluation cost; cheaper predicates run first
+        check: Callable (record, found, setting, label) returning a skip reason or None
+        fields: Seller info fields the check only applies when found
+    """
+
+    def __init__(self, name, level, cost, check, fields=()):
+        self.name = name
+        self.level = level
+        self.cost = cost
+        self.check = check
+        self.fields = tuple(fields)
+
+
+def _reserved(item, found, setting, label):
+    if item.get('reservada') and setting('SKIP_RESERVED_ITEMS', False):
+        logger.info(f"Skipping reserved item: {label}")
+        return "reserved"
+    return None
+
+
+def _price_range(item, found, setting, label):
+    min_price = setting('MIN_PRICE', None)
+    max_price = setting('MAX_PRICE', None)
+    if min_price is None and max_price is None:
+        return None
+    price = item.price
+    if price is None:
+        # Unknown prices are left to the detail-level filters
+        return None
+    if min_price is not None and price < min_price:
+        logger.info(f"Skipping item below MIN_PRICE ({price:g} < {min_price}): {label}")
+        return "price below minimum"
+    if max_price is not None and price > max_price:
+        logger.info(f"Skipping item above MAX_PRICE ({price:g} > {max_price}): {label}")
+        return "price above maximum"
+    return None
+
+
+def _title_keywords(item, found, setting, label):
+    include = setting('TITLE_INCLUDE_KEYWORDS', None) or []
+    exclude = setting('TITLE_EXCLUDE_KEYWORDS', None) or []
+    if not include and not exclude:
+        return None
+    title = normalize_text(item.titulo)
+    for keyword in exclude:
+        if normalize_text(keyword) in title:
+            logger.info(f"Skipping item with excluded keyword '{keyword}': {label}")
+            return "excluded keyword"
+    if include and not any(normalize_text(keyword) in title for keyword in include):
+        logger.info(f"Skipping item without any required keyword: {label}")
+        return "missing keyword"
+    return None
+
+
+def _professional(offer, found, setting, label):
+    # Skip professional sellers if configured
+    if offer.seller_profesional == "Sí" and setting('SKIP_PROFESIONAL_SELLER', False):
+        logger.info(f"Skipping item from professional seller: {label}")
+        return "professional seller"
+    return None
+
+
+def _shipping(offer, found, setting, label):
+    # If shipping is required but this item doesn't have it
+    if setting('SHIPPING_REQUIRED', False) and offer.shipping != "Sí":
+        logger.info(f"Skipping item without shipping: {label}")
+        return "no shipping"
+    return None
+
+
+def _seller_rate(offer, found, setting, label):
+    min_rate = setting('SKIP_WITH_LESS_THAN_SELLER_RATE', 0)
+    if not min_rate or "rate" not in found:
+        return None
+    rate = offer.rate
+    if rate is None:
+        # Sellers without reviews show no rate; leave them to the rating count filter
+        logger.debug(f"Could not parse seller rate: {offer.seller_rate}")
+        return None
+    if rate < min_rate:
+        logger.info(f"Skipping item with low seller rate ({rate:g} < {min_rate}): {label}")
+        return "low seller rate"
+    return None
+
+
+def _sales(offer, found, setting, label):
+    # Check if we should skip items with low sales counts
+    min_sales = setting('SKIP_WITH_LESS_THAN_SALES_NUMBER', 0)
+    if min_sales > 0 and "sales" in found:
+        sales_count = offer.sales
+        if sales_count is None:
+            # If we can't parse the sales count, assume it's lower than minimum
+            logger.info(f"Skipping item with unparseable sales count: {offer.seller_sales}")
+            return "unparseable sales count"
+        if sales_count < min_sales:
+            logger.info(f"Skipping item with too few sales ({sales_count} < {min_sales}): {label}")
+            return "too few sales"
+    return None
+
+
+def _rating_count(offer, found, setting, label):
+    # Check if we should skip items with low rating counts
+    min_ratings = setting('SKIP_WITH_LESS_THAN_RATING_COUNTER', 0)
+    if min_ratings > 0 and "number_of_rates" in found:
+        rating_count = offer.rating_count
+        if rating_count is None:
+            # If we can't parse the rating count, assume it's lower than minimum
+            logger.info(f"Skipping item with unparseable rating count: {offer.seller_number_of_rates}")
+            return "unparseable rating count"
+        if rating_count < min_ratings:
+            logger.info(f"Skipping item with too few ratings ({rating_count} < {min_ratings}): {label}")
+            return "too few ratings"
+    return None
+
+
+# Every filter, by level and cost (cheapest first within a level)
+PREDICATES = sorted([
+    Predicate('reserved', 'card', 1, _reserved),
+    Predicate('price range', 'card', 2, _price_range),
+    Predicate('title keywords', 'card', 3, _title_keywords),
+    Predicate('professional seller', 'detail', 1, _professional),
+    Predicate('shipping', 'detail', 1, _shipping),
+    Predicate('seller rate', 'detail', 2, _seller_rate, fields=('rate',)),
+    Predicate('sales', 'detail', 3, _sales, fields=('sales',)),
+    Predicate('rating count', 'detail', 3, _rating_count, fields=('number_of_rates',)),
+], key=lambda p: (p.level != 'card', p.cost))
+
+# Detail fields the filters depend on; the selector registry must never stop reading them
+FILTER_FIELDS = frozenset(field for predicate in PREDICATES for field in predicate.fields)
+
+
+def evaluate(level, record, found, setting, label):
+    """Run the predicates of one level, cheapest first, until one rejects.
+
+    Args:
+        level: 'card' or 'detail'
+        record: Offer (with its seller info merged in for the detail level)
+        found: Set of seller info fields that were present in the source
+        setting: Callable (name, default) returning a setting value
+        label: Text identifying the item in log messages
+
+    Returns:
+        Tuple of (predicate name, skip reason), or None if the record passed
+    """
+    for predicate in PREDICATES:
+        if predicate.level != level:
+            continue
+        reason = predicate.check(record, found, setting, label)
+        if reason:
+            return predicate.name, reason
+    return None
+
+
+def apply_card_filters(item, setting, visit_saved=True):
+    """Apply the card-level filters to an item of the search results.
+
+    Args:
+        item: Offer from the search results
+        setting: Callable (name, default) returning a setting value
+        visit_saved: Whether a rejection spares a detail visit (False for items
+            the history would have skipped anyway)
+
+    Returns:
+        Skip reason, or None if the item must be checked further
+    """
+    rejection = evaluate('card', item, set(), setting, item.titulo)
+    if rejection is None:
+        return None
+    stats.record(rejection[0], visit_saved=visit_saved)
+    return rejection[1]
+
+
+def apply_detail_filters(offer, found, setting, label):
+    """Apply the detail-level filters to an Offer completed with its seller info.
+
+    Count filters only apply to values that were actually found.
+
+    Args:
+        offer: Offer with the seller info merged in (see Offer.apply_seller_info)
+        found: Set of seller info fields that were present in the source
+        setting: Callable (name, default) returning a setting value
+        label: Text identifying the item in log messages
+
+    Returns:
+        Skip reason, or None if the item passed every filter
+    """
+    rejection = evaluate('detail', offer, found, setting, label)
+    if rejection is None:
+        return None
+    stats.record(rejection[0])
+    return rejection[1]
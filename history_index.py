@@ -0,0 +1,256 @@
+#!/usr/bin/python
+"""
+Compact memory-mapped history index for Wallabot.
+
+Every offer URL is canonicalized to its Wallapop item ID and stored as a
+fixed-width 64-bit hash in a sorted file. The file is memory-mapped and
+searched with bisect, so opening a history of millions of items costs
+nothing up front and only the pages touched by lookups are read into memory.
+New hashes collect in an in-memory delta and are merged into the file when
+the index is flushed.
+
+File layout: 8-byte magic header followed by sorted native-endian uint64 values.
+"""
+import bisect
+import hashlib
+import heapq
+import logging
+import mmap
+import os
+from array import array
+from datetime import datetime
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'WBIDX1\x00\x00'
+HEADER_SIZE = len(MAGIC)
+
+# Number of hashes written per chunk when merging the delta into the file
+WRITE_CHUNK_SIZE = 65536
+
+
+def canonical_item_id(url):
+    """Reduce a Wallapop offer URL to the item ID it points to.
+
+    URL variants of the same listing (other hosts, query strings, fragments,
+    trailing slashes, slug changes) all map to the same ID.
+
+    Args:
+        url: Offer URL
+
+    Returns:
+        Item ID string ('item:<id>'), or the normalized URL for non-item links
+    """
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip('/').lower()
+    if '/item/' in path:
+        slug = path.rsplit('/item/', 1)[1].split('/')[0]
+        # Slugs end with the numeric item ID: playstation-5-digital-edition-1234567890
+        tail = slug.rsplit('-', 1)[-1]
+        return f"item:{tail if tail.isdigit() else slug}"
+    return f"{parts.netloc.lower()}{path}"
+
+
+def item_hash(url, namespace=''):
+    """Hash an offer URL to a 64-bit integer via its canonical item ID.
+
+    Args:
+        url: Offer URL
+        namespace: Optional prefix keeping separate histories apart
+
+    Returns:
+        Unsigned 64-bit integer
+    """
+    key = f"{namespace}|{canonical_item_id(url)}".encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+class SortedHashIndex:
+    """Sorted uint64 file with binary-search lookups and an in-memory delta.
+
+    Args:
+        path: Index file (created if missing)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.delta = set()
+        self._file = None
+        self._mmap = None
+        self._values = []
+        if not os.path.exists(path):
+            os.replace(self._write([]), path)
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:HEADER_SIZE] != MAGIC:
+            raise ValueError(f"{self.path} is not a Wallabot history index")
+        self._values = memoryview(self._mmap)[HEADER_SIZE:].cast('Q')
+
+    def _close_map(self):
+        if isinstance(self._values, memoryview):
+            self._values.release()
+        self._values = []
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, values):
+        """Write sorted values to a temporary file and return its path."""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            chunk = array('Q')
+            for value in values:
+                chunk.append(value)
+                if len(chunk) >= WRITE_CHUNK_SIZE:
+                    chunk.tofile(f)
+                    chunk = array('Q')
+            chunk.tofile(f)
+        return tmp_path
+
+    def __len__(self):
+        return len(self._values) + len(self.delta)
+
+    def __contains__(self, value):
+        if value in self.delta:
+            return True
+        pos = bisect.bisect_left(self._values, value)
+        return pos < len(self._values) and self._values[pos] == value
+
+    def add(self, value):
+        """Add a hash to the in-memory delta (no-op if already indexed)."""
+        if value not in self:
+            self.delta.add(value)
+
+    def flush(self):
+        """Merge the in-memory delta into the sorted file."""
+        if not self.delta:
+            return
+        added = len(self.delta)
+        # The merge streams from the current map, so write before closing it
+        tmp_path = self._write(heapq.merge(self._values, sorted(self.delta)))
+        self._close_map()
+        os.replace(tmp_path, self.path)
+        self.delta = set()
+        self._open()
+        logger.debug(f"Merged {added} new hashes into {self.path} ({len(self._values)} total)")
+
+    def close(self):
+        """Flush pending hashes and release the memory map."""
+        self.flush()
+        self._close_map()
+
+
+class IndexHistoryStore:
+    """History store backed by two memory-mapped hash indexes.
+
+    Offers the same interface as HistoryStore, but only remembers membership:
+    skip reasons and timestamps are not kept.
+
+    Args:
+        directory: Directory holding seen_index.bin, skipped_index.bin and the
+            legacy_imported marker
+        legacy_offers_file: JSON history of notified offers imported on first use
+        legacy_skipped_file: JSON history of skipped items imported on first use
+        legacy_db: SQLite history imported on first use
+    """
+
+    def __init__(self, directory='.', legacy_offers_file='offers_history.json',
+                 legacy_skipped_file='skipped_items_history.json',
+                 legacy_db='wallabot_history.db'):
+        self.path = directory
+        seen_path = os.path.join(directory, 'seen_index.bin')
+        skipped_path = os.path.join(directory, 'skipped_index.bin')
+        self.seen = SortedHashIndex(seen_path)
+        self.skipped = SortedHashIndex(skipped_path)
+        # The marker is only written once the import succeeded, so an interrupted
+        # or failed import runs again on the next start (re-adding hashes is a no-op)
+        self._imported_marker = os.path.join(directory, 'legacy_imported')
+        if not os.path.exists(self._imported_marker):
+            self._import_legacy(legacy_offers_file, legacy_skipped_file, legacy_db)
+
+    def _import_legacy(self, offers_file, skipped_file, db_path):
+        """One-shot import of the JSON and SQLite histories.
+
+        Returns:
+            True if the import completed and was recorded, False if it will be retried
+        """
+        from history_store import HistoryStore
+        seen, skipped = [], []
+        for path in (offers_file, skipped_file):
+            urls = HistoryStore._load_json_urls(path)
+            (seen if path == offers_file else skipped).extend(urls)
+        if db_path and os.path.exists(db_path):
+            import sqlite3
+            try:
+                conn = sqlite3.connect(db_path)
+                for row in conn.execute("SELECT search, url FROM seen_offers"):
+                    self.seen.add(item_hash(row[1], row[0]))
+                for row in conn.execute("SELECT search, url FROM skipped_items"):
+                    self.skipped.add(item_hash(row[1], row[0]))
+                conn.close()
+            except Exception as e:
+                logger.error(f"Error reading legacy history database {db_path}, "
+                             f"the import will be retried on the next start: {e}")
+                return False
+        self.add_seen(seen)
+        self.add_skipped({url: None for url in skipped})
+        self.seen.flush()
+        self.skipped.flush()
+        with open(self._imported_marker, 'w') as f:
+            f.write(datetime.now().isoformat())
+        if seen or skipped:
+            logger.info(f"Imported {len(seen)} seen offers and {len(skipped)} skipped items into the history index")
+        return True
+
+    @staticmethod
+    def _members(index, urls, namespace):
+        return {url for url in urls if item_hash(url, namespace) in index}
+
+    def seen_among(self, urls, namespace=''):
+        """Return which of the given URLs were already notified."""
+        return self._members(self.seen, urls, namespace)
+
+    def skipped_among(self, urls, namespace=''):
+        """Return which of the given URLs were previously filtered out."""
+        return self._members(self.skipped, urls, namespace)
+
+    def add_seen(self, urls, seen_at=None, namespace=''):
+        """Record offers as seen."""
+        for url in urls:
+            self.seen.add(item_hash(url, namespace))
+
+    def add_skipped(self, reasons, seen_at=None, namespace=''):
+        """Record filtered items (reasons are not stored by this backend)."""
+        for url in reasons:
+            self.skipped.add(item_hash(url, namespace))
+
+    def count_seen(self, namespace=None):
+        """Number of offers in the seen history (hashes cannot be counted per search)."""
+        return len(self.seen)
+
+    def count_skipped(self, namespace=None):
+        """Number of items in the skipped history (hashes cannot be counted per search)."""
+        return len(self.skipped)
+
+    def namespace(self, name):
+        """Return a view of the history of one search."""
+        from history_store import HistoryNamespace
+        return HistoryNamespace(self, name)
+
+    def flush(self):
+        """Write the entries added since the last flush to the index files."""
+        self.seen.flush()
+        self.skipped.flush()
+
+    def close(self):
+        """Write pending entries and release the indexes."""
+        self.seen.close()
+        self.skipped.close()
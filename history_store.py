@@ -0,0 +1,289 @@
+#!/usr/bin/python
+"""
+SQLite-backed history store for Wallabot.
+
+Keeps the offers that were already notified and the items that were filtered
+out in one indexed database, namespaced per search. Membership checks are primary-key lookups and new
+URLs are inserted incrementally, so the cost of a run no longer grows with the
+size of the history the way loading and rewriting whole JSON files did.
+
+Run this module directly to import the legacy JSON history files by hand:
+
+    python3 history_store.py [offers_history.json] [skipped_items_history.json]
+"""
+import datetime
+import json
+import logging
+import os
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen_offers (
+    search TEXT NOT NULL DEFAULT '',
+    url TEXT NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    PRIMARY KEY (search, url)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS skipped_items (
+    search TEXT NOT NULL DEFAULT '',
+    url TEXT NOT NULL,
+    reason TEXT,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    PRIMARY KEY (search, url)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+) WITHOUT ROWID;
+"""
+
+# SQLite limits the number of host parameters per statement
+QUERY_CHUNK_SIZE = 500
+
+
+def _now():
+    """Current local time as an ISO string (seconds precision)."""
+    return datetime.datetime.now().isoformat(timespec='seconds')
+
+
+class HistoryStore:
+    """Seen offers and skipped items stored in SQLite.
+
+    Args:
+        path: Database file
+        legacy_offers_file: JSON history of notified offers imported on first use
+        legacy_skipped_file: JSON history of skipped items imported on first use
+    """
+
+    def __init__(self, path='wallabot_history.db',
+                 legacy_offers_file='offers_history.json',
+                 legacy_skipped_file='skipped_items_history.json'):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self._migrate()
+        self.conn.executescript(SCHEMA)
+        if self._get_meta('json_imported') is None:
+            self.import_json(legacy_offers_file, legacy_skipped_file)
+
+    def _migrate(self):
+        """Move tables created before searches were namespaced into the '' namespace."""
+        for table in ('seen_offers', 'skipped_items'):
+            columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")]
+            if columns and 'search' not in columns:
+                logger.info(f"Migrating {table} in {self.path} to per-search history")
+                with self.conn:
+                    self.conn.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+                    self.conn.executescript(SCHEMA)
+                    names = ", ".join(columns)
+                    self.conn.execute(f"INSERT INTO {table} ({names}) SELECT {names} FROM {table}_old")
+                    self.conn.execute(f"DROP TABLE {table}_old")
+
+    def _get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _members(self, table, urls, namespace):
+        """Return the subset of urls present in a table for one search."""
+        urls = list(urls)
+        found = set()
+        for i in range(0, len(urls), QUERY_CHUNK_SIZE):
+            chunk = urls[i:i + QUERY_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT url FROM {table} WHERE search = ? AND url IN ({placeholders})",
+                [namespace] + chunk
+            )
+            found.update(row[0] for row in rows)
+        return found
+
+    def seen_among(self, urls, namespace=''):
+        """Return which of the given URLs were already notified.
+
+        Args:
+            urls: Iterable of offer URLs
+            namespace: Search the history belongs to
+
+        Returns:
+            Set of URLs present in the seen offers history
+        """
+        return self._members('seen_offers', urls, namespace)
+
+    def skipped_among(self, urls, namespace=''):
+        """Return which of the given URLs were previously filtered out.
+
+        Args:
+            urls: Iterable of offer URLs
+            namespace: Search the history belongs to
+
+        Returns:
+            Set of URLs present in the skipped items history
+        """
+        return self._members('skipped_items', urls, namespace)
+
+    def add_seen(self, urls, seen_at=None, namespace=''):
+        """Record offers as seen, updating last_seen for known ones.
+
+        Args:
+            urls: Iterable of offer URLs
+            seen_at: Optional ISO timestamp (defaults to now)
+            namespace: Search the history belongs to
+        """
+        now = seen_at or _now()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO seen_offers (search, url, first_seen, last_seen) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(search, url) DO UPDATE SET last_seen = excluded.last_seen",
+                ((namespace, url, now, now) for url in urls)
+            )
+
+    def add_skipped(self, reasons, seen_at=None, namespace=''):
+        """Record filtered items together with why they were skipped.
+
+        Args:
+            reasons: Dictionary of URL -> reason (None keeps the stored reason)
+            seen_at: Optional ISO timestamp (defaults to now)
+            namespace: Search the history belongs to
+        """
+        now = seen_at or _now()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO skipped_items (search, url, reason, first_seen, last_seen) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(search, url) DO UPDATE SET last_seen = excluded.last_seen, "
+                "reason = COALESCE(excluded.reason, skipped_items.reason)",
+                ((namespace, url, reason, now, now) for url, reason in reasons.items())
+            )
+
+    def count_seen(self, namespace=None):
+        """Number of offers in the seen history (of one search, or all of them)."""
+        if namespace is None:
+            return self.conn.execute("SELECT COUNT(*) FROM seen_offers").fetchone()[0]
+        return self.conn.execute("SELECT COUNT(*) FROM seen_offers WHERE search = ?", (namespace,)).fetchone()[0]
+
+    def count_skipped(self, namespace=None):
+        """Number of items in the skipped history (of one search, or all of them)."""
+        if namespace is None:
+            return self.conn.execute("SELECT COUNT(*) FROM skipped_items").fetchone()[0]
+        return self.conn.execute("SELECT COUNT(*) FROM skipped_items WHERE search = ?", (namespace,)).fetchone()[0]
+
+    def namespace(self, name):
+        """Return a view of the history of one search."""
+        return HistoryNamespace(self, name)
+
+    def import_json(self, offers_file, skipped_file):
+        """One-shot import of the legacy JSON history files.
+
+        The JSON files are left untouched; the import is recorded in the
+        database so it only happens once.
+
+        Args:
+            offers_file: JSON file with notified offer URLs ({"urls": [...]})
+            skipped_file: JSON file with skipped item URLs ({"urls": [...]})
+
+        Returns:
+            Tuple of (number of seen offers imported, number of skipped items imported)
+        """
+        seen = self._load_json_urls(offers_file)
+        skipped = self._load_json_urls(skipped_file)
+        if seen:
+            self.add_seen(seen)
+        if skipped:
+            self.add_skipped({url: 'imported' for url in skipped})
+        self._set_meta('json_imported', _now())
+        if seen or skipped:
+            logger.info(f"Imported {len(seen)} seen offers and {len(skipped)} skipped items from JSON history into {self.path}")
+        return len(seen), len(skipped)
+
+    @staticmethod
+    def _load_json_urls(path):
+        """Read the URL list of a legacy JSON history file."""
+        if not path or not os.path.exists(path) or os.path.getsize(path) == 0:
+            return []
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, dict) and 'urls' in data:
+                return list(data['urls'])
+        except Exception as e:
+            logger.error(f"Error reading legacy history file {path}: {e}")
+        return []
+
+    def flush(self):
+        """Nothing to write: every insert is committed right away."""
+
+    def close(self):
+        """Close the database connection."""
+        self.conn.close()
+
+
+class HistoryNamespace:
+    """History of a single search, backed by a shared store.
+
+    Exposes the same membership and insert methods as the stores themselves,
+    so code scraping one search does not need to know about namespaces.
+
+    Args:
+        store: HistoryStore or IndexHistoryStore
+        name: Namespace of the search ('' for the legacy single-search history)
+    """
+
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+        self.path = store.path
+
+    def seen_among(self, urls):
+        return self.store.seen_among(urls, namespace=self.name)
+
+    def skipped_among(self, urls):
+        return self.store.skipped_among(urls, namespace=self.name)
+
+    def add_seen(self, urls, seen_at=None):
+        self.store.add_seen(urls, seen_at, namespace=self.name)
+
+    def add_skipped(self, reasons, seen_at=None):
+        self.store.add_skipped(reasons, seen_at, namespace=self.name)
+
+    def count_seen(self):
+        return self.store.count_seen(namespace=self.name)
+
+    def count_skipped(self):
+        return self.store.count_skipped(namespace=self.name)
+
+
+def open_history_store(backend='sqlite', path='wallabot_history.db', index_dir='.'):
+    """Open the configured history backend.
+
+    Args:
+        backend: 'sqlite' for HistoryStore or 'index' for the memory-mapped IndexHistoryStore
+        path: SQLite database file (also imported by the index backend on first use)
+        index_dir: Directory holding the index files of the 'index' backend
+
+    Returns:
+        History store instance
+    """
+    if backend == 'index':
+        from history_index import IndexHistoryStore
+        return IndexHistoryStore(index_dir, legacy_db=path)
+    return HistoryStore(path)
+
+
+if __name__ == "__main__":
+    import sys
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    offers_file = sys.argv[1] if len(sys.argv) > 1 else 'offers_history.json'
+    skipped_file = sys.argv[2] if len(sys.argv) > 2 else 'skipped_items_history.json'
+    store = HistoryStore()
+    seen_count, skipped_count = store.import_json(offers_file, skipped_file)
+    print(f"Imported {seen_count} seen offers and {skipped_count} skipped items")
+    print(f"History now holds {store.count_seen()} seen offers and {store.count_skipped()} skipped items")
+    store.close()
@@ -0,0 +1,131 @@
+#!/usr/bin/python
+"""
+Incremental scanning of newest-first searches for Wallabot.
+
+A search sorted by newest lists the new listings above the ones the previous
+run already went through. The high-water mark of a search is the item IDs at
+the top of its results on the last scan; the next scan stops at the first
+card whose ID is in the mark, since everything below it was scanned before.
+When no marked card shows up on the first page, more than a page of new
+listings arrived since the last run, and further pages are loaded (up to a
+limit) until one does.
+
+The mark lists several IDs rather than one, so it survives its newest listing
+being sold or deleted. It only moves once the run is over, and never past a
+listing whose detail lookup failed, so such listings are scanned again.
+
+The history is not used for this: it only records items that were notified
+or filtered after a detail lookup, while the mark covers every card, including
+those the card-level filters rejected.
+"""
+import json
+import logging
+import os
+from urllib.parse import urlsplit, parse_qsl
+
+from history_index import canonical_item_id
+
+logger = logging.getLogger(__name__)
+
+
+def is_newest_first(url):
+    """Whether a Wallapop search URL sorts its results by newest."""
+    return dict(parse_qsl(urlsplit(url).query)).get('order_by') == 'newest'
+
+
+def listing_key(offer):
+    """Identify a listing across scans by the item ID of its link."""
+    return canonical_item_id(offer['enlace'])
+
+
+def cut_at_known(offers, known):
+    """Keep the offers above the first known listing.
+
+    Args:
+        offers: Offers in the order of the search results
+        known: Set of listing keys of the high-water mark
+
+    Returns:
+        Tuple of (offers above the first known listing, whether one was found)
+    """
+    for idx, offer in enumerate(offers):
+        if listing_key(offer) in known:
+            return offers[:idx], True
+    return offers, False
+
+
+class ScanMarks:
+    """High-water marks of the searches, kept in a JSON file between runs.
+
+    Args:
+        path: JSON file mapping each search namespace to its mark
+        keep: Number of top listing IDs kept per search
+    """
+
+    def __init__(self, path='scan_marks.json', keep=5):
+        self.path = path
+        self.keep = keep
+        self.marks = self._load()
+        # Scans of the current run, not committed yet: namespace -> listing keys
+        self._scans = {}
+        self._retries = {}
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except Exception as e:
+            logger.error(f"Error loading scan marks: {e}")
+            return {}
+
+    def known(self, namespace):
+        """Listing keys of the mark of a search (empty before its first scan)."""
+        return set(self.marks.get(namespace, []))
+
+    def scanned(self, namespace, offers):
+        """Remember the cards of a scan, to move the mark once the run is over.
+
+        Args:
+            namespace: History namespace of the search
+            offers: Offers of the scan, newest first (cards without a link are ignored)
+        """
+        self._scans[namespace] = [listing_key(offer) for offer in offers if offer['enlace'] != "#"]
+
+    def retry(self, namespace, offer):
+        """Keep the mark below a listing whose detail lookup must be retried."""
+        self._retries.setdefault(namespace, set()).add(listing_key(offer))
+
+    def commit(self):
+        """Move the marks to the top of the scans of this run."""
+        for namespace, keys in self._scans.items():
+            retries = self._retries.get(namespace, set())
+            failed = [idx for idx, key in enumerate(keys) if key in retries]
+            if failed:
+                # The next scan must reach the failed listings again
+                keys = keys[failed[-1] + 1:]
+            if not keys:
+                # Keep the old mark rather than forget it over an empty or broken page
+                continue
+            # Known listings the new top did not push out stay in the mark
+            old = [key for key in self.marks.get(namespace, []) if key not in keys and key not in retries]
+            self.marks[namespace] = (keys + old)[:self.keep]
+        self.discard()
+
+    def discard(self):
+        """Forget the scans of this run without moving the marks (e.g. after a failed run)."""
+        self._scans = {}
+        self._retries = {}
+
+    def save(self):
+        """Persist the marks for the next run."""
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.marks, f, indent=2)
+            logger.debug(f"Saved scan marks to {self.path}")
+        except Exception as e:
+            logger.error(f"Error saving scan marks: {e}")
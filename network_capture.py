@@ -0,0 +1,158 @@
+#!/usr/bin/python
+"""
+Capture of Wallapop's own API responses through Chrome DevTools for Wallabot.
+
+The search and product pages render from JSON the web app downloads from the
+Wallapop API. With Chrome's performance log enabled, ChromeDriver records the
+DevTools Network events of every page; this module picks out the responses of
+the search, item and user endpoints, fetches their bodies with the
+Network.getResponseBody command and turns them into the same item and seller
+info dictionaries the HTTP backend builds. That replaces per-field DOM reads
+and exposes fields the rendered page does not show (item and seller IDs,
+timestamps, coordinates).
+
+Callers fall back to DOM extraction whenever nothing usable was captured.
+Reading the performance log empties it, so callers that need the events of a
+page for several purposes read them once with read_network_events() and pass
+them along.
+"""
+import json
+import logging
+import re
+
+from backends import parse_search_results, parse_item_details
+
+logger = logging.getLogger(__name__)
+
+# API endpoints whose responses are captured
+SEARCH_API_PATTERN = re.compile(r'/api/v3/(?:general/)?search(?:/section)?(?:\?|$)')
+ITEM_API_PATTERN = re.compile(r'/api/v3/items/([^/?]+)(?:\?|$)')
+USER_API_PATTERN = re.compile(r'/api/v3/users/([^/?]+)(?:\?|$)')
+USER_STATS_API_PATTERN = re.compile(r'/api/v3/users/([^/?]+)/stats(?:\?|$)')
+
+
+def enable_performance_logging(chrome_options):
+    """Ask ChromeDriver to record DevTools Network events in the performance log.
+
+    Args:
+        chrome_options: ChromeOptions used to create the driver
+    """
+    chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+
+
+def discard_captured(driver):
+    """Empty the performance log so the next capture only sees new responses."""
+    try:
+        driver.get_log('performance')
+    except Exception as e:
+        logger.debug(f"Could not read the performance log: {e}")
+
+
+def read_network_events(driver):
+    """Return the DevTools events logged since the previous read.
+
+    Args:
+        driver: Selenium WebDriver instance created with performance logging
+
+    Returns:
+        List of event dictionaries with 'method' and 'params'
+    """
+    try:
+        entries = driver.get_log('performance')
+    except Exception as e:
+        logger.debug(f"Could not read the performance log: {e}")
+        return []
+    events = []
+    for entry in entries:
+        try:
+            events.append(json.loads(entry['message'])['message'])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return events
+
+
+def transferred_bytes(events):
+    """Total bytes received over the network by the requests in a list of events."""
+    return sum(int(event.get('params', {}).get('encodedDataLength', 0))
+               for event in events if event.get('method') == 'Network.loadingFinished')
+
+
+def _json_responses(driver, pattern, events=None):
+    """Return (url, decoded JSON) of the logged responses whose URL matches a pattern.
+
+    Args:
+        driver: Selenium WebDriver instance created with performance logging
+        pattern: Compiled regular expression matched against response URLs
+        events: Events from read_network_events() (read from the log if None)
+    """
+    if events is None:
+        events = read_network_events(driver)
+    responses = []
+    for message in events:
+        if message.get('method') != 'Network.responseReceived':
+            continue
+        params = message.get('params', {})
+        response = params.get('response', {})
+        url = response.get('url', '')
+        if response.get('status') != 200 or not pattern.search(url):
+            continue
+        try:
+            body = driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': params['requestId']})
+            responses.append((url, json.loads(body['body'])))
+        except Exception as e:
+            # The body is gone (e.g. evicted) or belongs to another tab
+            logger.debug(f"Could not read response body of {url}: {e}")
+    return responses
+
+
+def capture_search_items(driver, web_base='https://es.wallapop.com', events=None):
+    """Build item dictionaries from the search API responses of the current page.
+
+    Items of several responses (e.g. further pages loaded by scrolling) are
+    concatenated in arrival order without duplicates.
+
+    Args:
+        driver: Selenium WebDriver instance created with performance logging
+        web_base: Base URL of the Wallapop web site, used for item links
+        events: Events from read_network_events() (read from the log if None)
+
+    Returns:
+        List of item dictionaries (empty if no search response was captured)
+    """
+    items, seen_ids = [], set()
+    for url, data in _json_responses(driver, SEARCH_API_PATTERN, events):
+        for item in parse_search_results(data, web_base):
+            if item.get('item_id') not in seen_ids:
+                seen_ids.add(item.get('item_id'))
+                items.append(item)
+    if items:
+        logger.info(f"Captured {len(items)} items from the search API responses")
+    return items
+
+
+def capture_detail(driver, events=None):
+    """Build a seller info dictionary from the API responses of the current product page.
+
+    Args:
+        driver: Selenium WebDriver instance created with performance logging
+        events: Events from read_network_events() (read from the log if None)
+
+    Returns:
+        Tuple of (seller info dictionary, set of fields that were found), or
+        None if the item response was not captured
+    """
+    # One read of the log for all three endpoints
+    responses = _json_responses(driver, re.compile(
+        f"{ITEM_API_PATTERN.pattern}|{USER_API_PATTERN.pattern}|{USER_STATS_API_PATTERN.pattern}"), events)
+    item_data, users, stats = None, {}, {}
+    for url, data in responses:
+        if ITEM_API_PATTERN.search(url):
+            item_data = data
+        elif (match := USER_STATS_API_PATTERN.search(url)):
+            stats[match.group(1)] = data
+        elif (match := USER_API_PATTERN.search(url)):
+            users[match.group(1)] = data
+    if not isinstance(item_data, dict):
+        return None
+    seller_id = (item_data.get('user') or {}).get('id') or item_data.get('user_id')
+    return parse_item_details(item_data, users.get(seller_id, {}), stats.get(seller_id, {}))
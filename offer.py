@@ -0,0 +1,175 @@
+#!/usr/bin/python
+"""
+Offer record for Wallabot.
+
+An Offer holds the display strings of an item (the keys the email template has
+always used, such as 'precio' or 'seller_sales') in __slots__ instead of a
+per-item dictionary, next to the numbers parsed from them: price, seller rate,
+rating count, sales, views and favorites. The numbers are parsed once, when
+their display string is set, so filters and templates never parse them again.
+
+Offers keep the mapping interface of the old item dictionaries (offer['titulo'],
+offer.get('views'), 'search' in offer), so code written for dictionaries keeps
+working. Set display fields through offer[key] = value so the parsed number
+follows; the numeric attributes are read-only through the mapping interface.
+"""
+from filters import parse_price, parse_count
+
+# Display fields and their defaults (the keys of the old item dictionaries)
+DISPLAY_DEFAULTS = {
+    'titulo': "Unknown Title",
+    'precio': "Unknown Price",
+    'enlace': "#",
+    'reservada': False,
+    'seller_name': "Desconocido",           # Only available on product page
+    'seller_number_of_rates': "0",          # Only available on product page
+    'seller_rate': "0",                     # Only available on product page
+    'seller_sales': "0",                    # Only available on product page
+    'location': "Desconocido",              # Only available on product page
+    'shipping': "No",                       # Only available on product page
+    'image_url': "",                        # Available on search page
+    'last_update': "Desconocido",           # Last update time
+    'views': "0",                           # View count
+    'favorites': "0",                       # Favorites count
+    'seller_profesional': "No",             # Professional seller indicator
+}
+
+# Optional fields: search name, fetch backend that found the item and the data only the JSON API exposes
+EXTRA_FIELDS = ('search', 'source', 'item_id', 'seller_id', 'created_at', 'modified_at', 'latitude', 'longitude')
+
+
+def _parse_rate(text):
+    try:
+        return float(str(text).replace(",", "."))
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_count(text):
+    try:
+        return parse_count(str(text))
+    except (ValueError, TypeError, IndexError):
+        return None
+
+
+# Display field -> (numeric attribute, parser returning None when unparseable)
+NUMERIC_FIELDS = {
+    'precio': ('price', parse_price),
+    'seller_rate': ('rate', _parse_rate),
+    'seller_number_of_rates': ('rating_count', _parse_count),
+    'seller_sales': ('sales', _parse_count),
+    'views': ('view_count', _parse_count),
+    'favorites': ('favorite_count', _parse_count),
+}
+
+# Seller info values of a detail page where nothing was found (see backends.empty_seller_info)
+SELLER_INFO_DEFAULTS = {
+    "name": "Sin nombre",
+    "sales": "0",
+    "number_of_rates": "0",
+    "rate": "0",
+    "location": "Ubicación desconocida",
+    "shipping": "No",
+    "image_url": "",               # Fallback if not found on search page
+    "last_update": "Desconocido",  # Last update time
+    "views": "0",                  # View count
+    "favorites": "0",              # Favorites count
+    "profesional": "No",           # Professional seller indicator
+}
+
+# Seller info key (see backends.empty_seller_info) -> display field
+SELLER_INFO_FIELDS = {
+    'name': 'seller_name',
+    'number_of_rates': 'seller_number_of_rates',
+    'rate': 'seller_rate',
+    'sales': 'seller_sales',
+    'location': 'location',
+    'shipping': 'shipping',
+    'last_update': 'last_update',
+    'views': 'views',
+    'favorites': 'favorites',
+    'profesional': 'seller_profesional',
+}
+
+_NUMERIC_ATTRS = tuple(attr for attr, _ in NUMERIC_FIELDS.values())
+_WRITABLE = frozenset(DISPLAY_DEFAULTS) | frozenset(EXTRA_FIELDS)
+_READABLE = _WRITABLE | frozenset(_NUMERIC_ATTRS)
+
+
+class Offer:
+    """Compact item record with parse-once numeric fields.
+
+    Args:
+        **fields: Initial display or extra fields; missing display fields get their defaults
+    """
+
+    __slots__ = tuple(DISPLAY_DEFAULTS) + EXTRA_FIELDS + _NUMERIC_ATTRS
+
+    def __init__(self, **fields):
+        for key in EXTRA_FIELDS:
+            setattr(self, key, None)
+        for key, value in DISPLAY_DEFAULTS.items():
+            self[key] = fields.pop(key, value)
+        for key, value in fields.items():
+            self[key] = value
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build an Offer from an item dictionary, ignoring unknown keys."""
+        return cls(**{key: value for key, value in data.items() if key in _WRITABLE})
+
+    def __getitem__(self, key):
+        if key not in _READABLE:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in _WRITABLE:
+            raise KeyError(key)
+        setattr(self, key, value)
+        numeric = NUMERIC_FIELDS.get(key)
+        if numeric:
+            setattr(self, numeric[0], numeric[1](value))
+
+    def __contains__(self, key):
+        return key in _READABLE and getattr(self, key) is not None
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in _READABLE else None
+        return default if value is None else value
+
+    def keys(self):
+        return [key for key in self.__slots__ if getattr(self, key) is not None]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+    def to_dict(self):
+        """Display and extra fields as a plain dictionary (numbers are derived, not stored)."""
+        return {key: getattr(self, key) for key in tuple(DISPLAY_DEFAULTS) + EXTRA_FIELDS
+                if getattr(self, key) is not None}
+
+    def apply_seller_info(self, seller_info):
+        """Copy the data only available on the product detail page.
+
+        Placeholder values (see SELLER_INFO_DEFAULTS) only fill fields the offer
+        has no value for yet.
+
+        Args:
+            seller_info: Seller info dictionary returned by a fetch backend
+        """
+        for info_key, field in SELLER_INFO_FIELDS.items():
+            if info_key not in seller_info:
+                continue
+            value = seller_info[info_key]
+            # A placeholder for a value missing from the detail page must not
+            # replace real data the offer already has (e.g. the search card location)
+            if value == SELLER_INFO_DEFAULTS[info_key] and self[field] != DISPLAY_DEFAULTS[field]:
+                continue
+            self[field] = value
+        # Only update image URL if we didn't get it from the search page
+        if not self.image_url and seller_info.get('image_url'):
+            self['image_url'] = seller_info['image_url']
+
+    def __repr__(self):
+        return f"Offer({self.titulo!r}, {self.precio!r}, {self.enlace!r})"
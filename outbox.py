@@ -0,0 +1,330 @@
+#!/usr/bin/python
+"""
+Durable email outbox for Wallabot.
+
+New offers are recorded as seen before they are emailed, so a failed send
+used to lose them. Instead, every notification is now written to an on-disk
+outbox first (one JSON file per message, written atomically) and a background
+thread delivers the outbox:
+
+- It keeps one authenticated SMTP session open across messages (and daemon
+  cycles), and reconnects when the server dropped it or it sat idle too long.
+- A message that cannot be sent stays in the outbox and is retried with an
+  exponential backoff, surviving restarts of the bot. After too many attempts
+  it is set aside as a .failed file instead of blocking the others.
+- Enqueueing only writes a small file, so the scraping path never waits for
+  the mail server.
+"""
+import json
+import logging
+import os
+import smtplib
+import threading
+import uuid
+from time import time
+
+logger = logging.getLogger(__name__)
+
+
+def smtp_server_for(username):
+    """Return the (host, port) of the SMTP server of an email account."""
+    if '@gmail.com' in username:
+        return "smtp.gmail.com", 587
+    return "smtp.sapo.pt", 587
+
+
+class Outbox:
+    """Messages waiting to be sent, one JSON file per message.
+
+    Args:
+        directory: Directory holding the message files (created if missing)
+    """
+
+    def __init__(self, directory='outbox'):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, message_id):
+        return os.path.join(self.directory, f"{message_id}.json")
+
+    def _write(self, entry):
+        # Write to a temporary file first so a crash never leaves a truncated message
+        path = self._path(entry['id'])
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def put(self, sender, recipients, message):
+        """Store a message until it is sent.
+
+        Args:
+            sender: Envelope sender address
+            recipients: Recipient address or list of addresses
+            message: Full message as a string (e.g. MIMEMultipart.as_string())
+
+        Returns:
+            ID of the stored message
+        """
+        now = time()
+        # Time-ordered IDs keep messages in the order they were queued
+        message_id = f"{int(now * 1000):013d}-{uuid.uuid4().hex[:8]}"
+        entry = {'id': message_id, 'sender': sender,
+                 'recipients': [recipients] if isinstance(recipients, str) else list(recipients),
+                 'message': message, 'queued_at': now, 'attempts': 0, 'next_attempt': now, 'last_error': None}
+        with self._lock:
+            self._write(entry)
+        return message_id
+
+    def entries(self):
+        """Load every stored message, oldest first."""
+        entries = []
+        with self._lock:
+            names = sorted(name for name in os.listdir(self.directory) if name.endswith('.json'))
+            for name in names:
+                try:
+                    with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as f:
+                        entries.append(json.load(f))
+                except Exception as e:
+                    logger.error(f"Skipping unreadable outbox message {name}: {e}")
+        return entries
+
+    def remove(self, message_id):
+        """Delete a message once it was sent."""
+        with self._lock:
+            try:
+                os.remove(self._path(message_id))
+            except FileNotFoundError:
+                pass
+
+    def set_aside(self, entry):
+        """Keep a message that will not be retried as a .failed file next to the outbox."""
+        with self._lock:
+            try:
+                os.replace(self._path(entry['id']), self._path(entry['id']) + '.failed')
+            except FileNotFoundError:
+                pass
+
+    def defer(self, entry, delay, error):
+        """Record a failed attempt and schedule the next one.
+
+        Args:
+            entry: Message entry from entries()
+            delay: Seconds to wait before the next attempt
+            error: Error of the failed attempt
+        """
+        entry['attempts'] += 1
+        entry['next_attempt'] = time() + delay
+        entry['last_error'] = str(error)
+        with self._lock:
+            self._write(entry)
+
+    def __len__(self):
+        return sum(1 for name in os.listdir(self.directory) if name.endswith('.json'))
+
+
+class SmtpSession:
+    """An authenticated SMTP connection kept open between messages.
+
+    Args:
+        host: SMTP server host
+        port: SMTP server port
+        username: Login user (empty to skip the login)
+        password: Login password
+        starttls: Upgrade the connection with STARTTLS before logging in
+        idle_timeout: Seconds a connection may stay unused before it is checked with NOOP
+        timeout: Socket timeout in seconds
+        debug: Enable smtplib's protocol debug output
+    """
+
+    def __init__(self, host, port, username='', password='', starttls=True, idle_timeout=60, timeout=30,
+                 debug=False):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.debug = debug
+        self.server = None
+        self.last_used = 0.0
+        # Number of connections opened, for the run log
+        self.connections = 0
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        server.set_debuglevel(self.debug)
+        try:
+            if self.starttls:
+                server.starttls()
+            if self.username:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        self.server = server
+        self.connections += 1
+        logger.info(f"Connected to SMTP server {self.host}:{self.port}")
+
+    def _usable(self):
+        """Whether the open connection can still be used (checked with NOOP after idling)."""
+        if self.server is None:
+            return False
+        if time() - self.last_used < self.idle_timeout:
+            return True
+        try:
+            return self.server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def send(self, sender, recipients, message):
+        """Send a message, reconnecting once if the server dropped the session.
+
+        Raises:
+            smtplib.SMTPException, OSError: If the message could not be sent
+        """
+        if not self._usable():
+            self.close()
+            self._connect()
+        try:
+            self.server.sendmail(sender, recipients, message)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            logger.info("SMTP session was closed by the server, reconnecting")
+            self.close()
+            self._connect()
+            self.server.sendmail(sender, recipients, message)
+        self.last_used = time()
+
+    def close(self):
+        """Close the connection, if any."""
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            try:
+                self.server.close()
+            except Exception:
+                pass
+        self.server = None
+
+
+class OutboxSender:
+    """Background thread delivering an Outbox through an SmtpSession.
+
+    Args:
+        outbox: Outbox to deliver
+        session: SmtpSession used for every message
+        backoff: Seconds before the first retry of a failed message (doubled on every failure)
+        max_backoff: Upper bound of the delay between two attempts
+        max_attempts: Set a message aside after this many failed attempts (0 retries forever)
+        idle_close: Close the SMTP session after this many seconds without messages (0 keeps it open)
+    """
+
+    def __init__(self, outbox, session, backoff=30, max_backoff=3600, max_attempts=10, idle_close=300):
+        self.outbox = outbox
+        self.session = session
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.idle_close = idle_close
+        self.sent = 0
+        self.failures = 0
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        """Start delivering in a daemon thread (messages left by earlier runs go first)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='outbox-sender', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Deliver without waiting for the next scheduled check (call after enqueueing)."""
+        self._wake.set()
+
+    def deliver_due(self):
+        """Send every message whose next attempt is due.
+
+        Returns:
+            Seconds until the next deferred message is due (None if the outbox is empty)
+        """
+        next_due = None
+        for entry in self.outbox.entries():
+            wait = entry['next_attempt'] - time()
+            if wait > 0:
+                next_due = wait if next_due is None else min(next_due, wait)
+                continue
+            try:
+                self.session.send(entry['sender'], entry['recipients'], entry['message'])
+            except smtplib.SMTPAuthenticationError as e:
+                logger.error(f"SMTP Authentication Error: {e}")
+                logger.error("For Gmail accounts, use an app password: https://myaccount.google.com/apppasswords")
+                self._defer(entry, e)
+                # The other messages would fail the same way
+                return self._delay(entry['attempts'])
+            except (smtplib.SMTPException, OSError) as e:
+                self._defer(entry, e)
+                self.session.close()
+                return self._delay(entry['attempts'])
+            self.outbox.remove(entry['id'])
+            self.sent += 1
+            logger.info(f"Email sent ({time() - entry['queued_at']:.1f} seconds after it was queued)")
+        return next_due
+
+    def _delay(self, attempts):
+        return min(self.max_backoff, self.backoff * 2 ** max(0, attempts - 1))
+
+    def _defer(self, entry, error):
+        self.failures += 1
+        if self.max_attempts and entry['attempts'] + 1 >= self.max_attempts:
+            logger.error(f"Giving up on email {entry['id']} after {entry['attempts'] + 1} attempts, "
+                         f"kept in {self.outbox.directory} as .failed: {error}")
+            self.outbox.set_aside(entry)
+            return
+        delay = self._delay(entry['attempts'] + 1)
+        logger.warning(f"Could not send email (attempt {entry['attempts'] + 1}), retrying in {delay:.0f} seconds: {error}")
+        self.outbox.defer(entry, delay, error)
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                next_due = self.deliver_due()
+            except Exception as e:
+                logger.error(f"Error delivering the outbox: {e}")
+                next_due = self.backoff
+            if self._stopping:
+                return
+            timeout = next_due if next_due is not None else (self.idle_close or None)
+            if not self._wake.wait(timeout) and next_due is None and self.idle_close:
+                # Nothing to send for a while: do not keep the server waiting
+                self.session.close()
+
+    def stop(self, timeout=30):
+        """Try to deliver what is due for up to timeout seconds, then stop the thread.
+
+        Messages still in the outbox are sent by the next run.
+
+        Returns:
+            Number of messages left in the outbox
+        """
+        if self._thread is not None:
+            self._stopping = True
+            self._wake.set()
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning(f"Outbox still sending after {timeout} seconds, leaving the rest for the next run")
+            else:
+                self._thread = None
+        if self._thread is None:
+            self.session.close()
+        left = len(self.outbox)
+        logger.info(f"Outbox: {self.sent} emails sent over {self.session.connections} SMTP connection(s), "
+                    f"{self.failures} failed attempts, {left} waiting")
+        return left
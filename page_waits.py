@@ -0,0 +1,184 @@
+#!/usr/bin/python
+"""
+Condition-based page waits for Wallabot.
+
+This module replaces fixed sleep() calls with waits on concrete readiness
+conditions (item cards present, detail header rendered, stats spans present).
+Each page type has its own timeout, the typical ready time of every page type
+is learned across runs, and every wait is recorded so the per-run summary
+shows how long the bot actually spent waiting.
+"""
+import json
+import logging
+import os
+import threading
+from time import time
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.wait import WebDriverWait
+from selenium.common.exceptions import TimeoutException
+
+logger = logging.getLogger(__name__)
+
+# Readiness conditions per page type.
+# 'all' waits until every selector matches, 'any' until at least one does.
+READY_CONDITIONS = {
+    'search': ('all', ['.ItemCardList__item']),
+    'detail': ('all', ['h3[class*="item-detail-header"]']),
+    'detail_stats': ('any', ['span[class*="ItemDetailStats__description"]',
+                             'span[aria-label="Views"]',
+                             'span[aria-label="Favorites"]']),
+}
+
+# Default timeouts (seconds) used when config.py does not override them
+DEFAULT_TIMEOUTS = {
+    'search': 15,
+    'search_more': 10,
+    'detail': 10,
+    'detail_stats': 3,
+}
+
+# Weight of the newest sample in the learned ready time (exponential moving average)
+LEARNING_RATE = 0.3
+
+
+class PageWaiter:
+    """Wait for page readiness conditions and learn typical ready times.
+
+    Args:
+        timeouts: Dictionary of page type -> maximum wait in seconds
+        timings_file: JSON file used to persist learned ready times between runs
+        adaptive_factor: Multiple of the learned ready time used as timeout (0 disables)
+        min_timeout: Lower bound for adaptive timeouts in seconds
+    """
+
+    def __init__(self, timeouts=None, timings_file='wait_timings.json',
+                 adaptive_factor=4, min_timeout=2):
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+        self.timings_file = timings_file
+        self.adaptive_factor = adaptive_factor
+        self.min_timeout = min_timeout
+        self.learned = self._load_learned()
+        self.records = {}
+        self._lock = threading.Lock()
+
+    def _load_learned(self):
+        """Load learned ready times from the timings file.
+
+        Returns:
+            Dictionary of page type -> learned ready time in seconds
+        """
+        if self.timings_file and os.path.exists(self.timings_file):
+            try:
+                with open(self.timings_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    return {k: float(v) for k, v in data.items()}
+            except Exception as e:
+                logger.error(f"Error loading wait timings: {e}")
+        return {}
+
+    def save(self):
+        """Persist learned ready times so the next run starts warm."""
+        if not self.timings_file:
+            return
+        try:
+            with self._lock:
+                data = dict(self.learned)
+            with open(self.timings_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+            logger.debug(f"Saved learned wait timings to {self.timings_file}")
+        except Exception as e:
+            logger.error(f"Error saving wait timings: {e}")
+
+    def timeout_for(self, page_type):
+        """Compute the timeout for a page type.
+
+        The configured timeout is an upper bound. Once a ready time has been
+        learned, the timeout shrinks to a multiple of it (never below min_timeout),
+        so a page that normally renders in 400 ms does not block for 10 seconds
+        when its condition can never be met.
+
+        Args:
+            page_type: Key of READY_CONDITIONS
+
+        Returns:
+            Timeout in seconds
+        """
+        timeout = self.timeouts.get(page_type, 10)
+        learned = self.learned.get(page_type)
+        if learned and self.adaptive_factor:
+            timeout = min(timeout, max(self.min_timeout, learned * self.adaptive_factor))
+        return timeout
+
+    def wait(self, driver, page_type, condition=None):
+        """Block until the readiness condition of a page type is met.
+
+        Args:
+            driver: Selenium WebDriver instance
+            page_type: Key of READY_CONDITIONS, or any name when condition is given
+            condition: Optional callable (driver) -> bool replacing the selectors
+                of READY_CONDITIONS (e.g. "more cards than before")
+
+        Returns:
+            True if the page became ready, False on timeout
+        """
+        if condition is None:
+            mode, selectors = READY_CONDITIONS[page_type]
+            check = all if mode == 'all' else any
+            condition = lambda d: check(d.find_elements(By.CSS_SELECTOR, s) for s in selectors)
+        timeout = self.timeout_for(page_type)
+        # Poll faster for pages that are usually quick
+        learned = self.learned.get(page_type)
+        poll = min(0.5, max(0.05, learned / 4)) if learned else 0.2
+
+        start = time()
+        ready = True
+        try:
+            WebDriverWait(driver, timeout, poll_frequency=poll).until(condition)
+        except TimeoutException:
+            ready = False
+        elapsed = time() - start
+
+        self._record(page_type, elapsed, ready, timeout)
+        if ready:
+            logger.debug(f"Page '{page_type}' ready in {elapsed:.2f} seconds")
+        else:
+            logger.debug(f"Page '{page_type}' not ready after {elapsed:.2f} seconds (timeout {timeout:.1f}s)")
+        return ready
+
+    def _record(self, page_type, elapsed, ready, timeout):
+        """Record a wait and update the learned ready time.
+
+        A timeout cut short by the learned ready time grows it to the timeout
+        used, so the next wait of that page type gets adaptive_factor times
+        longer (up to the configured timeout) instead of timing out again
+        whenever pages got slower.
+        """
+        with self._lock:
+            rec = self.records.setdefault(page_type, {'count': 0, 'total': 0.0, 'max': 0.0, 'timeouts': 0})
+            rec['count'] += 1
+            rec['total'] += elapsed
+            rec['max'] = max(rec['max'], elapsed)
+            if not ready:
+                rec['timeouts'] += 1
+                if timeout < self.timeouts.get(page_type, 10):
+                    self.learned[page_type] = max(self.learned.get(page_type, 0), timeout)
+                return
+            previous = self.learned.get(page_type)
+            if previous is None:
+                self.learned[page_type] = elapsed
+            else:
+                self.learned[page_type] = (1 - LEARNING_RATE) * previous + LEARNING_RATE * elapsed
+
+    def log_summary(self):
+        """Log how long each page type was waited for in this run."""
+        with self._lock:
+            records = {k: dict(v) for k, v in self.records.items()}
+        total = sum(rec['total'] for rec in records.values())
+        logger.info(f"Page waits: {total:.2f} seconds in total")
+        for page_type, rec in sorted(records.items()):
+            avg = rec['total'] / max(1, rec['count'])
+            logger.info(f"  {page_type}: {rec['count']} waits, avg {avg:.2f}s, max {rec['max']:.2f}s, "
+                        f"{rec['timeouts']} timeouts, learned {self.learned.get(page_type, 0):.2f}s")
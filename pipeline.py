@@ -0,0 +1,135 @@
+#!/usr/bin/python
+"""
+Streaming stage pipeline for Wallabot.
+
+A run is a chain of generator stages (discover -> pre-filter -> enrich ->
+dedupe -> notify). Each stage pulls items from the previous one only when it
+needs them, so the first offer that survives every filter reaches the notify
+stage right after its detail lookup instead of after the whole search was
+scraped. Stages that work on several items at once (batched history lookups,
+concurrent detail lookups) pull bounded chunks with chunked(), which caps how
+many items sit between two stages.
+
+Everything runs in the calling thread: the Selenium backend drives a single
+browser that cannot serve two stages at the same time. Concurrency stays
+inside the stages that can use it (e.g. the HTTP backend's detail lookups).
+
+Every stage counts the items it received and emitted and the time spent in it
+(excluding the time spent waiting for upstream stages).
+"""
+import logging
+from itertools import islice
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+
+def chunked(iterable, size):
+    """Yield lists of up to size items from an iterable, pulling lazily."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, max(1, size)))
+        if not chunk:
+            return
+        yield chunk
+
+
+class StageStats:
+    """Item counters and timing of one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.items_in = 0
+        self.items_out = 0
+        # Time spent producing this stage's output, upstream stages included
+        self.cumulative = 0.0
+        self.first_output = None
+
+
+class Pipeline:
+    """Chain of generator stages with per-stage counters.
+
+    Args:
+        name: Name used in log messages
+    """
+
+    def __init__(self, name='pipeline'):
+        self.name = name
+        self.stages = []
+        self._stream = None
+        self._start = perf_counter()
+
+    def _count_in(self, stats, iterable):
+        for item in iterable:
+            stats.items_in += 1
+            yield item
+
+    def _count_out(self, stats, iterable):
+        iterator = iter(iterable)
+        while True:
+            start = perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                stats.cumulative += perf_counter() - start
+                return
+            stats.cumulative += perf_counter() - start
+            stats.items_out += 1
+            if stats.first_output is None:
+                stats.first_output = perf_counter() - self._start
+            yield item
+
+    def source(self, name, iterable):
+        """Start the pipeline with the items of an iterable.
+
+        Returns:
+            The pipeline, so stages can be chained
+        """
+        stats = StageStats(name)
+        self.stages.append(stats)
+        self._stream = self._count_out(stats, iterable)
+        return self
+
+    def then(self, name, stage):
+        """Append a stage.
+
+        Args:
+            name: Stage name used in the summary
+            stage: Callable taking the upstream iterable and returning an iterable
+
+        Returns:
+            The pipeline, so stages can be chained
+        """
+        stats = StageStats(name)
+        self.stages.append(stats)
+        self._stream = self._count_out(stats, stage(self._count_in(stats, self._stream)))
+        return self
+
+    def __iter__(self):
+        return iter(self._stream)
+
+    def run(self):
+        """Drain the pipeline.
+
+        Returns:
+            Number of items emitted by the last stage
+        """
+        return sum(1 for _ in self._stream)
+
+    def close(self):
+        """Close the stage generators, running their cleanup code."""
+        if self._stream is not None:
+            self._stream.close()
+
+    def log_summary(self):
+        """Log items in/out, own time and throughput of every stage."""
+        elapsed = perf_counter() - self._start
+        logger.info(f"{self.name}: {elapsed:.2f} seconds")
+        upstream = 0.0
+        for stats in self.stages:
+            own = max(0.0, stats.cumulative - upstream)
+            upstream = stats.cumulative
+            rate = stats.items_out / own if own > 0 else 0.0
+            first = f", first output after {stats.first_output:.2f}s" if stats.first_output is not None else ""
+            logger.info(f"  {stats.name}: {stats.items_in} in, {stats.items_out} out, {own:.2f}s, "
+                        f"{rate:.1f} items/s{first}")
@@ -0,0 +1,66 @@
+#!/usr/bin/python
+"""
+Resource blocking profile for the Wallabot scraping browser.
+
+The bot only reads text, attributes and JSON from Wallapop pages: image URLs
+come from src attributes, never from the pixels. Full-resolution photos, web
+fonts, ads and analytics are downloaded for nothing on every page load. This
+module keeps them out in two layers:
+
+- Chrome content settings stop images from loading at all (their URLs stay
+  in the DOM).
+- The DevTools Network.setBlockedURLs command rejects requests matching a
+  list of URL patterns (fonts, trackers, ad networks). The block list is set
+  per tab, so it has to be applied again to every tab the bot opens.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+# URL patterns ('*' wildcards) blocked by default
+DEFAULT_BLOCKED_URL_PATTERNS = [
+    # Web fonts
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*fonts.googleapis.com*', '*fonts.gstatic.com*',
+    # Analytics, tag managers and session recording
+    '*google-analytics.com*', '*googletagmanager.com*', '*analytics.google.com*',
+    '*hotjar.com*', '*amplitude.com*', '*segment.io*', '*segment.com*', '*sentry.io*',
+    '*newrelic.com*', '*nr-data.net*', '*bat.bing.com*', '*clarity.ms*',
+    # Advertising and social pixels
+    '*doubleclick.net*', '*googlesyndication.com*', '*adservice.google.*', '*amazon-adsystem.com*',
+    '*criteo.com*', '*criteo.net*', '*taboola.com*', '*facebook.net*', '*connect.facebook.*',
+    '*tiktok.com/i18n/pixel*', '*analytics.tiktok.com*',
+]
+
+
+def apply_blocking_prefs(chrome_options, block_images=True):
+    """Add the content settings of the blocking profile to Chrome options.
+
+    Args:
+        chrome_options: ChromeOptions used to create the driver
+        block_images: Stop images from being downloaded
+    """
+    prefs = {'profile.default_content_setting_values.notifications': 2}
+    if block_images:
+        prefs['profile.managed_default_content_settings.images'] = 2
+    chrome_options.add_experimental_option('prefs', prefs)
+
+
+def apply_url_blocking(driver, patterns):
+    """Block requests matching URL patterns in the current tab.
+
+    Args:
+        driver: Selenium Chrome WebDriver instance
+        patterns: List of URL patterns with '*' wildcards
+
+    Returns:
+        True if the block list was applied
+    """
+    if not patterns:
+        return False
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': list(patterns)})
+        return True
+    except Exception as e:
+        logger.warning(f"Could not apply URL blocking: {e}")
+        return False
@@ -0,0 +1,294 @@
+#!/usr/bin/python
+"""
+Time-budgeted run scheduler for Wallabot.
+
+MAX_ITEMS_TO_CHECK caps how many cards a search reads, but not how long the
+detail lookups take, so a slow day makes a run overlap with the next one. The
+scheduler gives every run a deadline instead:
+
+- The candidates that survive the pre-filter stage are collected one search
+  at a time and visited in priority order: candidates carried over from an
+  earlier run first, then newest listings, then cheapest.
+- Before the lookups of a group of candidates start, the scheduler admits
+  only as many as the remaining time covers at the typical lookup cost
+  (learned during the run); the rest is not started. Every run makes at least
+  one lookup, so a cost learned on a slow day can never starve later runs.
+  Admitted lookups always run to the end, and their results are always used.
+- Candidates that were not visited are kept in a JSON queue file and fed back
+  into the next run, so they are checked then instead of being lost. The
+  learned lookup cost is kept with them (capped to the budget), so the next
+  run starts with it.
+"""
+import json
+import logging
+import os
+from time import time
+
+from offer import Offer
+
+logger = logging.getLogger(__name__)
+
+# Weight of the latest lookup in the running estimate of the lookup cost
+COST_SMOOTHING = 0.3
+
+
+def _listed_at(offer, discovered_at):
+    """Listing time in seconds (API timestamps are in milliseconds), or the discovery time."""
+    stamp = offer.get('created_at')
+    if isinstance(stamp, (int, float)) and stamp > 0:
+        return stamp / 1000 if stamp > 1e11 else stamp
+    return discovered_at
+
+
+class RunScheduler:
+    """Deadline, priority order and carry-over queue of one run.
+
+    Args:
+        budget_seconds: Seconds a run may spend discovering and checking items
+        queue_file: JSON file keeping the unvisited candidates for the next run
+        max_age_hours: Drop queued candidates discovered longer ago than this
+    """
+
+    def __init__(self, budget_seconds, queue_file='run_queue.json', max_age_hours=24):
+        self.budget = budget_seconds
+        self.queue_file = queue_file
+        self.max_age = max_age_hours * 3600
+        self.started = time()
+        self.deadline = self.started + budget_seconds
+        self.visits = 0
+        # Candidates queued by earlier runs and the lookup cost they measured
+        queue = self._load_queue()
+        self._queued = queue.get('items', [])
+        # Running estimate of the seconds one detail lookup takes
+        self.visit_cost = queue.get('visit_cost', 0.0)
+        # Candidates left for the next run: list of (offer, discovered_at, rank)
+        self.deferred = []
+        # (discovered_at, rank) of the candidates, by id() of their Offer
+        self._meta = {}
+        # id() of the candidates queued by earlier runs
+        self._carried_ids = set()
+        self._out_of_time = False
+
+    def remaining(self):
+        """Seconds left before the deadline."""
+        return self.deadline - time()
+
+    def has_time(self):
+        """Whether one more detail lookup is expected to end before the deadline.
+
+        The first lookup of a run is always allowed.
+        """
+        if not self.visits or self.remaining() > self.visit_cost:
+            return True
+        self._out_of_time = True
+        return False
+
+    def _record_cost(self, seconds):
+        """Add the measured cost of one lookup to the running estimate."""
+        if not self.visit_cost:
+            self.visit_cost = seconds
+        else:
+            self.visit_cost += COST_SMOOTHING * (seconds - self.visit_cost)
+
+    def with_carried(self, items, search_names):
+        """Pipeline source: the discovered items, each search followed by its queued candidates.
+
+        Queued candidates go through the pre-filter stage (card filters and
+        history) again. Those discovered again in this run are dropped: the
+        fresh card is the one to judge. Candidates of searches that found
+        nothing come last.
+
+        Args:
+            items: Iterable of discovered Offers, one search at a time
+            search_names: Names of the searches of this run
+
+        Yields:
+            Offers tagged with their search
+        """
+        queued = {}
+        for entry in self._queued:
+            queued.setdefault(entry['offer'].get('search'), []).append(entry)
+        discovered = set()
+        current = None
+        for offer in items:
+            if offer['search'] != current:
+                yield from self._carried(queued.pop(current, []), discovered)
+                current = offer['search']
+            discovered.add((offer['search'], offer['enlace']))
+            yield offer
+        yield from self._carried(queued.pop(current, []), discovered)
+        for name, entries in queued.items():
+            if name in search_names:
+                yield from self._carried(entries, discovered)
+
+    def _carried(self, entries, discovered):
+        """Rebuild the queued candidates of one search that were not discovered again."""
+        for entry in entries:
+            offer = Offer.from_dict(entry['offer'])
+            key = (offer.get('search'), offer.get('enlace'))
+            if key in discovered:
+                continue
+            discovered.add(key)
+            self._meta[id(offer)] = (entry['discovered_at'], entry['rank'])
+            self._carried_ids.add(id(offer))
+            yield offer
+
+    def _priority(self, candidate):
+        """Sort key: carried candidates first (they already waited a run), then newest, then cheapest."""
+        offer, discovered_at, rank = candidate
+        return (id(offer) not in self._carried_ids, -_listed_at(offer, discovered_at), rank,
+                offer.price if offer.price is not None else float('inf'))
+
+    def prioritize(self, items):
+        """Pipeline stage: release the candidates of each search in priority order while time is left.
+
+        The candidates of one search are collected, then released carried
+        first, newest, then cheapest, before the next search is read, so
+        lookups start while later searches are still being discovered. Once
+        the time is spent, every remaining candidate is deferred.
+
+        Args:
+            items: Iterable of Offers from the pre-filter stage, one search at a time
+
+        Yields:
+            Offers in priority order
+        """
+        ranks = {}
+        chunk = []
+        current = None
+        try:
+            for offer in items:
+                if offer['search'] != current and chunk:
+                    yield from self._release(chunk)
+                current = offer['search']
+                meta = self._meta.get(id(offer))
+                if meta is None:
+                    rank = ranks.get(offer['search'], 0)
+                    ranks[offer['search']] = rank + 1
+                    meta = self._meta[id(offer)] = (self.started, rank)
+                chunk.append((offer,) + meta)
+            if chunk:
+                yield from self._release(chunk)
+        finally:
+            # Whatever was collected but not released is left for the next run
+            self.deferred.extend(chunk)
+
+    def _release(self, chunk):
+        """Yield the candidates of one search in priority order while time is left.
+
+        Released candidates are removed from chunk; the others stay in it.
+        """
+        chunk.sort(key=self._priority)
+        logger.info(f"Scheduling {len(chunk)} detail lookups of search '{chunk[0][0]['search']}', "
+                    f"{self.remaining():.1f} of {self.budget} seconds left")
+        while chunk and self.has_time():
+            yield chunk.pop(0)[0]
+        self.deferred.extend(chunk)
+        del chunk[:]
+
+    def admit(self, items):
+        """Choose the items of a group whose lookups fit in the remaining time.
+
+        Items are admitted in order while the remaining time covers one more
+        lookup at the learned cost (every item while no cost is known yet,
+        and at least one item on the first lookup of the run). The others are
+        queued for the next run.
+
+        Args:
+            items: Offers about to be looked up, in priority order
+
+        Returns:
+            List of the admitted Offers
+        """
+        if self.visit_cost:
+            fits = int(max(0, self.remaining()) // self.visit_cost)
+        else:
+            fits = len(items) if self.remaining() > 0 else 0
+        if not self.visits:
+            fits = max(fits, 1)
+        admitted, left = items[:fits], items[fits:]
+        self.visits += len(admitted)
+        if left:
+            self._out_of_time = True
+            self.deferred.extend((offer,) + self._meta.get(id(offer), (self.started, idx))
+                                 for idx, offer in enumerate(left, fits))
+        return admitted
+
+    def visit(self, lookups):
+        """Measure the cost per item of the lookups of an admitted group.
+
+        The time spent waiting for results is divided by the number of results,
+        so lookups done all at once (a pool of browsers) or concurrently count
+        as the share of the wall time each one took.
+
+        Args:
+            lookups: Iterable of (index, seller_info) from FetchBackend.iter_details()
+
+        Yields:
+            (index, seller_info) tuples
+        """
+        iterator = iter(lookups)
+        waited = 0.0
+        count = 0
+        try:
+            while True:
+                start = time()
+                try:
+                    result = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    waited += time() - start
+                count += 1
+                yield result
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close:
+                close()
+            if count:
+                self._record_cost(waited / count)
+
+    def _load_queue(self):
+        """Read the queue file, dropping entries older than max_age_hours.
+
+        Returns:
+            Dictionary with the queued 'items' and the learned 'visit_cost'
+        """
+        if not self.queue_file or not os.path.exists(self.queue_file):
+            return {}
+        try:
+            with open(self.queue_file, 'r', encoding='utf-8') as f:
+                queue = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading run queue: {e}")
+            return {}
+        entries = queue.get('items', [])
+        queue['items'] = [entry for entry in entries if self.started - entry.get('discovered_at', 0) <= self.max_age]
+        if queue['items']:
+            logger.info(f"Carrying over {len(queue['items'])} unvisited items from earlier runs "
+                        f"({len(entries) - len(queue['items'])} expired)")
+        return queue
+
+    def save(self):
+        """Write the unvisited candidates to the queue file (an empty queue clears it)."""
+        if not self.queue_file:
+            return
+        entries = [{'offer': offer.to_dict(), 'discovered_at': discovered_at, 'rank': rank}
+                   for offer, discovered_at, rank in self.deferred]
+        try:
+            with open(self.queue_file, 'w', encoding='utf-8') as f:
+                # A cost above the budget would leave later runs a single lookup each
+                json.dump({'visit_cost': min(self.visit_cost, self.budget), 'items': entries}, f,
+                          ensure_ascii=False)
+            log = logger.info if entries else logger.debug
+            log(f"Saved {len(entries)} unvisited items to {self.queue_file}")
+        except Exception as e:
+            logger.error(f"Error saving run queue: {e}")
+
+    def log_summary(self):
+        """Log the budget use, the typical lookup cost and the items left for the next run."""
+        used = time() - self.started
+        state = "budget spent" if self._out_of_time else "within budget"
+        logger.info(f"Run budget: {used:.1f} of {self.budget} seconds used ({state}), "
+                    f"{self.visits} detail lookups at {self.visit_cost:.2f}s each, "
+                    f"{len(self.deferred)} deferred to the next run")
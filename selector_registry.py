@@ -0,0 +1,171 @@
+#!/usr/bin/python
+"""
+Selector strategy registry for Wallabot.
+
+Extraction specs list several selector strategies per field, and every page
+walks them in the same fixed order. The registry remembers which strategy
+matched each field (across runs, in a JSON file), puts that winner first on
+the next pages, and stops looking for fields that were absent from the last
+pages altogether, probing them again every few pages in case they come back.
+Hit and miss counts are logged at the end of the run, and a warning is logged
+when a field that used to be found stops matching, which usually means
+Wallapop changed its markup.
+
+Strategies marked as 'fallback' keep their place: a broader selector that won
+while the precise one was missing must not shadow it once it is back.
+
+Fields read with 'exists' (badges) are never skipped: their absence is a
+meaningful answer, not a miss. Neither are the pinned fields the filters
+depend on: a skipped seller count would silently disable its filter.
+"""
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def _is_presence_field(strategies):
+    return all(s.get('read') == 'exists' for s in strategies)
+
+
+class SelectorRegistry:
+    """Reorder spec strategies by past winners and skip fields that keep missing.
+
+    Args:
+        stats_file: JSON file used to persist winners and absence streaks between runs
+        skip_after_misses: Skip a field after it was absent from this many pages in a row (0 disables)
+        recheck_every: While a field is skipped, look for it again on every this many pages
+        pinned_fields: Fields looked for on every page however often they miss
+            (e.g. the seller counts read by the filters)
+    """
+
+    def __init__(self, stats_file='selector_stats.json', skip_after_misses=10, recheck_every=5,
+                 pinned_fields=()):
+        self.stats_file = stats_file
+        self.skip_after_misses = skip_after_misses
+        self.recheck_every = max(1, recheck_every)
+        self.pinned_fields = set(pinned_fields)
+        self.fields = self._load()
+        self.run_stats = {}
+        # (spec name, field) pairs whose absence is a valid answer
+        self.presence_fields = set()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """Load persisted field state from the stats file.
+
+        Returns:
+            Dictionary of spec name -> field -> state
+        """
+        if self.stats_file and os.path.exists(self.stats_file):
+            try:
+                with open(self.stats_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    return data
+            except Exception as e:
+                logger.error(f"Error loading selector stats: {e}")
+        return {}
+
+    def save(self):
+        """Persist winners and absence streaks so the next run starts warm."""
+        if not self.stats_file:
+            return
+        try:
+            with self._lock:
+                data = json.loads(json.dumps(self.fields))
+            with open(self.stats_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+            logger.debug(f"Saved selector stats to {self.stats_file}")
+        except Exception as e:
+            logger.error(f"Error saving selector stats: {e}")
+
+    def _state(self, name, field):
+        return self.fields.setdefault(name, {}).setdefault(
+            field, {'winner': None, 'wins': {}, 'absent_streak': 0, 'skipped_since_probe': 0})
+
+    def _run(self, name, field):
+        return self.run_stats.setdefault(name, {}).setdefault(field, {'hits': 0, 'misses': 0, 'skipped': 0})
+
+    def plan(self, name, spec):
+        """Build the spec to evaluate on the next page.
+
+        Args:
+            name: Name of the spec (e.g. 'detail')
+            spec: Field spec (see extraction.py)
+
+        Returns:
+            Tuple of (spec to evaluate, order), where order maps every evaluated
+            field to the original indexes of its strategies in evaluation order.
+            Skipped fields are left out of both; pinned fields never are.
+            Fallback strategies are never moved to the front.
+        """
+        planned, order = {}, {}
+        with self._lock:
+            for field, strategies in spec.items():
+                state = self._state(name, field)
+                if _is_presence_field(strategies):
+                    self.presence_fields.add((name, field))
+                elif (field not in self.pinned_fields and self.skip_after_misses
+                      and state['absent_streak'] >= self.skip_after_misses):
+                    state['skipped_since_probe'] += 1
+                    if state['skipped_since_probe'] <= self.recheck_every:
+                        self._run(name, field)['skipped'] += 1
+                        continue
+                    # Time to probe the field again
+                    state['skipped_since_probe'] = 0
+                indexes = list(range(len(strategies)))
+                winner = state['winner']
+                if (winner is not None and 0 < winner < len(strategies)
+                        and not strategies[winner].get('fallback')):
+                    indexes.remove(winner)
+                    indexes.insert(0, winner)
+                planned[field] = [strategies[i] for i in indexes]
+                order[field] = indexes
+        return planned, order
+
+    def record(self, name, order, results):
+        """Record which strategy matched each evaluated field.
+
+        Args:
+            name: Name of the spec
+            order: Order returned by plan()
+            results: Extraction results mapping each field to {'value': ..., 'index': ...}
+        """
+        with self._lock:
+            for field, indexes in order.items():
+                state = self._state(name, field)
+                run = self._run(name, field)
+                index = results.get(field, {}).get('index', -1)
+                if index is None or index < 0 or not results.get(field, {}).get('value'):
+                    run['misses'] += 1
+                    if (name, field) in self.presence_fields:
+                        continue
+                    state['absent_streak'] += 1
+                    if state['absent_streak'] == self.skip_after_misses and state['wins']:
+                        logger.warning(f"Field '{field}' of the {name} page was not found on the last "
+                                       f"{state['absent_streak']} pages; Wallapop may have changed its markup")
+                    continue
+                winner = indexes[index]
+                if state['winner'] is not None and winner != state['winner']:
+                    logger.info(f"Field '{field}' of the {name} page now matched by strategy {winner} "
+                                f"(was {state['winner']})")
+                run['hits'] += 1
+                state['winner'] = winner
+                state['wins'][str(winner)] = state['wins'].get(str(winner), 0) + 1
+                state['absent_streak'] = 0
+                state['skipped_since_probe'] = 0
+
+    def log_summary(self):
+        """Log per-field hit, miss and skip counts of this run."""
+        with self._lock:
+            run_stats = json.loads(json.dumps(self.run_stats))
+            winners = {name: {field: state['winner'] for field, state in fields.items()}
+                       for name, fields in self.fields.items()}
+        for name, fields in sorted(run_stats.items()):
+            logger.info(f"Selectors ({name} page):")
+            for field, stats in sorted(fields.items()):
+                logger.info(f"  {field}: {stats['hits']} hits, {stats['misses']} misses, "
+                            f"{stats['skipped']} skipped, winner strategy {winners[name].get(field)}")
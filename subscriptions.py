@@ -0,0 +1,303 @@
+#!/usr/bin/python
+"""
+Subscriptions for Wallabot: many subscribers' filters over one shared scrape.
+
+The searches are scraped once; every subscriber then gets only the new offers
+matching their own filters (title keywords, price range, seller thresholds,
+shipping, professional sellers), on their own notification channels.
+
+Checking every subscription against every offer gets slow with thousands of
+subscribers, so the SubscriptionIndex narrows the candidates first:
+
+- an inverted index maps the first word of each required keyword to the
+  subscriptions using it, so the words of a title find the subscriptions
+  whose keywords can match it;
+- an interval tree holds the price ranges, so the price of an offer finds
+  the subscriptions whose range contains it without scanning the others.
+
+Only the candidates found in both (plus the subscriptions without keywords or
+price range) are checked against their remaining filters.
+"""
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter
+
+from filters import normalize_text
+
+logger = logging.getLogger(__name__)
+
+
+def title_words(text):
+    """Normalized words of a title or keyword (lowercase, without accents)."""
+    return re.findall(r'\w+', normalize_text(text))
+
+
+class Subscription:
+    """Filters and channels of one subscriber.
+
+    Keywords match whole words of the title, case and accent insensitive; a
+    keyword of several words matches them in sequence. A threshold only
+    rejects offers whose value is known.
+
+    Args:
+        name: Unique subscriber name (used in logs)
+        channels: Notification channel specs, as in NOTIFY_CHANNELS
+        searches: Names of the searches whose offers are matched (empty = all)
+        keywords: The title must contain at least one of these (empty = any title)
+        exclude_keywords: The title must contain none of these
+        min_price: Minimum price in euros (None = no limit)
+        max_price: Maximum price in euros (None = no limit)
+        min_seller_rate: Minimum seller rate, 0 to 5 stars (0 = any)
+        min_rating_count: Minimum number of seller ratings (0 = any)
+        min_sales: Minimum number of seller sales (0 = any)
+        shipping_required: Only offers with shipping available
+        skip_professional: Skip offers from professional sellers
+        skip_reserved: Skip reserved offers
+    """
+
+    FIELDS = ('name', 'channels', 'searches', 'keywords', 'exclude_keywords', 'min_price', 'max_price',
+              'min_seller_rate', 'min_rating_count', 'min_sales', 'shipping_required', 'skip_professional',
+              'skip_reserved')
+
+    def __init__(self, name, channels=(), searches=(), keywords=(), exclude_keywords=(), min_price=None,
+                 max_price=None, min_seller_rate=0, min_rating_count=0, min_sales=0, shipping_required=False,
+                 skip_professional=False, skip_reserved=False):
+        self.name = name
+        self.channels = list(channels)
+        self.searches = set(searches)
+        self.keywords = [' '.join(title_words(keyword)) for keyword in keywords if title_words(keyword)]
+        self.exclude_keywords = [' '.join(title_words(keyword)) for keyword in exclude_keywords
+                                 if title_words(keyword)]
+        self.min_price = min_price
+        self.max_price = max_price
+        self.min_seller_rate = min_seller_rate
+        self.min_rating_count = min_rating_count
+        self.min_sales = min_sales
+        self.shipping_required = shipping_required
+        self.skip_professional = skip_professional
+        self.skip_reserved = skip_reserved
+
+    @classmethod
+    def from_dict(cls, spec):
+        """Build a Subscription from its SUBSCRIPTIONS entry.
+
+        Raises:
+            ValueError: If the entry has no name or an unknown option
+        """
+        unknown = set(spec) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown subscription options {sorted(unknown)} in {spec.get('name')!r}")
+        if not spec.get('name'):
+            raise ValueError(f"Subscription without a name: {spec}")
+        return cls(**spec)
+
+    @property
+    def has_price_range(self):
+        return self.min_price is not None or self.max_price is not None
+
+    def keyword_match(self, padded_title):
+        """Check the keywords against the title words, joined and padded with spaces."""
+        if any(f" {keyword} " in padded_title for keyword in self.exclude_keywords):
+            return False
+        return not self.keywords or any(f" {keyword} " in padded_title for keyword in self.keywords)
+
+    def price_match(self, price):
+        if price is None:
+            return True
+        return ((self.min_price is None or price >= self.min_price)
+                and (self.max_price is None or price <= self.max_price))
+
+    def details_match(self, offer):
+        """Check every filter but the keywords and the price range."""
+        if self.searches and offer.get('search') not in self.searches:
+            return False
+        if self.skip_reserved and offer.get('reservada'):
+            return False
+        if self.shipping_required and offer.get('shipping') != "Sí":
+            return False
+        if self.skip_professional and offer.get('seller_profesional') == "Sí":
+            return False
+        for threshold, value in ((self.min_seller_rate, offer.rate), (self.min_rating_count, offer.rating_count),
+                                 (self.min_sales, offer.sales)):
+            if threshold and value is not None and value < threshold:
+                return False
+        return True
+
+    def matches(self, offer):
+        """Check every filter of the subscription against an Offer (without the index)."""
+        padded_title = f" {' '.join(title_words(offer.titulo))} "
+        return self.keyword_match(padded_title) and self.price_match(offer.price) and self.details_match(offer)
+
+
+class IntervalTree:
+    """Static centered interval tree answering which intervals contain a point.
+
+    Args:
+        intervals: List of (low, high, value) tuples, bounds included
+            (use -inf/inf for open ends)
+    """
+
+    def __init__(self, intervals):
+        self.root = self._build(list(intervals))
+
+    @staticmethod
+    def _build(intervals):
+        if not intervals:
+            return None
+        endpoints = sorted(bound for low, high, _ in intervals for bound in (low, high) if math.isfinite(bound))
+        center = endpoints[len(endpoints) // 2] if endpoints else 0
+        left = [iv for iv in intervals if iv[1] < center]
+        right = [iv for iv in intervals if iv[0] > center]
+        here = [iv for iv in intervals if iv[0] <= center <= iv[1]]
+        # Node: center, intervals containing it by ascending low and by descending high, children
+        return (center, sorted(here, key=lambda iv: iv[0]), sorted(here, key=lambda iv: -iv[1]),
+                IntervalTree._build(left), IntervalTree._build(right))
+
+    def stab(self, point):
+        """Yield the values of the intervals containing point."""
+        node = self.root
+        while node is not None:
+            center, by_low, by_high, left, right = node
+            if point < center:
+                for low, _, value in by_low:
+                    if low > point:
+                        break
+                    yield value
+                node = left
+            elif point > center:
+                for _, high, value in by_high:
+                    if high < point:
+                        break
+                    yield value
+                node = right
+            else:
+                for _, _, value in by_low:
+                    yield value
+                return
+
+
+class SubscriptionIndex:
+    """Find the subscriptions matching an offer without checking all of them.
+
+    Args:
+        subscriptions: List of Subscription instances
+    """
+
+    def __init__(self, subscriptions):
+        self.subscriptions = list(subscriptions)
+        # First word of each required keyword -> indexes of the subscriptions using it
+        self.keyword_index = {}
+        without_keywords = set()
+        without_price = set()
+        ranges = []
+        for idx, subscription in enumerate(self.subscriptions):
+            if subscription.keywords:
+                for keyword in subscription.keywords:
+                    self.keyword_index.setdefault(keyword.split(' ', 1)[0], set()).add(idx)
+            else:
+                without_keywords.add(idx)
+            if subscription.has_price_range:
+                low = -math.inf if subscription.min_price is None else subscription.min_price
+                high = math.inf if subscription.max_price is None else subscription.max_price
+                ranges.append((low, high, idx))
+            else:
+                without_price.add(idx)
+        self.price_tree = IntervalTree(ranges)
+        self.without_keywords = without_keywords
+        self.without_price = without_price
+        self.without_either = without_keywords & without_price
+        # Counters for the run log
+        self.offers = 0
+        self.candidates = 0
+        self.matches = 0
+
+    def __len__(self):
+        return len(self.subscriptions)
+
+    def candidates_for(self, offer):
+        """Indexes of the subscriptions whose keywords and price range match an offer."""
+        words = title_words(offer.titulo)
+        padded_title = f" {' '.join(words)} "
+        # Keyword subscriptions sharing a word with the title, checked on the whole title
+        keyword_hits = set()
+        for word in set(words):
+            for idx in self.keyword_index.get(word, ()):
+                if idx not in keyword_hits and self.subscriptions[idx].keyword_match(padded_title):
+                    keyword_hits.add(idx)
+        price = offer.price
+        if price is None:
+            # Unknown prices match every range
+            found = keyword_hits | {idx for idx in self.without_keywords
+                                    if self.subscriptions[idx].keyword_match(padded_title)}
+            return found
+        found = {idx for idx in keyword_hits if self.subscriptions[idx].price_match(price)}
+        for idx in self.price_tree.stab(price):
+            if idx in self.without_keywords and self.subscriptions[idx].keyword_match(padded_title):
+                found.add(idx)
+        found.update(idx for idx in self.without_either if self.subscriptions[idx].keyword_match(padded_title))
+        return found
+
+    def match(self, offer):
+        """Subscriptions matching an offer, in the order they were configured."""
+        candidates = self.candidates_for(offer)
+        matched = [self.subscriptions[idx] for idx in sorted(candidates)
+                   if self.subscriptions[idx].details_match(offer)]
+        self.offers += 1
+        self.candidates += len(candidates)
+        self.matches += len(matched)
+        return matched
+
+    def route(self, offers):
+        """Group offers by the subscriptions they match.
+
+        Args:
+            offers: List of Offers with their seller info
+
+        Returns:
+            Dictionary mapping each matching Subscription to its offers, in order
+        """
+        routed = {}
+        for offer in offers:
+            for subscription in self.match(offer):
+                routed.setdefault(subscription, []).append(offer)
+        logger.info(f"Matched {len(offers)} offers against {len(self.subscriptions)} subscriptions: "
+                    f"{sum(len(matched) for matched in routed.values())} matches for {len(routed)} subscribers")
+        return routed
+
+    def log_summary(self):
+        """Log how many subscriptions were checked per offer thanks to the indexes."""
+        if not self.offers:
+            return
+        logger.info(f"Subscriptions: {self.offers} offers matched against {len(self.subscriptions)} subscriptions, "
+                    f"{self.candidates / self.offers:.1f} candidates and {self.matches / self.offers:.1f} "
+                    f"matches per offer")
+
+
+def load_subscriptions(specs=(), path=''):
+    """Build the subscriptions of config.py and of an optional JSON file.
+
+    Args:
+        specs: SUBSCRIPTIONS entries
+        path: JSON file holding a list of further entries (empty or missing = none)
+
+    Returns:
+        List of Subscription instances
+
+    Raises:
+        ValueError: If an entry is invalid or two subscriptions share a name
+    """
+    specs = list(specs)
+    if path and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            specs.extend(json.load(f))
+    subscriptions = [Subscription.from_dict(spec) for spec in specs]
+    names = Counter(subscription.name for subscription in subscriptions)
+    duplicates = sorted(name for name, count in names.items() if count > 1)
+    if duplicates:
+        raise ValueError(f"Duplicate subscription names: {duplicates}")
+    if subscriptions:
+        logger.info(f"Loaded {len(subscriptions)} subscriptions")
+    return subscriptions
@@ -0,0 +1,188 @@
+#!/usr/bin/python
+"""
+Test the notification channels of the Wallabot application.
+
+This script starts a local stand-in for a chat/HTTP webhook and delivers the
+same offers to a webhook, a JSONL file and an email outbox through the
+NotificationDispatcher. It checks the payloads, that a webhook that never
+answers is given up on after its timeout without delaying the other channels,
+that the offers of a failed delivery are sent to it again on the next run, and
+that a delivery ending after its timeout is not sent twice.
+No network access and no email account are needed.
+"""
+import email
+import json
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from channels import Channel, NotificationDispatcher, RetryQueue, create_channel
+from offer import Offer
+from outbox import Outbox
+
+TEST_OFFERS = [
+    Offer(titulo='PlayStation 5 Pro 2TB', precio='560 €', search='PS5 Pro',
+          enlace='https://es.wallapop.com/item/playstation-5-pro-2tb-1098765432', seller_name='Lucía M.'),
+    Offer(titulo='PS5 Pro + 2 mandos', precio='590 €', search='PS5 Pro', reservada=True,
+          enlace='https://es.wallapop.com/item/ps5-pro-2-mandos-1098765401'),
+]
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """Record the JSON posted to /hook; /slow only answers once the test releases it."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path == '/slow':
+            self.server.release.wait(10)
+        elif self.path == '/broken' or (self.path == '/flaky' and self.server.flaky_down):
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.server.received.append((self.path, self.headers.get('Authorization'), json.loads(body)))
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class BarrierChannel(Channel):
+    """Deliver only if every BarrierChannel is delivering at the same time."""
+
+    def __init__(self, name, barrier):
+        super().__init__(name, timeout=5)
+        self.barrier = barrier
+
+    def deliver(self, offers):
+        # Raises BrokenBarrierError if the channels are delivered one after the other
+        self.barrier.wait(timeout=2)
+
+
+class LateChannel(Channel):
+    """Deliver only once the test releases it, long after the timeout."""
+
+    def __init__(self):
+        super().__init__('late channel', timeout=0.2)
+        self.release = threading.Event()
+        self.delivered = []
+
+    def deliver(self, offers):
+        if not self.release.wait(10):
+            raise TimeoutError("never released")
+        self.delivered.append([offer['enlace'] for offer in offers])
+
+
+def test_channels():
+    """
+    Deliver two offers to every channel type at once.
+
+    Checks the JSON and text webhook payloads, the JSONL lines, the queued
+    email, the per-channel timeout and that failures stay on their channel.
+    """
+    print("Starting notification channels test...")
+    server = ThreadingHTTPServer(('127.0.0.1', 0), WebhookHandler)
+    server.received = []
+    server.flaky_down = True
+    server.release = threading.Event()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"- Webhook stand-in: {base}")
+
+    directory = tempfile.mkdtemp(prefix='wallabot-channels-')
+    jsonl_path = os.path.join(directory, 'offers.jsonl')
+    outbox = Outbox(os.path.join(directory, 'outbox'))
+    specs = [
+        {'type': 'webhook', 'url': f"{base}/hook", 'headers': {'Authorization': 'Bearer test'}},
+        {'type': 'webhook', 'url': f"{base}/chat", 'text_field': 'text'},
+        {'type': 'webhook', 'url': f"{base}/slow", 'name': 'slow webhook', 'timeout': 0.5},
+        {'type': 'webhook', 'url': f"{base}/broken", 'name': 'broken webhook'},
+        {'type': 'jsonl', 'path': jsonl_path},
+        {'type': 'email', 'to': ['me@example.com', 'friend@example.com']},
+    ]
+    # The slow webhook and the two barrier channels only deliver if they all run at once
+    barrier = threading.Barrier(2)
+    dispatcher = NotificationDispatcher([create_channel(spec, outbox, 'bot@example.com') for spec in specs]
+                                        + [BarrierChannel('barrier 1', barrier), BarrierChannel('barrier 2', barrier)])
+    try:
+        results = dispatcher.dispatch(TEST_OFFERS)
+        print(f"- Dispatched: {results}")
+        # The slow webhook was given up on after its own timeout, while it was still waiting
+        assert not server.release.is_set()
+        assert results == {
+            f"webhook:127.0.0.1:{server.server_address[1]}": True,
+            f"webhook:127.0.0.1:{server.server_address[1]} #2": True,
+            'slow webhook': False,
+            'broken webhook': False,
+            f"jsonl:{jsonl_path}": True,
+            'email:me@example.com, friend@example.com': True,
+            'barrier 1': True,
+            'barrier 2': True,
+        }
+        server.release.set()
+
+        received = dict((path, (auth, payload)) for path, auth, payload in server.received)
+        auth, payload = received['/hook']
+        assert auth == 'Bearer test' and payload['count'] == 2
+        assert payload['offers'][0]['titulo'] == 'PlayStation 5 Pro 2TB' and payload['offers'][1]['reservada'] is True
+        assert 'precio: 560 €' in received['/chat'][1]['text']
+        print(f"- Webhooks received: {sorted(received)}")
+
+        with open(jsonl_path, 'r', encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+        assert [line['enlace'] for line in lines] == [offer['enlace'] for offer in TEST_OFFERS]
+        assert all(line['notified_at'] for line in lines)
+        print(f"- JSONL file has {len(lines)} lines")
+
+        entries = outbox.entries()
+        assert len(entries) == 1 and entries[0]['recipients'] == ['me@example.com', 'friend@example.com']
+        message = email.message_from_string(entries[0]['message'])
+        assert message['To'] == 'me@example.com, friend@example.com'
+        print(f"- Email queued for {message['To']}")
+
+        # A failed delivery is kept and sent to its channel again, on the next run
+        retry_path = os.path.join(directory, 'notify_retry.json')
+        retry_specs = [{'type': 'webhook', 'url': f"{base}/flaky", 'name': 'flaky webhook'},
+                       {'type': 'jsonl', 'path': os.path.join(directory, 'retry.jsonl'), 'name': 'retry jsonl'}]
+        first_run = NotificationDispatcher([create_channel(spec, outbox, 'bot@example.com') for spec in retry_specs],
+                                           RetryQueue(retry_path))
+        assert first_run.dispatch(TEST_OFFERS[:1]) == {'flaky webhook': False, 'retry jsonl': True}
+        first_run.close()
+        server.flaky_down = False
+        second_run = NotificationDispatcher([create_channel(spec, outbox, 'bot@example.com') for spec in retry_specs],
+                                            RetryQueue(retry_path))
+        assert len(second_run.retry_queue) == 1
+        assert second_run.dispatch(TEST_OFFERS[1:]) == {'flaky webhook': True, 'retry jsonl': True}
+        flaky_payload = [payload for path, _, payload in server.received if path == '/flaky'][0]
+        assert [offer['enlace'] for offer in flaky_payload['offers']] == [offer['enlace'] for offer in TEST_OFFERS]
+        with open(os.path.join(directory, 'retry.jsonl'), 'r', encoding='utf-8') as f:
+            assert len(f.readlines()) == 2
+        assert len(RetryQueue(retry_path)) == 0 and second_run.retry_failed() == {}
+        second_run.close()
+        print("- Failed webhook delivery retried on the next run")
+
+        # A delivery that ends after its timeout is not sent again once it succeeded
+        late = LateChannel()
+        late_run = NotificationDispatcher([late], RetryQueue(os.path.join(directory, 'late_retry.json')))
+        assert late_run.dispatch(TEST_OFFERS[:1]) == {'late channel': False}
+        # Still running: the new offers wait in the queue instead of a second delivery
+        assert late_run.dispatch(TEST_OFFERS[1:]) == {}
+        assert len(late_run.retry_queue) == 2
+        late.release.set()
+        late_run.close()
+        assert late.delivered == [[TEST_OFFERS[0]['enlace']]]
+        assert [entry['enlace'] for entry in late_run.retry_queue.pending['late channel']] == [TEST_OFFERS[1]['enlace']]
+        assert late_run.delivered['late channel'] == 1
+        print("- Late delivery counted as delivered, its offers not sent twice")
+        print("Notification channels test passed!")
+    finally:
+        server.release.set()
+        dispatcher.close()
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    test_channels()
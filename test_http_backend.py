@@ -0,0 +1,155 @@
+#!/usr/bin/python
+"""
+Test the HTTP fetch backend of the Wallabot application.
+
+This script starts a local stand-in for the Wallapop API that serves the
+recorded JSON responses in fixtures/, points an HttpBackend at it and checks
+that searches, detail lookups and filters behave like the Selenium backend.
+No browser and no network access are needed.
+"""
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from backends import FallbackBackend, FetchBackend, HttpBackend, empty_seller_info
+from filters import apply_detail_filters
+from offer import Offer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Settings used by the filters during the test
+TEST_SETTINGS = {
+    'SKIP_PROFESIONAL_SELLER': True,
+    'SHIPPING_REQUIRED': True,
+    'SKIP_WITH_LESS_THAN_SALES_NUMBER': 5,
+    'SKIP_WITH_LESS_THAN_RATING_COUNTER': 5,
+}
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Serve /api/v3/... paths from the recorded fixture files."""
+
+    protocol_version = 'HTTP/1.1'  # Keep connections alive like the real API
+
+    def fixture_name(self):
+        parts = self.path.split('?')[0].strip('/').split('/')[2:]
+        if parts == ['search']:
+            if 'keywords=offline' in self.path:
+                return None
+            return 'search_page_2.json' if 'next_page=' in self.path else 'search.json'
+        if len(parts) == 2 and parts[0] == 'items':
+            return f"item_{parts[1]}.json"
+        if len(parts) == 2 and parts[0] == 'users':
+            return f"user_{parts[1]}.json"
+        if len(parts) == 3 and parts[0] == 'users' and parts[2] == 'stats':
+            return f"user_{parts[1]}_stats.json"
+        return None
+
+    def do_GET(self):
+        name = self.fixture_name()
+        path = os.path.join(FIXTURES_DIR, name) if name else None
+        if path and os.path.exists(path):
+            with open(path, 'rb') as f:
+                body = f.read()
+            self.send_response(200)
+        else:
+            body = json.dumps({'error': 'not found'}).encode('utf-8')
+            self.send_response(404)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class BrowserStandIn(FetchBackend):
+    """Fallback backend finding one item and looking up its details itself."""
+
+    name = 'selenium'
+
+    def search(self, search, limit):
+        return 1, [Offer(titulo='Found by the browser', enlace='https://es.wallapop.com/item/browser-item-1')]
+
+    def get_details(self, item):
+        return dict(empty_seller_info(), name='Browser seller')
+
+
+def test_http_backend():
+    """
+    Run a search and the detail lookups against the local fixture server.
+
+    Checks the Offers built from the search JSON and its next page, the seller
+    info built from the item and user JSON, the numbers parsed when it is
+    merged, the detail filters and the reuse of keep-alive connections.
+    """
+    print("Starting HTTP backend test...")
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_base = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"- Fixture server: {api_base}")
+
+    setting = lambda name, default=None: TEST_SETTINGS.get(name, default)
+    backend = HttpBackend(api_base=api_base)
+    try:
+        search = {'name': 'test', 'url': 'https://es.wallapop.com/app/search?keywords=ps5%20pro&order_by=newest'}
+        total, items = backend.search(search, limit=10)
+        print(f"- Search returned {total} items")
+        assert total == 3 and len(items) == 3
+        first = items[0]
+        assert first['titulo'] == 'PlayStation 5 Pro 2TB'
+        assert first['precio'] == '560 €'
+        assert first['enlace'] == 'https://es.wallapop.com/item/playstation-5-pro-2tb-1098765432'
+        assert first['image_url'].endswith('pictureSize=W640')
+        assert first['item_id'] == '8j3yq5w07wzx' and first['seller_id'] == 'qjwy4weoxqzo'
+        assert first.price == 560.0
+        assert items[1]['reservada'] is True and items[1].price == 599.99
+
+        more = backend.more_results(search)
+        print(f"- Next page returned {len(more)} items")
+        assert [item['item_id'] for item in more] == ['p8j3k1m2q9zx', 'm4xz0r7wq2jx']
+        assert backend.more_results(search) == []
+
+        details = backend.enrich([items[0], items[2]])
+        seller, professional = details
+        print(f"- Seller of first item: {seller['name']} ({seller['sales']} sales, {seller['number_of_rates']} ratings)")
+        assert seller['name'] == 'Lucía M.' and seller['rate'] == '4.7'
+        assert seller['sales'] == '23' and seller['number_of_rates'] == '19'
+        assert seller['views'] == '134' and seller['shipping'] == 'Sí'
+
+        items[0].apply_seller_info(seller)
+        assert items[0].sales == 23 and items[0].rating_count == 19 and items[0].rate == 4.7
+        assert apply_detail_filters(items[0], seller['found'], setting, first['titulo']) is None
+        items[2].apply_seller_info(professional)
+        reason = apply_detail_filters(items[2], professional['found'], setting, items[2]['titulo'])
+        print(f"- Second item filtered: {reason}")
+        assert reason == 'professional seller'
+
+        missing = dict(items[0], item_id='does-not-exist')
+        assert backend.get_details(missing) is None
+
+        print(f"- {backend.pool.requests} requests over {backend.pool.connections} connections")
+        assert backend.pool.connections < backend.pool.requests
+
+        # Items are looked up by the backend that found them, whichever searched last
+        fallback = FallbackBackend(backend, BrowserStandIn)
+        http_items = fallback.search(search, limit=1)[1]
+        browser_items = fallback.search({'name': 'offline', 'url': 'https://es.wallapop.com/app/search?keywords=offline'},
+                                        limit=10)[1]
+        assert fallback.current is fallback.fallback
+        mixed = http_items + browser_items
+        assert [item['source'] for item in mixed] == ['http', 'selenium']
+        details = fallback.enrich(mixed)
+        assert details[0]['name'] == 'Lucía M.' and details[1]['name'] == 'Browser seller'
+        print(f"- Fallback backend routed lookups to {[item['source'] for item in mixed]}")
+        print("HTTP backend test passed!")
+    finally:
+        backend.close()
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    test_http_backend()
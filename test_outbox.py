@@ -0,0 +1,143 @@
+#!/usr/bin/python
+"""
+Test the email outbox of the Wallabot application.
+
+This script starts a minimal local SMTP server and delivers queued emails to
+it through an OutboxSender, to check that several emails share one SMTP
+session and that emails queued while the server is down stay in the outbox
+until it comes back. No email account and no network access are needed.
+"""
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+from time import sleep, time
+
+from outbox import Outbox, SmtpSession, OutboxSender
+
+
+class SmtpStandIn(socketserver.StreamRequestHandler):
+    """Accept every message (the smtpd module is gone from recent Python versions)."""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        stats = self.server.stats
+        stats['connections'] += 1
+        self.reply("220 localhost test SMTP server")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().split(' ')[0].upper()
+            if command == 'EHLO':
+                self.reply("250-localhost")
+                self.reply("250 AUTH PLAIN LOGIN")
+            elif command == 'AUTH':
+                stats['logins'] += 1
+                self.reply("235 Authentication successful")
+            elif command == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                stats['messages'] += 1
+                self.reply("250 OK")
+            elif command == 'QUIT':
+                self.reply("221 Bye")
+                return
+            elif command in ('HELO', 'MAIL', 'RCPT', 'NOOP', 'RSET'):
+                self.reply("250 OK")
+            else:
+                self.reply("502 Command not implemented")
+
+
+def start_server(port=0):
+    """Start the SMTP stand-in on a local port and return it."""
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', port), SmtpStandIn)
+    server.daemon_threads = True
+    server.stats = {'connections': 0, 'logins': 0, 'messages': 0}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def queue_messages(outbox, count):
+    for i in range(count):
+        outbox.put('bot@example.com', 'me@example.com', f"Subject: Offer {i}\r\n\r\nNew offer {i}\r\n")
+
+
+def wait_until_empty(outbox, timeout=10):
+    deadline = time() + timeout
+    while len(outbox) and time() < deadline:
+        sleep(0.05)
+    return len(outbox) == 0
+
+
+def test_outbox():
+    """
+    Deliver queued emails to the local SMTP stand-in.
+
+    Checks that a batch of emails goes over a single connection and login, and
+    that emails survive a server outage in the outbox and are retried.
+    """
+    print("Starting outbox test...")
+    directory = tempfile.mkdtemp(prefix='wallabot-outbox-')
+
+    # Several emails, one session
+    server = start_server()
+    port = server.server_address[1]
+    print(f"- SMTP stand-in on port {port}")
+    outbox = Outbox(os.path.join(directory, 'batch'))
+    session = SmtpSession('127.0.0.1', port, username='bot@example.com', password='secret', starttls=False)
+    sender = OutboxSender(outbox, session)
+    sender.start()
+    try:
+        queue_messages(outbox, 5)
+        sender.wake()
+        assert wait_until_empty(outbox), "queued emails were not sent"
+    finally:
+        left = sender.stop()
+        server.shutdown()
+        server.server_close()
+    stats = server.stats
+    print(f"- {stats['messages']} emails over {stats['connections']} connection(s), {stats['logins']} login(s)")
+    assert left == 0 and sender.sent == 5 and stats['messages'] == 5
+    assert stats['connections'] == 1 and stats['logins'] == 1
+
+    # Server down: the emails wait in the outbox
+    port = free_port()
+    outbox = Outbox(os.path.join(directory, 'outage'))
+    session = SmtpSession('127.0.0.1', port, starttls=False, timeout=2)
+    sender = OutboxSender(outbox, session, backoff=0.2, max_backoff=0.5)
+    queue_messages(outbox, 3)
+    next_due = sender.deliver_due()
+    entries = outbox.entries()
+    print(f"- Server down: {len(entries)} emails kept, retry in {next_due:.1f} seconds")
+    assert len(entries) == 3 and entries[0]['attempts'] == 1 and entries[0]['last_error']
+    assert sender.sent == 0 and 0 < next_due <= 0.5
+
+    # Server back: a new sender (as in the next run) delivers them
+    server = start_server(port)
+    sender = OutboxSender(outbox, session, backoff=0.2, max_backoff=0.5)
+    sender.start()
+    try:
+        assert wait_until_empty(outbox), "emails were not retried"
+    finally:
+        sender.stop()
+        server.shutdown()
+        server.server_close()
+    print(f"- Server back: {server.stats['messages']} emails delivered")
+    assert server.stats['messages'] == 3
+    print("Outbox test passed!")
+
+
+if __name__ == "__main__":
+    test_outbox()
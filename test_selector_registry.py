@@ -0,0 +1,64 @@
+#!/usr/bin/python
+"""
+Test the selector strategy registry of the Wallabot application.
+
+This script starts a registry from a stats file holding stale winners, as
+left by a run where Wallapop's markup briefly changed, and checks that a
+winning fallback selector is not promoted ahead of the precise one while an
+ordinary winner still is. No browser and no network access are needed.
+"""
+import json
+import os
+import tempfile
+
+from selector_registry import SelectorRegistry
+
+# Same shape as the seller fields of DETAIL_FIELDS in extraction.py
+SPEC = {
+    'number_of_rates': [
+        {'css': '[data-testid="reviewsCounter"]'},
+        {'css': 'a[href="#item-detail-reviews"]', 'fallback': True},
+    ],
+    'location': [
+        {'css': 'div[class*="item-detail-location"]', 'child': 'a'},
+        {'css': 'walla-icon[icon="location"] span'},
+        {'css': '.ItemDetail__location'},
+    ],
+}
+
+
+def stale_state(winner):
+    return {'winner': winner, 'wins': {str(winner): 40}, 'absent_streak': 0, 'skipped_since_probe': 0}
+
+
+def test_selector_registry():
+    """
+    Plan a detail page with stale winners and record the page that follows.
+    """
+    print("Starting selector registry test...")
+    with tempfile.TemporaryDirectory() as directory:
+        stats_file = os.path.join(directory, 'selector_stats.json')
+        with open(stats_file, 'w', encoding='utf-8') as f:
+            json.dump({'detail': {'number_of_rates': stale_state(1), 'location': stale_state(2)}}, f)
+        registry = SelectorRegistry(stats_file, pinned_fields={'number_of_rates'})
+
+        spec, order = registry.plan('detail', SPEC)
+        print(f"- Strategy order: {order}")
+        assert order['number_of_rates'] == [0, 1], "the fallback winner was promoted over the counter"
+        assert spec['number_of_rates'][0] == SPEC['number_of_rates'][0]
+        assert order['location'] == [2, 0, 1]
+        assert spec['location'][0] == SPEC['location'][2]
+
+        # The counter is back: it wins the field again
+        registry.record('detail', order, {'number_of_rates': {'value': '(19)', 'index': 0},
+                                          'location': {'value': 'Madrid', 'index': 0}})
+        assert registry.fields['detail']['number_of_rates']['winner'] == 0
+        assert registry.fields['detail']['location']['winner'] == 2
+        registry.save()
+        with open(stats_file, 'r', encoding='utf-8') as f:
+            assert json.load(f)['detail']['number_of_rates']['winner'] == 0
+    print("Selector registry test passed!")
+
+
+if __name__ == "__main__":
+    test_selector_registry()
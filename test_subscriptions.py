@@ -0,0 +1,90 @@
+#!/usr/bin/python
+"""
+Test the subscription matching engine of the Wallabot application.
+
+This script generates random subscriptions and offers and checks that the
+SubscriptionIndex finds exactly the subscriptions a full scan of every
+subscription finds. The matching speed at scale is measured by
+bench_subscriptions.py. No browser and no network access are needed.
+"""
+import random
+
+from offer import Offer
+from subscriptions import IntervalTree, Subscription, SubscriptionIndex, load_subscriptions
+
+WORDS = ['ps5', 'pro', 'slim', 'digital', 'mando', 'dualsense', 'switch', 'oled', 'xbox', 'series', 'x',
+         'steam', 'deck', 'iphone', '15', 'nintendo', 'portátil', 'caja', 'vacía', 'roto', 'juegos', 'nueva']
+
+
+def random_subscription(rng, idx):
+    spec = {'name': f"subscriber {idx}"}
+    if rng.random() < 0.9:
+        spec['keywords'] = [' '.join(rng.sample(WORDS, rng.choice([1, 1, 2]))) for _ in range(rng.randint(1, 3))]
+    if rng.random() < 0.3:
+        spec['exclude_keywords'] = [rng.choice(['roto', 'caja vacía'])]
+    if rng.random() < 0.85:
+        low = rng.choice([None, rng.randint(50, 600)])
+        spec['min_price'] = low
+        spec['max_price'] = rng.choice([None, (low or 0) + rng.randint(20, 300)])
+    if rng.random() < 0.3:
+        spec['min_sales'] = rng.randint(1, 20)
+    if rng.random() < 0.3:
+        spec['min_seller_rate'] = rng.choice([3, 4, 4.5])
+    if rng.random() < 0.2:
+        spec['shipping_required'] = True
+    if rng.random() < 0.2:
+        spec['skip_professional'] = True
+    if rng.random() < 0.1:
+        spec['searches'] = ['consoles']
+    return spec
+
+
+def random_offer(rng, idx):
+    return Offer(titulo=' '.join(rng.sample(WORDS, rng.randint(2, 5))).capitalize(),
+                 precio=rng.choice([f"{rng.randint(30, 900)} €", f"{rng.randint(1, 2)}.{rng.randint(100, 999)},50 €"]),
+                 enlace=f"https://es.wallapop.com/item/offer-{idx}", search=rng.choice(['consoles', 'phones']),
+                 reservada=rng.random() < 0.1, shipping=rng.choice(['Sí', 'No']),
+                 seller_profesional=rng.choice(['Sí', 'No', 'No']), seller_rate=str(rng.choice([3.5, 4.2, 4.9])),
+                 seller_sales=str(rng.randint(0, 40)), seller_number_of_rates=f"({rng.randint(0, 90)})")
+
+
+def test_subscriptions(count=300, offers=100):
+    """
+    Compare the indexed matching with a full scan on random data.
+    """
+    print("Starting subscriptions test...")
+    rng = random.Random(42)
+
+    # Interval tree against a scan
+    intervals = [(low, low + rng.randint(0, 100), i) for i, low in enumerate(rng.randint(0, 1000) for _ in range(200))]
+    intervals.append((float('-inf'), 10, 'open low'))
+    intervals.append((990, float('inf'), 'open high'))
+    tree = IntervalTree(intervals)
+    for point in [rng.uniform(-50, 1200) for _ in range(100)] + [0, 10, 990, 1000]:
+        assert set(tree.stab(point)) == {value for low, high, value in intervals if low <= point <= high}
+    print(f"- Interval tree agrees with a scan of {len(intervals)} ranges")
+
+    # Keyword semantics
+    subscription = Subscription('keywords', keywords=['PS5 Pro'], exclude_keywords=['caja vacía'], max_price=600)
+    assert subscription.matches(Offer(titulo='Vendo PS5 PRO nueva', precio='550 €'))
+    assert not subscription.matches(Offer(titulo='PS5 Pro caja VACIA', precio='50 €'))
+    assert not subscription.matches(Offer(titulo='PS5 slim pro', precio='400 €'))
+    assert not subscription.matches(Offer(titulo='PS5 Pro', precio='650 €'))
+
+    subscriptions = load_subscriptions([random_subscription(rng, i) for i in range(count)])
+    index = SubscriptionIndex(subscriptions)
+    test_offers = [random_offer(rng, i) for i in range(offers)]
+    indexed = [index.match(offer) for offer in test_offers]
+    scanned = [[s for s in subscriptions if s.matches(offer)] for offer in test_offers]
+    assert indexed == scanned, "the index and the full scan disagree"
+    print(f"- {offers} offers x {count} subscriptions: {sum(len(matched) for matched in indexed)} matches, "
+          f"{index.candidates / offers:.0f} candidates checked per offer instead of {count}")
+    assert index.candidates < offers * count / 2
+
+    routed = index.route(test_offers[:50])
+    assert all(subscription.matches(offer) for subscription, matched in routed.items() for offer in matched)
+    print("Subscriptions test passed!")
+
+
+if __name__ == "__main__":
+    test_subscriptions()
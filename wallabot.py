@@ -8,13 +8,28 @@ from time import sleep, time
 from selenium.common.exceptions import NoSuchElementException
 import os
 import config as cfg
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import logging
-import email_template
-import json
 import datetime
+import threading
+from page_waits import PageWaiter
+from driver_pool import DriverPool, is_driver_alive
+from extraction import extract_cards, extract_detail, count_cards, load_more_cards, DETAIL_FIELDS
+from selector_registry import SelectorRegistry
+from pipeline import Pipeline, chunked
+from run_scheduler import RunScheduler
+from incremental_scan import ScanMarks, is_newest_first, cut_at_known
+from history_store import open_history_store
+from outbox import Outbox, SmtpSession, OutboxSender, smtp_server_for
+from digest import Digest
+from channels import NotificationDispatcher, RetryQueue, create_channels
+from subscriptions import SubscriptionIndex, load_subscriptions
+from backends import FetchBackend, HttpBackend, FallbackBackend, empty_item, empty_seller_info
+import filters
+from filters import apply_card_filters, apply_detail_filters
+from network_capture import (enable_performance_logging, discard_captured, read_network_events,
+                             transferred_bytes, capture_search_items, capture_detail)
+from driver_cache import resolve_chromedriver, forget_chromedriver
+from resource_blocking import DEFAULT_BLOCKED_URL_PATTERNS, apply_blocking_prefs, apply_url_blocking
 
 # Set up logging based on DEBUG flag in config
 DEBUG = getattr(cfg, 'DEBUG', False)
@@ -51,333 +66,397 @@ def log_debug(message):
     if DEBUG:
         logger.debug(message)
 
-def send_mail(offers):
-    """Build message with current offers and send them via email.
+# Build items from the API responses the pages download instead of the rendered DOM
+CAPTURE_NETWORK_JSON = getattr(cfg, 'CAPTURE_NETWORK_JSON', False)
+
+# Measure the bytes transferred by every detail page load
+MEASURE_PAGE_WEIGHT = getattr(cfg, 'MEASURE_PAGE_WEIGHT', False)
+
+# Both features read the DevTools network events of the browser
+NETWORK_LOGGING = CAPTURE_NETWORK_JSON or MEASURE_PAGE_WEIGHT
+
+# Skip images, web fonts and trackers in the scraping browser
+BLOCK_RESOURCES = getattr(cfg, 'BLOCK_RESOURCES', False)
+BLOCKED_URL_PATTERNS = getattr(cfg, 'BLOCKED_URL_PATTERNS', DEFAULT_BLOCKED_URL_PATTERNS) if BLOCK_RESOURCES else []
+
+# Search currently being scraped; its keys override config.py settings
+active_search = {}
+
+# WebDriver sessions where the cookie banner was already accepted
+consented_sessions = set()
+
+def has_consent_cookie(driver):
+    """Check whether the OneTrust cookie banner was already accepted in this browser profile
     
     Args:
-        offers: List of offer dictionaries containing product information
-    """
-    if not offers:
-        logger.info("No offers to send.")
-        return
+        driver: Selenium WebDriver instance showing a Wallapop page
         
-    # Setup mail server
+    Returns:
+        True if the consent cookie is present
+    """
     try:
-        # Select the appropriate mail server based on the email domain
-        if '@gmail.com' in cfg.username:
-            server = smtplib.SMTP("smtp.gmail.com", port=587)
-            server.starttls()
-            logger.info("Using Gmail SMTP server")
-        else:
-            server = smtplib.SMTP("smtp.sapo.pt", port=587)
-            server.starttls()
-            logger.info("Using Sapo SMTP server")
+        return driver.get_cookie('OptanonAlertBoxClosed') is not None
+    except Exception:
+        return False
+
+def setting(name, default=None):
+    """Read a setting, letting the active search override config.py
+    
+    Args:
+        name: Setting name as used in config.py (e.g. 'SHIPPING_REQUIRED')
+        default: Value used when neither the search nor config.py define it
         
-        server.set_debuglevel(DEBUG)
+    Returns:
+        Setting value
+    """
+    if name in active_search:
+        return active_search[name]
+    return getattr(cfg, name, default)
 
-        try:
-            server.login(cfg.username, cfg.password)
-            logger.info("Email login successful")
-        except smtplib.SMTPAuthenticationError as e:
-            logger.error(f"SMTP Authentication Error: {e}")
-            logger.error("\nFor Gmail accounts, you need to:")
-            logger.error("1. Enable 2-factor authentication: https://myaccount.google.com/security")
-            logger.error("2. Create an app password: https://myaccount.google.com/apppasswords")
-            logger.error("3. Use that app password in config.py instead of your regular password")
-            server.quit()
-            return
+def get_searches():
+    """Return the searches configured for this run
+    
+    Returns:
+        List of search dictionaries with at least 'name', 'url' and 'namespace'.
+        Without SEARCHES in config.py, OFFERS_URL is used as a single search
+        that keeps the legacy (unnamespaced) history.
+    """
+    searches = []
+    for search in getattr(cfg, 'SEARCHES', None) or []:
+        if not search.get('url') or not search.get('name'):
+            logger.error(f"Ignoring search without name or url: {search}")
+            continue
+        searches.append(dict(search, namespace=search['name']))
+    if not searches:
+        searches.append({'name': 'default', 'url': cfg.OFFERS_URL, 'namespace': ''})
+    return searches
+
+# Condition-based waits shared by every page visit in this process
+page_waiter = PageWaiter(
+    timeouts=getattr(cfg, 'WAIT_TIMEOUTS', None),
+    timings_file=getattr(cfg, 'WAIT_TIMINGS_FILE', 'wait_timings.json'),
+    adaptive_factor=getattr(cfg, 'ADAPTIVE_WAIT_FACTOR', 4),
+    min_timeout=getattr(cfg, 'MIN_WAIT_TIMEOUT', 2)
+)
 
-        # Setup message
-        message = MIMEMultipart("alternative")
-        message["Subject"] = "Wallabot - New items found in Wallapop"
-        message["From"] = cfg.username
-        message["To"] = cfg.receiver
+# Winning selector strategies per detail field, shared by every page visit in this process
+selector_registry = SelectorRegistry(
+    stats_file=getattr(cfg, 'SELECTOR_STATS_FILE', 'selector_stats.json'),
+    skip_after_misses=getattr(cfg, 'SELECTOR_SKIP_AFTER_MISSES', 10),
+    recheck_every=getattr(cfg, 'SELECTOR_RECHECK_EVERY', 5),
+    pinned_fields=filters.FILTER_FIELDS
+)
 
-        # Generate email content using the template module
-        text = email_template.generate_text_body(offers)
-        html = email_template.generate_html_body(offers)
+# Secondary tab used for detail pages, keyed by the search results window handle
+detail_tabs = {}
 
-        # Convert both parts to MIMEText objects and add them to the MIMEMultipart message
-        part1 = MIMEText(text, "plain")
-        part2 = MIMEText(html, "html")
-        message.attach(part1)
-        message.attach(part2)
+# Timing counters for detail page navigation (load = open + wait, return = back to results)
+# and bytes transferred by the detail pages whose weight was measured
+nav_stats = {'pages': 0, 'load_time': 0.0, 'returns': 0, 'return_time': 0.0, 'weighed': 0, 'bytes': 0}
+nav_stats_lock = threading.Lock()
+
+def record_navigation(kind, elapsed):
+    """Add a detail page load or return to the navigation counters
+    
+    Args:
+        kind: 'load' or 'return'
+        elapsed: Seconds spent
+    """
+    with nav_stats_lock:
+        if kind == 'load':
+            nav_stats['pages'] += 1
+            nav_stats['load_time'] += elapsed
+        else:
+            nav_stats['returns'] += 1
+            nav_stats['return_time'] += elapsed
+
+def record_page_weight(transferred):
+    """Add the bytes transferred by one detail page load to the navigation counters"""
+    with nav_stats_lock:
+        nav_stats['weighed'] += 1
+        nav_stats['bytes'] += transferred
+
+def log_navigation_summary():
+    """Log the average cost of loading and leaving a detail page"""
+    with nav_stats_lock:
+        stats = dict(nav_stats)
+    if not stats['pages']:
+        return
+    mode = getattr(cfg, 'DETAIL_NAVIGATION', 'tab')
+    logger.info(f"Detail navigation ({mode}): {stats['pages']} pages, "
+                f"avg load {stats['load_time']/stats['pages']:.2f}s, "
+                f"avg return {stats['return_time']/max(1, stats['returns']):.2f}s per item "
+                f"({stats['return_time']:.2f}s spent returning to results)")
+    if stats['weighed']:
+        profile = "blocking" if BLOCK_RESOURCES else "full"
+        logger.info(f"Detail page weight ({profile} profile, page load strategy "
+                    f"{getattr(cfg, 'PAGE_LOAD_STRATEGY', 'normal')}): "
+                    f"avg {stats['bytes']/stats['weighed']/1024:.1f} KB transferred, "
+                    f"avg ready {stats['load_time']/stats['pages']:.2f}s per page")
 
-        # Send Mail
+def open_detail_page(driver, product_url):
+    """Load a product page without losing the search results
+    
+    In 'tab' navigation mode the page is opened in a reusable secondary tab so the
+    search results tab (and its infinite-scroll state) is never re-rendered.
+    In 'back' mode the current tab navigates away and must go back afterwards.
+    
+    Args:
+        driver: Selenium WebDriver instance showing the search results
+        product_url: URL of the product detail page
+        
+    Returns:
+        Window handle of the search results tab, or None in 'back' mode
+    """
+    results_handle = None
+    if getattr(cfg, 'DETAIL_NAVIGATION', 'tab') == 'tab':
+        results_handle = driver.current_window_handle
+        detail_handle = detail_tabs.get(results_handle)
         try:
-            server.sendmail(
-                cfg.username, cfg.receiver, message.as_string()
-            )
-            logger.info("Email sent successfully.")
-        except smtplib.SMTPException as e:
-            logger.error(f"SMTP Exception: {e}")
-        finally:
-            server.quit()
-            
+            if detail_handle is None:
+                raise KeyError(results_handle)
+            driver.switch_to.window(detail_handle)
+        except Exception:
+            # First visit, or the detail tab was closed: open a new one
+            driver.switch_to.new_window('tab')
+            detail_tabs[results_handle] = driver.current_window_handle
+            # The URL block list is set per tab
+            apply_url_blocking(driver, BLOCKED_URL_PATTERNS)
+            log_debug("Opened secondary tab for detail pages")
+    driver.get(product_url)
+    return results_handle
+
+def return_to_search_page(driver, results_handle):
+    """Go back to the search results after visiting a product page
+    
+    Args:
+        driver: Selenium WebDriver instance
+        results_handle: Handle returned by open_detail_page
+    """
+    if results_handle:
+        driver.switch_to.window(results_handle)
+    else:
+        driver.back()
+        page_waiter.wait(driver, 'search')
+
+class Notifications:
+    """Notification channels of the bot, with the outbox sender and the digest
+    
+    Built by init_notifications() when the bot starts, so importing this
+    module neither creates the outbox nor reads the subscriptions.
+    
+    Args:
+        outbox_sender: OutboxSender delivering the queued emails in the background
+        digest: Digest collecting the offers until its window is over
+        subscription_index: SubscriptionIndex of the subscribers
+        broadcast_channels: Channels receiving every new offer
+        subscriber_channels: Dictionary of Subscription -> its channels
+        dispatcher: NotificationDispatcher delivering to all of them
+    """
+    
+    def __init__(self, outbox_sender, digest, subscription_index, broadcast_channels, subscriber_channels,
+                 dispatcher):
+        self.outbox_sender = outbox_sender
+        self.digest = digest
+        self.subscription_index = subscription_index
+        self.broadcast_channels = broadcast_channels
+        self.subscriber_channels = subscriber_channels
+        self.dispatcher = dispatcher
+    
+    def start(self):
+        """Start sending the emails left in the outbox by earlier runs"""
+        self.outbox_sender.start()
+    
+    def close(self):
+        """Let late deliveries finish, then give the queued emails a chance to go out
+        
+        The emails still queued afterwards wait for the next run.
+        """
+        self.dispatcher.close()
+        self.outbox_sender.stop(getattr(cfg, 'OUTBOX_DRAIN_SECONDS', 60))
+    
+    def log_summary(self):
+        """Log the subscription matching and delivery statistics"""
+        self.subscription_index.log_summary()
+        self.dispatcher.log_summary()
+
+def init_notifications():
+    """Build the notification channels configured in config.py
+    
+    Returns:
+        Notifications of the bot
+        
+    Raises:
+        ValueError: If a subscription is invalid
+    """
+    # Notifications waiting to be emailed, delivered by a background thread
+    outbox = Outbox(getattr(cfg, 'OUTBOX_DIR', 'outbox'))
+    outbox_sender = OutboxSender(
+        outbox,
+        SmtpSession(
+            getattr(cfg, 'SMTP_HOST', '') or smtp_server_for(cfg.username)[0],
+            getattr(cfg, 'SMTP_PORT', 0) or smtp_server_for(cfg.username)[1],
+            username=cfg.username,
+            password=cfg.password,
+            starttls=getattr(cfg, 'SMTP_STARTTLS', True),
+            idle_timeout=getattr(cfg, 'SMTP_IDLE_TIMEOUT', 60),
+            debug=DEBUG
+        ),
+        backoff=getattr(cfg, 'EMAIL_RETRY_BACKOFF', 30),
+        max_backoff=getattr(cfg, 'EMAIL_RETRY_MAX_BACKOFF', 3600),
+        max_attempts=getattr(cfg, 'EMAIL_MAX_ATTEMPTS', 10)
+    )
+    
+    # New offers collected until the digest window is over (disabled when the window is 0)
+    digest = Digest(getattr(cfg, 'DIGEST_FILE', 'digest.json'), getattr(cfg, 'DIGEST_WINDOW_SECONDS', 0))
+    
+    # Subscribers sharing the scrape, each notified of the offers matching their own filters
+    subscription_index = SubscriptionIndex(load_subscriptions(getattr(cfg, 'SUBSCRIPTIONS', []),
+                                                              getattr(cfg, 'SUBSCRIPTIONS_FILE', '')))
+    
+    # Channels receiving every new offer: NOTIFY_CHANNELS, or an email to cfg.receiver without subscriptions
+    channel_options = dict(outbox=outbox, sender=cfg.username, on_queued=outbox_sender.wake,
+                           max_bytes=getattr(cfg, 'EMAIL_MAX_BYTES', 100000),
+                           timeout=getattr(cfg, 'NOTIFY_TIMEOUT_SECONDS', 15))
+    broadcast_channels = create_channels(
+        getattr(cfg, 'NOTIFY_CHANNELS', []) or ([] if len(subscription_index) else [{'type': 'email', 'to': cfg.receiver}]),
+        **channel_options)
+    subscriber_channels = {subscription: create_channels(subscription.channels, owner=subscription.name, **channel_options)
+                           for subscription in subscription_index.subscriptions}
+    # Offers a channel failed to deliver, sent to it again until it does ('' disables the queue)
+    retry_file = getattr(cfg, 'NOTIFY_RETRY_FILE', 'notify_retry.json')
+    dispatcher = NotificationDispatcher(broadcast_channels + [channel for channels in subscriber_channels.values()
+                                                              for channel in channels],
+                                        RetryQueue(retry_file) if retry_file else None)
+    return Notifications(outbox_sender, digest, subscription_index, broadcast_channels, subscriber_channels,
+                         dispatcher)
+
+def open_scan_marks():
+    """Load the high-water marks of the newest-first searches scanned incrementally"""
+    return ScanMarks(getattr(cfg, 'SCAN_MARKS_FILE', 'scan_marks.json'))
+
+def send_notifications(notifications, offers):
+    """Deliver offers to every notification channel at once.
+    
+    The broadcast channels get every offer; each subscriber only gets the
+    offers matching their subscription. Email channels only queue their
+    messages in the outbox; the background outbox sender delivers (and
+    retries) them, so this never waits for the SMTP server. Each channel has
+    its own timeout and failures only affect their own channel: the offers of
+    a failed channel are kept in the NOTIFY_RETRY_FILE queue and sent to it
+    again with its next delivery.
+    
+    Args:
+        notifications: Notifications from init_notifications()
+        offers: List of offer dictionaries containing product information
+        
+    Returns:
+        True if every channel delivered the offers or kept them for a retry
+    """
+    if not offers:
+        logger.info("No offers to send.")
+        return True
+    
+    deliveries = [(channel, offers) for channel in notifications.broadcast_channels]
+    if len(notifications.subscription_index):
+        for subscription, matched in notifications.subscription_index.route(offers).items():
+            deliveries.extend((channel, matched) for channel in notifications.subscriber_channels[subscription])
+    if not deliveries:
+        logger.info("No subscriber matched the new offers")
+        return True
+    try:
+        results = notifications.dispatcher.dispatch_many(deliveries)
     except Exception as e:
-        logger.error(f"Error setting up email: {e}")
+        logger.error(f"Error keeping undelivered offers for a retry: {e}")
+        return False
+    if all(results.values()) or notifications.dispatcher.retry_queue is not None:
+        return True
+    logger.error(f"Offers not delivered to {', '.join(name for name, ok in results.items() if not ok)}")
+    return False
+
+def flush_digest(notifications):
+    """Send the offers collected in the digest once its window is over"""
+    digest = notifications.digest
+    if not digest.due():
+        if len(digest):
+            logger.info(f"{len(digest)} offers waiting in the digest")
+        return
+    logger.info(f"Digest window over, sending {len(digest)} offers")
+    # Keep the digest until every channel delivered it or holds it in its retry queue
+    if send_notifications(notifications, digest.offers()):
+        digest.clear()
 
-def get_seller_info(driver, product_url):
+def get_seller_info(driver, product_url, return_to_results=True):
     """Get seller info, location, and shipping details from product detail page
     
     Args:
         driver: Selenium WebDriver instance
         product_url: URL of the product detail page
+        return_to_results: Navigate back to the search page afterwards (not needed for pooled drivers)
         
     Returns:
-        Dictionary containing seller information and product details
+        Dictionary containing seller information and product details, or None
+        if the page could not be loaded or read (the item is retried later)
     """
     # Initialize result dictionary with default values for product page data
-    result = {
-        "name": "Sin nombre",
-        "sales": "0",
-        "number_of_rates": "0",
-        "rate": "0",
-        "location": "Ubicación desconocida",
-        "shipping": "No",
-        "image_url": "",  # Fallback if not found on search page
-        "filtered": False,
-        "last_update": "Desconocido",  # New: Last update time
-        "views": "0",                  # New: View count
-        "favorites": "0",              # New: Favorites count
-        "profesional": "No"            # New: Professional seller indicator
-    }
+    result = empty_seller_info()
     
+    results_handle = None
     try:
         logger.info(f"Visiting product page: {product_url}")
-        driver.get(product_url)
-        sleep(3)  # Increase wait time for page to load
+        load_start = time()
+        if NETWORK_LOGGING:
+            discard_captured(driver)
+        if return_to_results:
+            results_handle = open_detail_page(driver, product_url)
+        else:
+            driver.get(product_url)
+        # Wait for the seller header, then give the stats spans a short extra window
+        page_waiter.wait(driver, 'detail')
+        page_waiter.wait(driver, 'detail_stats')
+        record_navigation('load', time() - load_start)
+        
+        # Network events of this page load, shared by the weight measurement and the capture
+        events = read_network_events(driver) if NETWORK_LOGGING else []
+        if MEASURE_PAGE_WEIGHT:
+            record_page_weight(transferred_bytes(events))
         
         # Debug page title
         log_debug(f"Product page title: {driver.title}")
         
-        # Extract last update time
-        try:
-            last_update_element = driver.find_element(By.CSS_SELECTOR, 'span[class*="ItemDetailStats__description"]')
-            if last_update_element:
-                result["last_update"] = last_update_element.text.strip()
-                log_debug(f"Found last update: {result['last_update']}")
-        except Exception:
-            log_debug("Last update time not found")
-            
-        # Extract views count
-        try:
-            views_element = driver.find_element(By.CSS_SELECTOR, 'span[aria-label="Views"]')
-            if views_element:
-                result["views"] = views_element.text.strip()
-                log_debug(f"Found views: {result['views']}")
-        except Exception:
-            log_debug("Views count not found")
+        # Prefer the item and seller JSON the page downloaded, fall back to the DOM
+        captured = capture_detail(driver, events) if CAPTURE_NETWORK_JSON else None
+        if captured:
+            result, found = captured
+            log_debug(f"Built seller info from captured API responses: {result}")
+        else:
+            # Read every field of the page in a single script call, trying the
+            # strategies that matched on earlier pages first
+            spec, order = selector_registry.plan('detail', DETAIL_FIELDS)
+            fields = extract_detail(driver, spec)
+            selector_registry.record('detail', order, fields)
+            for key in ("last_update", "views", "favorites", "image_url", "sales",
+                        "number_of_rates", "rate", "name", "location"):
+                value = fields.get(key, {}).get("value")
+                if value:
+                    result[key] = value
+                    log_debug(f"Found {key}: {value}")
+                else:
+                    log_debug(f"{key} not found")
             
-        # Extract favorites count
-        try:
-            favorites_element = driver.find_element(By.CSS_SELECTOR, 'span[aria-label="Favorites"]')
-            if favorites_element:
-                result["favorites"] = favorites_element.text.strip()
-                log_debug(f"Found favorites: {result['favorites']}")
-        except Exception:
-            log_debug("Favorites count not found")
+            has_shipping = bool(fields.get("shipping", {}).get("value"))
+            result["shipping"] = "Sí" if has_shipping else "No"
+            log_debug("Found shipping badge" if has_shipping else "Shipping not available (no badge)")
             
-        # Extract product image - handled in separate try/except
-        # Only as fallback, we now primarily get images from the search page
-        try:
-            # Try a few common selectors for product images
-            selectors = ['img.ImageSlider__image', 'div.detail-gallery img', 'img.detail-image']
-            for selector in selectors:
-                try:
-                    image_element = driver.find_element(By.CSS_SELECTOR, selector)
-                    if image_element:
-                        result["image_url"] = image_element.get_attribute('src')
-                        log_debug(f"Found product image: {result['image_url']}")
-                        break
-                except Exception:
-                    continue
-                    
-            if not result["image_url"] and DEBUG:
-                logger.debug("No product image found with any selector")
-        except Exception:
-            log_debug("Error while trying to find product image")
-        
-        # Check if shipping is available
-        has_shipping = False
-        try:
-            shipping_element = driver.find_element(By.CSS_SELECTOR, 'section[class*="item-detail_ItemDetail"] wallapop-badge[badge-type="shippingAvailable"]')
-            if shipping_element:
-                result["shipping"] = "Sí"
-                has_shipping = True
-                log_debug("Found shipping badge")
-            else:
-                result["shipping"] = "No"
-                log_debug("Shipping not available (no badge)")
-        except Exception:
-            log_debug("Shipping not available (no element)")
-            result["shipping"] = "No"
-        
-        # Check if seller is professional
-        try:
-            professional_badge = driver.find_element(By.CSS_SELECTOR, 'wallapop-badge[aria-label="Seller is professional"]')
-            if professional_badge:
+            # Check if seller is professional
+            if fields.get("profesional", {}).get("value"):
                 result["profesional"] = "Sí"
                 log_debug("Found professional seller badge")
-                
-                # Skip professional sellers if configured
-                if getattr(cfg, 'SKIP_PROFESIONAL_SELLER', False):
-                    logger.info(f"Skipping item from professional seller: {driver.title}")
-                    result["filtered"] = True
-                    return result
-        except Exception:
-            log_debug("Professional seller badge not found")
-            result["profesional"] = "No"
-        
-        # If shipping is required but this item doesn't have it, return early
-        if getattr(cfg, 'SHIPPING_REQUIRED', False) and not has_shipping:
-            logger.info(f"Skipping item without shipping: {driver.title}")
-            result["filtered"] = True
-            return result
-            
-        # Continue with other data extraction if not skipping
-        
-        # Extract sales count - handled in separate try/except
-        try:
-            sales_element = driver.find_element(By.CSS_SELECTOR, 'span[data-testid="sellsCounter"]')
-            result["sales"] = sales_element.text.strip()
-            log_debug(f"Found sales info: {result['sales']}")
-            
-            # Check if we should skip items with low sales counts
-            min_sales = getattr(cfg, 'SKIP_WITH_LESS_THAN_SALES_NUMBER', 0)
-            if min_sales > 0:
-                try:
-                    # Extract numeric part from sales text and handle various formats
-                    sales_text = result["sales"].split()[0]  # Get first part before any space
-                    # Remove parentheses if they exist
-                    sales_text = sales_text.replace("(", "").replace(")", "")
-                    # Remove thousands separators
-                    sales_text = sales_text.replace(".", "").replace(",", "")
-                    sales_count = int(sales_text)
-                    
-                    if sales_count < min_sales:
-                        logger.info(f"Skipping item with too few sales ({sales_count} < {min_sales}): {driver.title}")
-                        result["filtered"] = True
-                        return result
-                except (ValueError, TypeError, IndexError):
-                    # If we can't parse the sales count, assume it's lower than minimum
-                    logger.info(f"Skipping item with unparseable sales count: {result['sales']}")
-                    result["filtered"] = True
-                    return result
-        except Exception:
-            log_debug("Sales number not found")
-        
-        # Extract reviews link - handled in separate try/except
-        try:
-            reviews_link = driver.find_element(By.CSS_SELECTOR, 'a[href="#item-detail-reviews"]')
-            result["number_of_rates"] = reviews_link.text.strip()
-            log_debug(f"Found rating link: {result['number_of_rates']}")
-        except Exception:
-            log_debug("Rating link not found")
-        
-        # Extract reviews counter - handled in separate try/except
-        try:
-            reviews_counter = driver.find_element(By.CSS_SELECTOR, '[data-testid="reviewsCounter"]')
-            counter_text = reviews_counter.text.strip()
-            result["number_of_rates"] = counter_text if counter_text else "0"
-            log_debug(f"Found reviews counter: {result['number_of_rates']}")
-            
-            # Try to find the rate in the span before the reviews counter
-            try:
-                # Find the parent of the reviews counter
-                parent = reviews_counter.find_element(By.XPATH, '..')
-                # Find all spans in the parent
-                spans = parent.find_elements(By.TAG_NAME, 'span')
-                # Find the position of the reviews_counter in the spans
-                for i, span in enumerate(spans):
-                    if span == reviews_counter:
-                        # Check if there's a span before this one
-                        if i > 0:
-                            rate_span = spans[i-1]
-                            result["rate"] = rate_span.text.strip()
-                            log_debug(f"Found seller rate from span before reviews counter: {result['rate']}")
-                            break
-            except Exception as e:
-                log_debug(f"Couldn't get rate from span before reviews counter: {e}")
-            
-            # Check if we should skip items with low rating counts
-            min_ratings = getattr(cfg, 'SKIP_WITH_LESS_THAN_RATING_COUNTER', 0)
-            if min_ratings > 0:
-                try:
-                    # Convert to int for comparison, handling various formats: (290), 290, etc.
-                    cleaned_rating = result["number_of_rates"]
-                    # Remove parentheses if they exist
-                    cleaned_rating = cleaned_rating.replace("(", "").replace(")", "")
-                    # Remove dots and commas (thousands separators)
-                    cleaned_rating = cleaned_rating.replace(".", "").replace(",", "")
-                    # Convert to integer
-                    rating_count = int(cleaned_rating)
-                    
-                    if rating_count < min_ratings:
-                        logger.info(f"Skipping item with too few ratings ({rating_count} < {min_ratings}): {driver.title}")
-                        result["filtered"] = True
-                        return result
-                except (ValueError, TypeError):
-                    # If we can't parse the rating count, assume it's lower than minimum
-                    logger.info(f"Skipping item with unparseable rating count: {result['number_of_rates']}")
-                    result["filtered"] = True
-                    return result
-                    
-        except Exception:
-            log_debug("Reviews counter not found")
             
+            found = {key for key, field in fields.items() if field.get("value")}
         
-        # Extract seller name - handled in separate try/except
-        try:
-            seller_name_element = driver.find_element(By.CSS_SELECTOR, 'h3[class*="item-detail-header"]')
-            result["name"] = seller_name_element.text.strip()
-            log_debug(f"Found seller name: {result['name']}")
-        except Exception as e:
-            log_debug("Seller name not found")
-            
-        # Extract location - handled in separate try/except
-        try:
-            # Multiple ways to find location
-            location_found = False
-            
-            # Primary method: Find div with class containing "item-detail-location" and extract text from anchor element
-            try:
-                location_div = driver.find_element(By.CSS_SELECTOR, 'div[class*="item-detail-location"]')
-                location_link = location_div.find_element(By.TAG_NAME, 'a')
-                if location_link and location_link.text.strip():
-                    result["location"] = location_link.text.strip()
-                    location_found = True
-                    log_debug(f"Found location from div-link: {result['location']}")
-            except Exception:
-                pass
-            
-            # First fallback: walla-icon with location icon
-            if not location_found:
-                try:
-                    location_element = driver.find_element(By.CSS_SELECTOR, 'walla-icon[icon="location"] span')
-                    if location_element and location_element.text.strip():
-                        result["location"] = location_element.text.strip()
-                        location_found = True
-                        log_debug(f"Found location with icon selector: {result['location']}")
-                except Exception:
-                    pass
-                
-            # Second fallback: location section by class
-            if not location_found:
-                try:
-                    location_element = driver.find_element(By.CSS_SELECTOR, '.ItemDetail__location')
-                    if location_element and location_element.text.strip():
-                        result["location"] = location_element.text.strip()
-                        location_found = True
-                        log_debug(f"Found location with class selector: {result['location']}")
-                except Exception:
-                    pass
-                    
-            if not location_found and DEBUG:
-                logger.debug("Location not found with any selector")
-        except Exception as e:
-            log_debug(f"Error while finding location: {e}")
-            log_debug("Using default location")
+        # The detail filters run once the seller info is merged into the Offer
+        result["found"] = found
             
         # Take a screenshot for debugging only if configured
         if DEBUG:
@@ -389,91 +468,116 @@ def get_seller_info(driver, product_url):
                 log_debug("Failed to save screenshot, continuing anyway")
             
     except Exception as e:
-        logger.error(f"Error getting seller info, using defaults: {e}")
+        logger.error(f"Error getting seller info, will retry the item: {e}")
+        result = None
     finally:
         # Always navigate back, even if errors occurred
-        try:
-            driver.back()
-            sleep(2)
-        except Exception:
-            log_debug("Error navigating back, continuing anyway")
+        if return_to_results:
+            return_start = time()
+            try:
+                return_to_search_page(driver, results_handle)
+            except Exception:
+                log_debug("Error navigating back, continuing anyway")
+            record_navigation('return', time() - return_start)
         
-        # Always return result, with default values for any missing data
+        # Missing fields keep their default values; a failed visit returns None
         return result
 
-def load_skipped_history():
-    """Load history of skipped/filtered items.
-    
-    Returns:
-        Set of URLs that were previously filtered out
-    """
-    skipped_file = 'skipped_items_history.json'
-    skipped_urls = set()
-    
-    if os.path.exists(skipped_file) and os.path.getsize(skipped_file) > 0:
-        try:
-            with open(skipped_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            if isinstance(data, dict) and 'urls' in data:
-                skipped_urls = set(data['urls'])
-            logger.info(f"Loaded {len(skipped_urls)} previously skipped item URLs")
-        except Exception as e:
-            logger.error(f"Error loading skipped items history: {e}")
+def enrich_details(driver, items, pool=None):
+    """Visit the detail page of every item and collect its seller info
     
-    return skipped_urls
-
-def save_skipped_history(skipped_urls):
-    """Save history of skipped/filtered items.
+    With a pool of browsers (DETAIL_WORKERS > 1) the pages are fanned out over
+    it, otherwise they are visited one by one with the search page driver.
     
     Args:
-        skipped_urls: Set of URLs that were filtered out
+        driver: Selenium WebDriver instance showing the search results
+        items: List of item dictionaries to enrich
+        pool: Optional DriverPool visiting the pages concurrently
+        
+    Returns:
+        List of seller info dictionaries in the same order as items
+        (None for items that could not be checked)
     """
-    skipped_file = 'skipped_items_history.json'
+    if pool is None or len(items) <= 1:
+        results = []
+        for idx, item in enumerate(items):
+            log_debug(f"Visiting product page for item {idx+1}: {item['titulo']}")
+            results.append(get_seller_info(driver, item['enlace']))
+        return results
     
-    try:
-        with open(skipped_file, 'w', encoding='utf-8') as f:
-            json.dump({'urls': list(skipped_urls)}, f, indent=2)
-        logger.info(f"Saved {len(skipped_urls)} skipped item URLs to history")
-    except Exception as e:
-        logger.error(f"Error saving skipped items history: {e}")
+    logger.info(f"Visiting {len(items)} detail pages with up to {pool.size} browser workers")
+    pool_start = time()
+    results = pool.map(
+        lambda worker_driver, item: get_seller_info(worker_driver, item['enlace'], return_to_results=False),
+        items
+    )
+    log_debug(f"Worker pool finished in {time() - pool_start:.2f} seconds")
+    return results
 
-def scrape_offers(driver):
-    """Check all offers on the Wallapop search page
+class SeleniumBackend(FetchBackend):
+    """Fetch backend driving a real Chrome browser
+    
+    With DETAIL_WORKERS > 1 the detail pages are visited by a pool of extra
+    browsers, started on the first lookup and kept until the backend is closed.
     
     Args:
         driver: Selenium WebDriver instance
-        
-    Returns:
-        Tuple containing:
-        - List of valid product items that pass all filtering criteria
-        - Set of all URLs that were checked (including filtered ones)
+        headless: Boolean indicating whether extra worker browsers run headless
+        loaded_url: Search URL the driver already shows (skips reloading it once)
     """
-    scrape_start_time = time()
-    all_checked_urls = set()  # Store all URLs we check, even filtered ones
-    skipped_urls = set()      # Store URLs that were filtered out
     
-    # Load previously skipped items to avoid rechecking
-    load_start = time()
-    previously_skipped = load_skipped_history()
-    logger.info(f"Loaded {len(previously_skipped)} previously skipped items in {time() - load_start:.2f} seconds")
+    name = 'selenium'
     
-    try:
+    def __init__(self, driver, headless=True, loaded_url=None):
+        self.driver = driver
+        self.headless = headless
+        self.loaded_url = loaded_url
+        self.pool = None
+    
+    def detail_pool(self):
+        """Return the pool of detail page browsers (None with a single worker)"""
+        workers = getattr(cfg, 'DETAIL_WORKERS', 1)
+        if workers <= 1:
+            return None
+        if self.pool is None:
+            self.pool = DriverPool(workers, lambda: create_driver(self.headless),
+                                   retries=getattr(cfg, 'DETAIL_WORKER_RETRIES', 1))
+        return self.pool
+    
+    def search(self, search, limit):
+        driver = self.driver
+        if self.loaded_url != search['url']:
+            if NETWORK_LOGGING:
+                # Only keep the responses of the page about to be loaded
+                discard_captured(driver)
+            driver.get(search['url'])
+        # Later searches (and later daemon cycles) must load their page again
+        self.loaded_url = None
+        
         logger.info("Processing Wallapop search page...")
-        try:
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.ID, "onetrust-accept-btn-handler"))
-            )
-            log_debug("Cookie dialog found")
-            accept_terms_button = driver.find_element("id", "onetrust-accept-btn-handler")
-            if accept_terms_button:
-                log_debug("Clicking accept button...")
-                accept_terms_button.click()
-                log_debug("Cookies accepted")
-        except Exception as e:
-            log_debug(f"No cookie dialog or error accepting cookies: {e}")
+        # The banner only shows once per browser session, and never again once a
+        # persistent profile holds the consent cookie
+        if driver.session_id not in consented_sessions and has_consent_cookie(driver):
+            log_debug("Cookie consent already stored in the browser profile")
+            consented_sessions.add(driver.session_id)
+        if driver.session_id not in consented_sessions:
+            try:
+                WebDriverWait(driver, 10).until(
+                    EC.presence_of_element_located((By.ID, "onetrust-accept-btn-handler"))
+                )
+                log_debug("Cookie dialog found")
+                accept_terms_button = driver.find_element("id", "onetrust-accept-btn-handler")
+                if accept_terms_button:
+                    log_debug("Clicking accept button...")
+                    accept_terms_button.click()
+                    consented_sessions.add(driver.session_id)
+                    log_debug("Cookies accepted")
+            except Exception as e:
+                log_debug(f"No cookie dialog or error accepting cookies: {e}")
             
         logger.info("Waiting for page to load...")
-        sleep(5)
+        if not page_waiter.wait(driver, 'search'):
+            logger.warning("Item cards did not appear before the search page timeout")
         
         # Take a screenshot for debugging
         if DEBUG:
@@ -482,238 +586,510 @@ def scrape_offers(driver):
                 logger.debug("Screenshot saved to wallabot_screenshot.png")
             except Exception:
                 log_debug("Failed to save screenshot, continuing anyway")
-
-        # Wait for initial content to load
-        log_debug("Loading page content...")
-        try:
-            sleep(3)
-        except Exception as e:
-            log_debug(f"Error while waiting for page: {e}")
-
-        # Find all offer cards using the correct selector
+        
+        # Use the search API responses the page downloaded when available
+        if CAPTURE_NETWORK_JSON:
+            items = capture_search_items(driver, getattr(cfg, 'HTTP_WEB_BASE_URL', 'https://es.wallapop.com'))
+            if items:
+                return len(items), items[:limit]
+            logger.warning("No search API response captured, reading the rendered cards instead")
+        
+        # Read all card fields in a single script call
         log_debug("Finding item cards...")
-        cards = []
+        total_cards, cards = 0, []
         try:
-            cards = driver.find_elements(By.CSS_SELECTOR, '.ItemCardList__item')
-            logger.info(f"Found {len(cards)} cards")
+            total_cards, cards = extract_cards(driver, limit)
         except Exception as e:
             logger.error(f"Error finding cards: {e}")
         
-        if not cards:
-            logger.error("No cards found. Check your search URL.")
-            if DEBUG:
-                try:
-                    with open("page_source.html", "w", encoding="utf-8") as f:
-                        f.write(driver.page_source)
-                    logger.debug("Page source saved to page_source.html")
-                except Exception:
-                    log_debug("Failed to save page source")
-            return [], set()
+        if not cards and DEBUG:
+            try:
+                with open("page_source.html", "w", encoding="utf-8") as f:
+                    f.write(driver.page_source)
+                logger.debug("Page source saved to page_source.html")
+            except Exception:
+                log_debug("Failed to save page source")
         
-        # Extract data from cards WITHOUT visiting individual pages first
-        new_cards = []
-        logger.info("First pass: extracting basic info from cards...")
+        return total_cards, self.cards_to_items(cards)
+    
+    def cards_to_items(self, cards):
+        """Convert extracted card fields into Offers"""
+        items = []
+        for idx, card in enumerate(cards):
+            # Default values - seller info, location and shipping will be filled in second pass
+            item_data = empty_item()
+            
+            # Copy the extracted card fields, keeping defaults for missing ones
+            for field, key in (('price', 'precio'), ('title', 'titulo'),
+                               ('href', 'enlace'), ('image_url', 'image_url')):
+                value = card.get(field, {}).get('value')
+                if value:
+                    item_data[key] = value
+                else:
+                    log_debug(f"Could not extract {field} for item {idx+1}")
+            
+            # Check if reserved
+            item_data['reservada'] = bool(card.get('reserved', {}).get('value'))
+            items.append(item_data)
+        return items
+    
+    def more_results(self, search):
+        driver = self.driver
+        before = count_cards(driver)
+        if CAPTURE_NETWORK_JSON:
+            # Only keep the responses of the page about to be loaded
+            discard_captured(driver)
+        log_debug(f"Loading more results ({load_more_cards(driver)})...")
+        if not page_waiter.wait(driver, 'search_more', condition=lambda d: count_cards(d) > before):
+            log_debug("No more cards appeared")
+            return []
+        if CAPTURE_NETWORK_JSON:
+            items = capture_search_items(driver, getattr(cfg, 'HTTP_WEB_BASE_URL', 'https://es.wallapop.com'))
+            if items:
+                return items
+        # The cards read before stay on the page above the new ones
+        total_cards, cards = extract_cards(driver, None, offset=before)
+        return self.cards_to_items(cards)
+    
+    def get_details(self, item):
+        return get_seller_info(self.driver, item['enlace'])
+    
+    def enrich(self, items):
+        return enrich_details(self.driver, items, self.detail_pool())
+    
+    def iter_details(self, items):
+        # Visiting pages one by one, hand each result on as soon as it is read
+        if min(getattr(cfg, 'DETAIL_WORKERS', 1), len(items)) <= 1:
+            for idx, item in enumerate(items):
+                log_debug(f"Visiting product page for item {idx+1}: {item['titulo']}")
+                yield idx, get_seller_info(self.driver, item['enlace'])
+        else:
+            yield from enumerate(self.enrich(items))
+    
+    def is_healthy(self):
+        return is_driver_alive(self.driver)
+    
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+        close_driver(self.driver)
+
+def group_by_search(items):
+    """Split items into runs of the same search, keeping their order
+    
+    Args:
+        items: List of item dictionaries tagged with 'search'
+        
+    Returns:
+        List of (search name, list of items) tuples
+    """
+    groups = []
+    for item in items:
+        if groups and groups[-1][0] == item['search']:
+            groups[-1][1].append(item)
+        else:
+            groups.append((item['search'], [item]))
+    return groups
+
+def merge_seller_info(item, seller_info):
+    """Copy the data only available on the product detail page into an Offer
+    
+    Args:
+        item: Offer from the search results
+        seller_info: Seller info dictionary returned by the backend
+    """
+    item.apply_seller_info(seller_info)
+    
+    if DEBUG:
+        logger.debug(f"  Seller: {item['seller_name']}")
+        logger.debug(f"  Location: {item['location']}")
+        logger.debug(f"  Shipping: {item['shipping']}")
+        logger.debug(f"  Seller rate: {item['seller_rate']}")
+        logger.debug(f"  Seller sales: {item['seller_sales']}")
+        logger.debug(f"  Seller number of rates: {item['seller_number_of_rates']}")
+        logger.debug(f"  Professional seller: {item['seller_profesional']}")
+
+def scan_search(backend, search, max_items, scan_marks):
+    """Load the cards of a search, stopping at its high-water mark in incremental mode
+    
+    With INCREMENTAL_SCAN enabled and the search sorted by newest, only the
+    cards above the first listing known from the previous scan are returned,
+    loading further pages (up to INCREMENTAL_MAX_PAGES) while none shows up.
+    At most max_items cards are returned. The mark only moves when every card
+    above it was returned; otherwise it is kept, so the next scan reaches the
+    listings left out. The first scan of a search reads max_items cards like
+    a full scan.
+    
+    Args:
+        backend: FetchBackend shared by all searches
+        search: Search dictionary (its settings must be active)
+        max_items: Maximum number of cards of a full scan
+        scan_marks: ScanMarks of the incremental searches
+        
+    Returns:
+        Tuple of (number of cards found, list of Offers)
+    """
+    if not setting('INCREMENTAL_SCAN', False):
+        return backend.search(search, max_items)
+    if not is_newest_first(search['url']):
+        logger.warning(f"INCREMENTAL_SCAN needs a search sorted by newest (order_by=newest), "
+                       f"scanning '{search['name']}' fully")
+        return backend.search(search, max_items)
+    
+    known = scan_marks.known(search['namespace'])
+    if not known:
+        logger.info("First incremental scan of this search, reading it fully")
+        total_cards, cards = backend.search(search, max_items)
+        scan_marks.scanned(search['namespace'], cards)
+        return total_cards, cards
+    
+    total_cards, page = backend.search(search, None)
+    cards, reached = cut_at_known(page, known)
+    pages = 1
+    max_pages = setting('INCREMENTAL_MAX_PAGES', 5)
+    while not reached and pages < max_pages and (max_items is None or len(cards) < max_items):
+        # More than a page of new listings arrived since the last scan
+        page = backend.more_results(search)
+        if not page:
+            break
+        pages += 1
+        total_cards += len(page)
+        new_cards, reached = cut_at_known(page, known)
+        cards += new_cards
+    complete = reached and (max_items is None or len(cards) <= max_items)
+    cards = cards[:max_items]
+    if complete:
+        logger.info(f"Incremental scan: {len(cards)} new cards above the last scan ({pages} page(s))")
+        scan_marks.scanned(search['namespace'], cards)
+    else:
+        # Moving the mark would skip the listings between these cards and it for good
+        logger.warning(f"Incremental scan did not cover every new listing above the last scan within "
+                       f"{pages} page(s) and MAX_ITEMS_TO_CHECK={max_items}; processing the newest "
+                       f"{len(cards)} and keeping the old mark")
+    return total_cards, cards
+
+def discover_offers(backend, searches, scan_marks):
+    """Pipeline source: yield the cards of every search, one search at a time
+    
+    Args:
+        backend: FetchBackend shared by all searches
+        searches: List of search dictionaries from get_searches()
+        scan_marks: ScanMarks of the incremental searches
         
-        # Get maximum items to check from config (default to 6 if not set)
-        max_items = getattr(cfg, 'MAX_ITEMS_TO_CHECK', 6)
+    Yields:
+        Item dictionaries tagged with the name of their search
+    """
+    global active_search
+    for search in searches:
+        active_search = search
+        search_start = time()
+        try:
+            logger.info(f"=== Search '{search['name']}' ===")
+            log_debug(f"Using search URL: {search['url']}")
+            # Get maximum items to check from config (default to 6 if not set)
+            max_items = setting('MAX_ITEMS_TO_CHECK', 6)
+            logger.info(f"Loading search results with the {backend.name} backend...")
+            total_cards, cards = scan_search(backend, search, max_items, scan_marks)
+        except Exception as e:
+            # One broken search must not stop the others
+            logger.error(f"Error running search '{search['name']}': {e}")
+            if DEBUG:
+                import traceback
+                traceback.print_exc()
+            continue
+        finally:
+            active_search = {}
         
-        # Limit cards to the maximum specified in config
-        max_cards = min(max_items, len(cards))
-        logger.info(f"Processing {max_cards} of {len(cards)} items (MAX_ITEMS_TO_CHECK={max_items})")
+        logger.info(f"Found {total_cards} cards, processing {len(cards)} (MAX_ITEMS_TO_CHECK={max_items}) "
+                    f"in {time() - search_start:.2f} seconds")
+        if not total_cards:
+            logger.error("No cards found. Check your search URL.")
+        for idx, item in enumerate(cards):
+            item['search'] = search['name']
+            log_debug(f"Item {idx+1}: {item['titulo']} - {item['precio']}")
+            yield item
+
+def prefilter_offers(items, history, searches, chunk_size, counts=None):
+    """Pipeline stage: drop items that need no detail lookup
+    
+    Items rejected by the card-level filters (reserved, price range, title
+    keywords), items filtered out in earlier runs and offers already notified
+    are dropped using card data and the history only. History lookups are
+    batched over chunks of items.
+    
+    Args:
+        items: Iterable of item dictionaries from discover_offers()
+        history: History store shared by all searches
+        searches: Dictionary of search name -> search dictionary
+        chunk_size: Maximum number of items pulled from upstream at once
+        counts: Optional dictionary whose 'visits_saved' counter is increased
+            for every already notified item, to log the figure of the whole run
         
-        for idx, card in enumerate(cards[:max_cards]):
+    Yields:
+        Items whose detail page must be checked
+    """
+    global active_search
+    for chunk in chunked(items, chunk_size):
+        for name, group in group_by_search(chunk):
+            search = searches[name]
+            search_history = history.namespace(search['namespace'])
+            active_search = search
             try:
-                # Default values - seller info, location and shipping will be filled in second pass
-                item_data = {
-                    'titulo': "Unknown Title", 
-                    'precio': "Unknown Price", 
-                    'enlace': "#", 
-                    'reservada': False,
-                    'seller_name': "Desconocido",           # Only available on product page
-                    'seller_number_of_rates': "0",          # Only available on product page
-                    'seller_rate': "0",                     # Only available on product page
-                    'seller_sales': "0",                    # Only available on product page
-                    'location': "Desconocido",              # Only available on product page
-                    'shipping': "No",                       # Only available on product page
-                    'image_url': "",                        # Available on search page
-                    'last_update': "Desconocido",           # New: Last update time
-                    'views': "0",                           # New: View count
-                    'favorites': "0",                       # New: Favorites count
-                    'seller_profesional': "No"              # New: Professional seller indicator
-                }
+                card_urls = [item['enlace'] for item in group if item['enlace'] != "#"]
+                previously_skipped = search_history.skipped_among(card_urls)
+                previously_seen = search_history.seen_among(card_urls)
                 
-                # Extract basic card data with individual try/except for each field
-                try:
-                    item_data['precio'] = card.find_element(By.CLASS_NAME, 'ItemCard__price').text
-                except Exception:
-                    log_debug(f"Could not extract price for item {idx+1}")
-                
-                try:
-                    item_data['titulo'] = card.find_element(By.CLASS_NAME, 'ItemCard__title').text
-                except Exception:
-                    log_debug(f"Could not extract title for item {idx+1}")
-                
-                try:
-                    item_data['enlace'] = card.get_attribute('href')
-                except Exception:
-                    log_debug(f"Could not extract link for item {idx+1}")
-                
-                # Extract the thumbnail image directly from the card
-                try:
-                    img_element = card.find_element(By.TAG_NAME, 'img')
-                    if img_element:
-                        item_data['image_url'] = img_element.get_attribute('src')
-                        log_debug(f"Found thumbnail image: {item_data['image_url']}")
-                except Exception:
-                    log_debug(f"Could not extract thumbnail for item {idx+1}")
-                
-                # Check if reserved
-                try:
-                    reservada_element = card.find_element(By.CLASS_NAME, 'ItemCard__badge')
-                    if reservada_element:
-                        item_data['reservada'] = True
-                except Exception:
-                    # Not reserved or couldn't find badge
-                    pass
-                
-                # Skip reserved items in first pass if configured to do so
-                if item_data['reservada'] and getattr(cfg, 'SKIP_RESERVED_ITEMS', False):
-                    logger.info(f"Skipping reserved item in first pass: {item_data['titulo']}")
-                    continue
-                
-                # Print basic info for debugging
-                log_debug(f"Item {idx+1}: {item_data['titulo']} - {item_data['precio']}")
-                new_cards.append(item_data)
+                skipped_urls = {}
+                passed = []
+                for item in group:
+                    if item['enlace'] == "#":
+                        log_debug(f"Skipping item without link: {item['titulo']}")
+                        continue
+                    
+                    # Cheap filters on the card data first. Rejections are not recorded in the
+                    # history: reservations are lifted and prices drop
+                    known = item['enlace'] in previously_skipped or item['enlace'] in previously_seen
+                    if apply_card_filters(item, setting, visit_saved=not known):
+                        continue
+                    
+                    # Skip this item if it was previously filtered out
+                    if item['enlace'] in previously_skipped:
+                        logger.info(f"Skipping previously filtered item: {item['titulo']}")
+                        skipped_urls[item['enlace']] = None
+                        continue
+                    
+                    # Skip this item if it was already notified
+                    if item['enlace'] in previously_seen:
+                        log_debug(f"Skipping previously notified item: {item['titulo']}")
+                        if counts is not None:
+                            counts['visits_saved'] = counts.get('visits_saved', 0) + 1
+                        continue
+                    
+                    passed.append(item)
                 
+                # Refresh last_seen of items that stay filtered out
+                search_history.add_skipped(skipped_urls)
             except Exception as e:
-                logger.error(f"Error processing item {idx+1}: {e}")
-                # Continue with next item instead of breaking
+                logger.error(f"Error pre-filtering items of search '{name}': {e}")
                 continue
+            finally:
+                active_search = {}
+            yield from passed
+
+def enrich_offers(items, backend, history, searches, scan_marks, chunk_size, scheduler=None):
+    """Pipeline stage: look up the details of every item and apply the detail filters
+    
+    Items pass on as soon as their own lookup completed, so a valid offer can
+    be notified while the rest of its chunk is still being checked.
+    
+    Args:
+        items: Iterable of item dictionaries from prefilter_offers()
+        backend: FetchBackend used to load the item details
+        history: History store shared by all searches
+        searches: Dictionary of search name -> search dictionary
+        scan_marks: ScanMarks keeping the marks below the items to retry
+        chunk_size: Maximum number of items looked up at once
+        scheduler: Optional RunScheduler; only the lookups fitting in its budget are started
         
-        logger.info(f"Collected data for {len(new_cards)} items")
-        
-        # Now visit all items' detail pages to get seller info
-        second_pass_start = time()
-        logger.info(f"Second pass: visiting detail pages for {len(new_cards)} items to get seller info, location, and shipping details...")
-        valid_items = []  # Create a list for items that pass all filters
-        for idx, item in enumerate(new_cards):
-            item_start = time()
-            if item['enlace'] != "#":
-                # Add to checked URLs list
-                all_checked_urls.add(item['enlace'])
-                
-                # Skip reserved items if configured to do so
-                if item['reservada'] and getattr(cfg, 'SKIP_RESERVED_ITEMS', False):
-                    logger.info(f"Skipping reserved item: {item['titulo']}")
-                    skipped_urls.add(item['enlace'])
-                    continue
-                
-                # Skip this item if it was previously filtered out
-                if item['enlace'] in previously_skipped:
-                    logger.info(f"Skipping previously filtered item: {item['titulo']}")
-                    skipped_urls.add(item['enlace'])
-                    continue
+    Yields:
+        Items that passed every filter, completed with their seller info
+    """
+    global active_search
+    for chunk in chunked(items, chunk_size):
+        for name, group in group_by_search(chunk):
+            search_history = history.namespace(searches[name]['namespace'])
+            skipped_urls = {}
+            # The detail filters read the settings of this search while its lookups run
+            active_search = searches[name]
+            try:
+                if scheduler:
+                    # Lookups that do not fit in the remaining time are left for the next run
+                    group = scheduler.admit(group)
+                lookups = backend.iter_details(group)
+                if scheduler:
+                    lookups = scheduler.visit(lookups)
+                for idx, seller_info in lookups:
+                    item = group[idx]
+                    # The detail page could not be loaded on any attempt; retry next run
+                    if seller_info is None:
+                        logger.warning(f"Could not check item, will retry next run: {item['titulo']}")
+                        scan_marks.retry(searches[name]['namespace'], item)
+                        continue
                     
-                log_debug(f"Visiting product page for item {idx+1}: {item['titulo']}")
-                seller_info = get_seller_info(driver, item['enlace'])
-                
-                # Check if the item was filtered in get_seller_info
-                if seller_info.get('filtered', False):
-                    logger.info(f"Item was filtered: {item['titulo']}")
-                    skipped_urls.add(item['enlace'])
-                    continue
-                
-                # Update with data only available on product detail page
-                item['seller_name'] = seller_info.get('name', "Desconocido")
-                item['seller_number_of_rates'] = seller_info.get('number_of_rates', "0")
-                item['seller_rate'] = seller_info.get('rate', "0")
-                item['seller_sales'] = seller_info.get('sales', "0")
-                item['location'] = seller_info.get('location', "Desconocido")
-                item['shipping'] = seller_info.get('shipping', "No")
-                
-                # Add new statistics
-                item['last_update'] = seller_info.get('last_update', "Desconocido")
-                item['views'] = seller_info.get('views', "0")
-                item['favorites'] = seller_info.get('favorites', "0")
-                item['seller_profesional'] = seller_info.get('profesional', "No")
-                
-                # Only update image URL if we didn't get it from the search page
-                if not item['image_url'] and seller_info.get('image_url'):
-                    item['image_url'] = seller_info.get('image_url', "")
-                
-                if DEBUG:
-                    logger.debug(f"  Updated seller info for item {idx+1}")
-                    logger.debug(f"  Seller: {item['seller_name']}")
-                    logger.debug(f"  Location: {item['location']}")
-                    logger.debug(f"  Shipping: {item['shipping']}")
-                    logger.debug(f"  Seller rate: {item['seller_rate']}")
-                    logger.debug(f"  Seller sales: {item['seller_sales']}")
-                    logger.debug(f"  Seller number of rates: {item['seller_number_of_rates']}")
-                    logger.debug(f"  Seller number of sales: {item['seller_sales']}")
-                    logger.debug(f"  Professional seller: {item['seller_profesional']}")
-                    logger.debug(f"  Item {idx+1} processed in {time() - item_start:.2f} seconds")
-                
-                # Item passed all filters, add it to valid items
-                valid_items.append(item)
-        
-        second_pass_time = time() - second_pass_start
-        logger.info(f"Successfully processed {len(valid_items)} valid items out of {len(new_cards)} after filtering")
-        logger.info(f"Second pass completed in {second_pass_time:.2f} seconds, avg {second_pass_time/max(1, len(new_cards)):.2f} seconds per item")
-        
-        # Save skipped URLs history
-        save_start = time()
-        # Combine with previously skipped ones
-        all_skipped = previously_skipped.union(skipped_urls)
-        save_skipped_history(all_skipped)
-        logger.info(f"Saved skipped history in {time() - save_start:.2f} seconds")
-        
-        total_scrape_time = time() - scrape_start_time
-        logger.info(f"Total scraping time: {total_scrape_time:.2f} seconds")
+                    merge_seller_info(item, seller_info)
+                    
+                    # Check the detail-level filters on the parsed seller numbers
+                    reason = apply_detail_filters(item, seller_info.get('found', set()), setting, item['titulo'])
+                    if reason:
+                        logger.info(f"Item was filtered: {item['titulo']}")
+                        skipped_urls[item['enlace']] = reason
+                        continue
+                    
+                    yield item
+            finally:
+                active_search = {}
+                try:
+                    search_history.add_skipped(skipped_urls)
+                    log_debug(f"Saved {len(skipped_urls)} skipped item URLs to history")
+                except Exception as e:
+                    logger.error(f"Error saving skipped items history: {e}")
+
+def dedupe_offers(offers, history, searches):
+    """Pipeline stage: pass on offers not notified before and record them as seen
+    
+    Args:
+        offers: Iterable of valid offers from enrich_offers()
+        history: History store shared by all searches
+        searches: Dictionary of search name -> search dictionary
         
-        return valid_items, all_checked_urls
+    Yields:
+        New offers
+    """
+    emitted = set()
+    for offer in offers:
+        search_history = history.namespace(searches[offer['search']]['namespace'])
+        key = (offer['search'], offer['enlace'])
+        try:
+            if key in emitted or search_history.seen_among([offer['enlace']]):
+                log_debug(f"Skipping previously seen offer: {offer['titulo']}")
+                continue
+            search_history.add_seen([offer['enlace']])
+        except Exception as e:
+            # Better to notify twice than to lose an offer
+            logger.error(f"Error checking history for {offer['enlace']}: {e}")
+        emitted.add(key)
+        logger.info(f"New offer: {offer['titulo']}")
+        yield offer
+
+def notify_offers(offers, notifications, batch_size=0):
+    """Pipeline sink: send new offers to the notification channels in batches
+    
+    Args:
+        offers: Iterable of new offers from dedupe_offers()
+        notifications: Notifications from init_notifications()
+        batch_size: Notify as soon as this many offers are pending
+            (0 = a single notification once the run is over)
+            
+    Yields:
+        Offers once they were sent (or added to the digest)
+    """
+    pending = []
+    
+    def flush():
+        if notifications.digest.window:
+            notifications.digest.add(pending)
+            return
+        notify_start = time()
+        logger.info(f"Sending notification with {len(pending)} new offers...")
+        send_notifications(notifications, pending)
+        logger.info(f"Notification sent in {time() - notify_start:.2f} seconds")
+    
+    try:
+        for offer in offers:
+            pending.append(offer)
+            if batch_size and len(pending) >= batch_size:
+                flush()
+                yield from pending
+                pending = []
+    finally:
+        # Offers are already recorded as seen: send them even if an upstream stage failed
+        if pending:
+            flush()
+    yield from pending
+
+def create_driver(headless=True, user_data_dir=None, timings=None):
+    """Create a Chrome WebDriver instance without opening any page
+    
+    Args:
+        headless: Boolean indicating whether to run in headless mode
+        user_data_dir: Persistent Chrome profile directory (None for a blank profile).
+            A profile can only be used by one browser at a time.
+        timings: Optional dictionary receiving the seconds spent in the
+            'driver_resolve' and 'browser_launch' phases
         
+    Returns:
+        WebDriver instance
+    """
+    timings = timings if timings is not None else {}
+    logger.info("Configuring Chrome...")
+    chrome_options = webdriver.ChromeOptions()
+    if headless:
+        log_debug("Running in headless mode")
+        chrome_options.add_argument('--headless=new')
+    else:
+        log_debug("Running in visible mode")
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    if user_data_dir:
+        # Keeps cookies (cookie consent included) and the HTTP cache between runs
+        log_debug(f"Using Chrome profile {user_data_dir}")
+        chrome_options.add_argument(f"--user-data-dir={os.path.abspath(user_data_dir)}")
+    # Our waits are condition-based, so the bot does not need to wait for the load event
+    chrome_options.page_load_strategy = getattr(cfg, 'PAGE_LOAD_STRATEGY', 'normal')
+    if BLOCK_RESOURCES:
+        log_debug("Blocking images, fonts and trackers")
+        apply_blocking_prefs(chrome_options, block_images=getattr(cfg, 'BLOCK_IMAGES', True))
+    if NETWORK_LOGGING:
+        log_debug("Recording DevTools network events")
+        enable_performance_logging(chrome_options)
+    
+    # Reuse the last resolved ChromeDriver instead of asking webdriver-manager every run
+    from selenium.webdriver.chrome.service import Service
+    cache_file = getattr(cfg, 'CHROMEDRIVER_CACHE_FILE', 'chromedriver_cache.json')
+    resolve_args = dict(path=getattr(cfg, 'CHROMEDRIVER_PATH', ''),
+                        version=getattr(cfg, 'CHROMEDRIVER_VERSION', ''),
+                        cache_file=cache_file)
+    resolve_start = time()
+    driver_path = resolve_chromedriver(**resolve_args)
+    timings['driver_resolve'] = time() - resolve_start
+    if driver_path is None:
+        # Fall back to direct Chrome instantiation
+        log_debug("webdriver-manager not available, using direct Chrome instantiation...")
+    
+    launch_start = time()
+    try:
+        driver = webdriver.Chrome(service=Service(driver_path) if driver_path else Service(), options=chrome_options)
     except Exception as e:
-        logger.error(f"Error in scrape_offers: {e}")
-        if DEBUG:
-            import traceback
-            traceback.print_exc()
-        return [], set()  # Return empty list instead of breaking
+        if driver_path is None or resolve_args['path']:
+            raise
+        # The cached driver no longer matches the installed Chrome: resolve it again
+        logger.warning(f"Cached ChromeDriver failed to start, resolving it again: {e}")
+        forget_chromedriver(cache_file)
+        resolve_start = time()
+        driver_path = resolve_chromedriver(**resolve_args)
+        timings['driver_resolve'] += time() - resolve_start
+        launch_start = time()
+        driver = webdriver.Chrome(service=Service(driver_path) if driver_path else Service(), options=chrome_options)
+    timings['browser_launch'] = time() - launch_start
+    apply_url_blocking(driver, BLOCKED_URL_PATTERNS)
+    return driver
 
-def setup_driver(headless=True):
+def setup_driver(headless=True, url=None):
     """Setup chrome driver to scrape
     
     Args:
         headless: Boolean indicating whether to run in headless mode
+        url: Search URL to open (defaults to OFFERS_URL)
         
     Returns:
         Configured WebDriver instance
     """
     try:
-        logger.info("Configuring Chrome...")
-        chrome_options = webdriver.ChromeOptions()
-        if headless:
-            log_debug("Running in headless mode")
-            chrome_options.add_argument('--headless=new')
-        else:
-            log_debug("Running in visible mode")
-        chrome_options.add_argument('--no-sandbox')
-        chrome_options.add_argument('--disable-dev-shm-usage')
+        timings = {}
+        driver = create_driver(headless, user_data_dir=getattr(cfg, 'CHROME_USER_DATA_DIR', '') or None,
+                               timings=timings)
         
-        # Try to create the driver with automatic version detection
-        try:
-            from webdriver_manager.chrome import ChromeDriverManager
-            from selenium.webdriver.chrome.service import Service
-            log_debug("Using webdriver-manager to find compatible ChromeDriver...")
-            service = Service(ChromeDriverManager().install())
-            driver = webdriver.Chrome(service=service, options=chrome_options)
-        except ImportError:
-            # Fall back to direct Chrome instantiation
-            log_debug("webdriver-manager not available, using direct Chrome instantiation...")
-            driver = webdriver.Chrome(options=chrome_options)
-        
-        logger.info(f"Opening URL: {cfg.OFFERS_URL}")
-        driver.get(cfg.OFFERS_URL)
+        url = url or cfg.OFFERS_URL
+        logger.info(f"Opening URL: {url}")
+        page_start = time()
+        driver.get(url)
+        page_waiter.wait(driver, 'search')
+        timings['first_page_ready'] = time() - page_start
         log_debug(f"Page title: {driver.title}")
+        logger.info(f"Startup: driver resolve {timings['driver_resolve']:.2f}s, "
+                    f"browser launch {timings['browser_launch']:.2f}s, "
+                    f"first page ready {timings['first_page_ready']:.2f}s")
         return driver
     except Exception as e:
         logger.error(f"Error setting up ChromeDriver: {e}")
@@ -722,173 +1098,170 @@ def setup_driver(headless=True):
             traceback.print_exc()
         raise
 
-def check_history(current_offers):
-    """Check local stored offers and only return the new ones
+def open_history():
+    """Open the history store configured in config.py"""
+    return open_history_store(
+        getattr(cfg, 'HISTORY_BACKEND', 'sqlite'),
+        getattr(cfg, 'HISTORY_DB', 'wallabot_history.db'),
+        getattr(cfg, 'HISTORY_INDEX_DIR', '.')
+    )
+
+def create_backend(headless=True, first_url=None):
+    """Create the fetch backend selected by BACKEND in config.py
+    
+    With BACKEND = 'http' the browser is only started if the HTTP backend
+    fails and HTTP_FALLBACK_TO_SELENIUM is enabled.
     
     Args:
-        current_offers: List of current offers to check against history
+        headless: Boolean indicating whether to run Chrome in headless mode
+        first_url: Search URL the browser opens at startup
         
     Returns:
-        List of new offers not previously seen
+        FetchBackend instance
     """
-    new_offers = []
-    seen_urls = set()  # Set of URLs we've seen before
-    history_file = 'offers_history.json'  # JSON-based history file
+    def selenium_backend():
+        driver = setup_driver(headless, first_url)
+        return SeleniumBackend(driver, headless, loaded_url=first_url or cfg.OFFERS_URL)
     
-    try:
-        # Load existing history if available
-        if os.path.exists(history_file) and os.path.getsize(history_file) > 0:
-            logger.info(f"Loading offer history from {history_file}...")
-            try:
-                with open(history_file, 'r', encoding='utf-8') as f:
-                    saved_data = json.load(f)
-                
-                # Extract URLs from saved data
-                if isinstance(saved_data, dict) and 'urls' in saved_data:
-                    seen_urls = set(saved_data['urls'])
-                    
-                log_debug(f"Loaded {len(seen_urls)} previous offer URLs")
-                
-                # Check for new offers by URL
-                for offer in current_offers:
-                    if offer['enlace'] not in seen_urls:
-                        logger.info(f"New offer: {offer['titulo']}")
-                        seen_urls.add(offer['enlace'])
-                        new_offers.append(offer)
-                    else:
-                        log_debug(f"Skipping previously seen offer: {offer['titulo']}")
-                        
-            except json.JSONDecodeError as e:
-                logger.error(f"Error loading JSON history file: {e}")
-                logger.info("Creating new history file due to corruption")
-                # Create a backup of the corrupt file for debugging
-                try:
-                    if os.path.exists(history_file):
-                        import shutil
-                        shutil.copy2(history_file, f'{history_file}.corrupt')
-                        logger.info(f"Backup of corrupt file saved as {history_file}.corrupt")
-                except Exception as backup_error:
-                    logger.error(f"Failed to backup corrupt file: {backup_error}")
-                
-                # Use current offers as new data
-                for offer in current_offers:
-                    seen_urls.add(offer['enlace'])
-                new_offers = current_offers
-        else:
-            # No history file exists, create new one with current offers
-            logger.info(f"No history file found, creating new history in {history_file}")
-            for offer in current_offers:
-                seen_urls.add(offer['enlace'])
-            new_offers = current_offers
-            
-        # Save updated history in JSON format
-        log_debug(f"Saving {len(seen_urls)} offer URLs to JSON history")
-        try:
-            with open(history_file, 'w', encoding='utf-8') as f:
-                json.dump({'urls': list(seen_urls)}, f, indent=2)
-                
-            logger.info(f"History saved to {history_file}")
-                    
-        except Exception as save_error:
-            logger.error(f"Error saving JSON history file: {save_error}")
-            # Try with a new file if saving fails
-            try:
-                with open('offers_history_new.json', 'w', encoding='utf-8') as f:
-                    json.dump({'urls': list(seen_urls)}, f, indent=2)
-                logger.info("Saved to alternate file offers_history_new.json")
-            except Exception:
-                logger.error("Failed to save history to alternate file")
-    except Exception as e:
-        logger.error(f"Unexpected error in check_history: {e}")
-        # Return current offers as new if we hit an unexpected error
-        return current_offers
-        
-    return new_offers
+    if getattr(cfg, 'BACKEND', 'selenium') == 'http':
+        http_backend = HttpBackend(
+            api_base=getattr(cfg, 'HTTP_API_BASE_URL', 'https://api.wallapop.com'),
+            web_base=getattr(cfg, 'HTTP_WEB_BASE_URL', 'https://es.wallapop.com'),
+            timeout=getattr(cfg, 'HTTP_TIMEOUT', 10),
+            concurrency=getattr(cfg, 'HTTP_CONCURRENCY', 8)
+        )
+        if getattr(cfg, 'HTTP_FALLBACK_TO_SELENIUM', True):
+            return FallbackBackend(http_backend, selenium_backend)
+        return http_backend
+    return selenium_backend()
 
-def update_history_with_checked_urls(checked_urls):
-    """Update history JSON file with all checked URLs to avoid re-checking filtered items.
+def run_cycle(backend, history, searches, notifications, scan_marks):
+    """Run every search once through the streaming pipeline and notify the new offers
+    
+    discover -> pre-filter -> enrich -> dedupe -> notify
+    
+    With RUN_TIME_BUDGET_SECONDS set, a schedule stage between pre-filter and
+    enrich orders the detail lookups and stops them once the budget is spent.
     
     Args:
-        checked_urls: Set of URLs that were checked in this run
+        backend: FetchBackend shared by all searches
+        history: History store shared by all searches
+        searches: List of search dictionaries from get_searches()
+        notifications: Notifications from init_notifications()
+        scan_marks: ScanMarks of the incremental searches
+        
+    Returns:
+        Number of new offers found
     """
-    history_file = 'offers_history.json'
-    
+    by_name = {search['name']: search for search in searches}
+    buffer_size = getattr(cfg, 'PIPELINE_BUFFER_SIZE', 10)
+    budget = getattr(cfg, 'RUN_TIME_BUDGET_SECONDS', 0)
+    scheduler = None
+    prefilter_counts = {'visits_saved': 0}
+    dispatcher = notifications.dispatcher
+    dispatches = dispatcher.dispatches
+    pipeline = Pipeline("Run pipeline")
+    if budget:
+        # Visit the newest and cheapest candidates first and leave the rest for the next run
+        scheduler = RunScheduler(budget, getattr(cfg, 'RUN_QUEUE_FILE', 'run_queue.json'),
+                                 getattr(cfg, 'RUN_QUEUE_MAX_AGE_HOURS', 24))
+        pipeline.source('discover', scheduler.with_carried(discover_offers(backend, searches, scan_marks), by_name))
+        pipeline.then('pre-filter', lambda items: prefilter_offers(items, history, by_name, buffer_size,
+                                                                    prefilter_counts))
+        pipeline.then('schedule', scheduler.prioritize)
+    else:
+        pipeline.source('discover', discover_offers(backend, searches, scan_marks))
+        pipeline.then('pre-filter', lambda items: prefilter_offers(items, history, by_name, buffer_size,
+                                                                    prefilter_counts))
+    pipeline.then('enrich', lambda items: enrich_offers(items, backend, history, by_name, scan_marks, buffer_size,
+                                                         scheduler))
+    pipeline.then('dedupe', lambda offers: dedupe_offers(offers, history, by_name))
+    pipeline.then('notify', lambda offers: notify_offers(offers, notifications,
+                                                         getattr(cfg, 'NOTIFY_BATCH_SIZE', 0)))
+    new_count = 0
     try:
-        # First load existing history
-        seen_urls = set()
-        if os.path.exists(history_file) and os.path.getsize(history_file) > 0:
-            try:
-                with open(history_file, 'r', encoding='utf-8') as f:
-                    saved_data = json.load(f)
-                
-                # Extract URLs from saved data
-                if isinstance(saved_data, dict) and 'urls' in saved_data:
-                    seen_urls = set(saved_data['urls'])
-            except:
-                # If error loading, just use empty set
-                seen_urls = set()
-        
-        # Combine with newly checked URLs
-        all_urls = seen_urls.union(checked_urls)
-        
-        # Save combined history
-        with open(history_file, 'w', encoding='utf-8') as f:
-            json.dump({'urls': list(all_urls)}, f, indent=2)
-        logger.info(f"Saved {len(all_urls)} URLs to history ({len(checked_urls)} new)")
+        new_count = pipeline.run()
+        # Later scans of incremental searches stop at the listings checked now
+        scan_marks.commit()
+        scan_marks.save()
     except Exception as e:
-        logger.error(f"Error updating history with all checked URLs: {e}")
-        # Try with a new file if saving fails
+        logger.error(f"Error in run pipeline: {e}")
+        if DEBUG:
+            import traceback
+            traceback.print_exc()
+        scan_marks.discard()
+    finally:
+        # Run the cleanup of every stage, so unvisited candidates reach the queue
+        pipeline.close()
+        # Keep the history of this run even if the daemon is killed before closing it
         try:
-            with open('offers_history_new.json', 'w', encoding='utf-8') as f:
-                json.dump({'urls': list(all_urls)}, f, indent=2)
-            logger.info("Saved to alternate file offers_history_new.json")
-        except Exception:
-            logger.error("Failed to save history to alternate file")
+            history.flush()
+        except Exception as e:
+            logger.error(f"Error writing history: {e}")
+    pipeline.log_summary()
+    logger.info(f"Skipped {prefilter_counts['visits_saved']} detail visits for already notified items")
+    if scheduler:
+        scheduler.log_summary()
+        scheduler.save()
+    
+    if not new_count:
+        logger.info("No new offers to send")
+    if notifications.digest.window:
+        flush_digest(notifications)
+    # Channels that failed earlier get their offers again even when this cycle sent nothing
+    if dispatcher.dispatches == dispatches:
+        try:
+            dispatcher.retry_failed()
+        except Exception as e:
+            logger.error(f"Error retrying undelivered offers: {e}")
+    return new_count
+
+def log_run_summaries(notifications):
+    """Log navigation, wait, selector, filter and notification statistics and keep what was learned"""
+    log_navigation_summary()
+    page_waiter.log_summary()
+    page_waiter.save()
+    selector_registry.log_summary()
+    selector_registry.save()
+    filters.stats.log_summary()
+    notifications.log_summary()
+
+def close_driver(driver):
+    """Quit a driver, logging instead of raising on errors"""
+    logger.info("Closing driver...")
+    try:
+        driver.quit()
+    except:
+        logger.error("Error closing driver")
 
 def main(headless=True, debug_delay=0):
     """Main function to run the bot
     
+    All configured searches are processed by the same backend (and browser)
+    and their new offers are sent in a single notification.
+    
     Args:
         headless: Boolean indicating whether to run in headless mode
         debug_delay: Seconds to keep browser open for debugging (when not headless)
     """
     start_time = time()
-    driver = None
+    backend = None
+    history = None
     logger.info("Starting Wallabot...")
-    log_debug(f"Using search URL: {cfg.OFFERS_URL}")
+    searches = get_searches()
+    logger.info(f"Running {len(searches)} search(es): {', '.join(search['name'] for search in searches)}")
+    notifications = init_notifications()
+    scan_marks = open_scan_marks()
+    # Emails left by earlier runs are sent while this one scrapes
+    notifications.start()
     
     try:
-        driver_start = time()
-        driver = setup_driver(headless)
-        logger.info(f"Driver setup completed in {time() - driver_start:.2f} seconds")
-        
-        scrape_start = time()
-        logger.info("Scraping offers...")
-        offers, all_checked_urls = scrape_offers(driver)
-        scrape_time = time() - scrape_start
-        
-        logger.info(f"Found {len(offers) if offers else 0} valid offers after filtering")
-        logger.info(f"Checked {len(all_checked_urls)} total URLs")
-        logger.info(f"Scraping completed in {scrape_time:.2f} seconds, avg {scrape_time/max(1, len(all_checked_urls)):.2f} seconds per URL")
-
-        if not offers:
-            logger.info("No valid offers found")
-            logger.info(f"Total execution time: {time() - start_time:.2f} seconds")
-            return
-            
-        history_start = time()
-        logger.info("Checking for new offers...")
-        new_offers = check_history(offers)
-        logger.info(f"Found {len(new_offers)} new offers")
-        logger.info(f"History check completed in {time() - history_start:.2f} seconds")
-
-        if new_offers:
-            email_start = time()
-            logger.info("Sending email notification...")
-            send_mail(new_offers)
-            logger.info(f"Email sent in {time() - email_start:.2f} seconds")
-        else:
-            logger.info("No new offers to send")
+        backend_start = time()
+        backend = create_backend(headless, searches[0]['url'])
+        logger.info(f"Backend setup completed in {time() - backend_start:.2f} seconds")
+        
+        history = open_history()
+        run_cycle(backend, history, searches, notifications, scan_marks)
             
         # Debug delay if requested
         if debug_delay > 0 and not headless:
@@ -901,17 +1274,92 @@ def main(headless=True, debug_delay=0):
             import traceback
             traceback.print_exc()
     finally:
-        if driver:
-            logger.info("Closing driver...")
-            try:
-                driver.quit()
-            except:
-                logger.error("Error closing driver")
+        if history:
+            history.close()
+        if backend:
+            backend.close()
+        
+        # Let late deliveries finish, then give the queued emails a chance to go out
+        notifications.close()
         
+        # Keep learned ready times for the next run
+        log_run_summaries(notifications)
+
         # Log total execution time
         total_time = time() - start_time
         logger.info(f"Total execution time: {total_time:.2f} seconds ({str(datetime.timedelta(seconds=int(total_time)))})")
         logger.info("Done")
+
+def run_daemon(headless=True, interval=None):
+    """Poll the searches forever, keeping the backend alive between cycles
+    
+    The browser (with its accepted cookies and warm HTTP cache) is reused by
+    every cycle. It is only recycled when it stops responding, when a cycle
+    fails, or after DAEMON_RECYCLE_AFTER_PAGES page loads.
+    
+    Args:
+        headless: Boolean indicating whether to run in headless mode
+        interval: Seconds between the start of two cycles (defaults to DAEMON_INTERVAL_SECONDS)
+    """
+    interval = interval or getattr(cfg, 'DAEMON_INTERVAL_SECONDS', 600)
+    max_pages = getattr(cfg, 'DAEMON_RECYCLE_AFTER_PAGES', 500)
+    searches = get_searches()
+    logger.info(f"Starting Wallabot daemon: {len(searches)} search(es) every {interval} seconds")
+    
+    backend = None
+    backend_pages = 0
+    notifications = init_notifications()
+    scan_marks = open_scan_marks()
+    history = open_history()
+    notifications.start()
+    cycle = 0
+    try:
+        while True:
+            cycle += 1
+            cycle_start = time()
+            pages_before = nav_stats['pages']
+            new_count = 0
+            try:
+                if backend is None:
+                    backend_start = time()
+                    backend = create_backend(headless, searches[0]['url'])
+                    backend_pages = 0
+                    logger.info(f"Backend setup completed in {time() - backend_start:.2f} seconds")
+                new_count = run_cycle(backend, history, searches, notifications, scan_marks)
+                backend_pages += len(searches) + nav_stats['pages'] - pages_before
+            except Exception as e:
+                logger.error(f"Error in daemon cycle {cycle}: {e}")
+                if DEBUG:
+                    import traceback
+                    traceback.print_exc()
+                if backend:
+                    backend.close()
+                    backend = None
+            
+            # Recycle the browser if it died or has loaded too many pages
+            if backend and not backend.is_healthy():
+                logger.warning("Browser stopped responding, recycling it")
+                backend.close()
+                backend = None
+            elif backend and max_pages and backend_pages >= max_pages:
+                logger.info(f"Browser loaded {backend_pages} pages, recycling it")
+                backend.close()
+                backend = None
+            
+            log_run_summaries(notifications)
+            elapsed = time() - cycle_start
+            logger.info(f"Cycle {cycle} finished in {elapsed:.2f} seconds: {new_count} new offers, "
+                        f"browser at {backend_pages} pages")
+            wait = max(0, interval - elapsed)
+            logger.info(f"Next cycle in {wait:.0f} seconds")
+            sleep(wait)
+    except KeyboardInterrupt:
+        logger.info("Daemon stopped")
+    finally:
+        history.close()
+        if backend:
+            backend.close()
+        notifications.close()
                      
 if __name__=="__main__":
     import sys
@@ -919,6 +1367,8 @@ if __name__=="__main__":
     # Process command-line arguments
     headless = True
     debug_delay = 0
+    daemon = False
+    interval = None
     
     if len(sys.argv) > 1:
         for arg in sys.argv[1:]:
@@ -932,9 +1382,19 @@ if __name__=="__main__":
                     debug_delay = int(arg.split('=')[1])
                 except:
                     logger.error(f"Invalid delay value in {arg}, using default")
+            elif arg == '--daemon':
+                daemon = True
+            elif arg.startswith('--interval='):
+                try:
+                    interval = int(arg.split('=')[1])
+                except:
+                    logger.error(f"Invalid interval value in {arg}, using default")
     
     try:
-        main(headless, debug_delay)
+        if daemon:
+            run_daemon(headless, interval)
+        else:
+            main(headless, debug_delay)
     except Exception as e:
         logger.error(f"Uncaught exception: {e}")
         if DEBUG: